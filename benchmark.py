@@ -0,0 +1,264 @@
+"""Stage-by-stage benchmark of the miniPinscher pipeline on synthetic data.
+
+Seeded generators scale the real DB_* tables (1x, 10x, 100x ...) and draw
+random formulas from the scaled materials. Each stage is timed on its own:
+CSV load, alias resolution, exposure aggregation, isomer grouping, limit
+check, workbook build, workbook save and verification. Every stage runs --repeats times (memo caches cleared
+in between) and is scored by its fastest run, with the median kept alongside,
+so one noisy run cannot fail the --baseline regression check.
+Results are written as JSON.
+"""
+import argparse
+import contextlib
+import csv
+import gc
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from build_sheet import build_workbook
+from compliance_engine import (
+    DB_FILES, RELEASE_DIR, ReferenceDB, compute_exposure, group_by_standard, ifra_details,
+    iter_formula_lines, to_number
+)
+from verify_sheet import verify_sheet
+
+RESULTS_PATH = "benchmark_results.json"
+DEFAULT_SCALES = [1, 10, 100]
+DEFAULT_FORMULAS = 1000
+DEFAULT_SEED = 51
+DEFAULT_REPEATS = 5
+# A slowdown must also exceed this many seconds to count (millisecond stages jitter by more than 25%)
+DEFAULT_MIN_DELTA = 0.01
+
+# Tabs that grow with a perfumer's catalogue; the IFRA / EU lists stay at real size
+SCALED_TABS = ("DB_Naturals", "DB_Inventory", "DB_User_Materials")
+
+
+def _read_csv(path):
+    with open(path, newline="", encoding="utf-8") as f:
+        rows = list(csv.reader(f))
+    return rows[0], rows[1:]
+
+
+def _jitter_percentage(value, rng):
+    num = to_number(value)
+    if num is None or num <= 0:
+        return value
+    return f"{num * rng.uniform(0.5, 1.5):.4f}"
+
+
+def _scaled_rows(tab_name, rows, copy, rng):
+    # Copy 0 is the real table; later copies get suffixed names and jittered percentages
+    if copy == 0:
+        return rows
+    tag = f" #{copy}"
+    out = []
+    for row in rows:
+        row = list(row)
+        if tab_name == "DB_Naturals" and len(row) >= 4:
+            row[0] = row[0] + tag if row[0] else row[0]
+            row[3] = _jitter_percentage(row[3], rng)
+        elif tab_name == "DB_Inventory" and len(row) >= 2:
+            row[0] = row[0] + tag if row[0] else row[0]
+            row[1] = row[1] + tag if row[1] else row[1]
+        elif tab_name == "DB_User_Materials" and len(row) >= 5:
+            row[0] = f"{row[0]}-{copy}" if row[0] else row[0]
+            row[1] = row[1] + tag if row[1] else row[1]
+            row[4] = _jitter_percentage(row[4], rng)
+        out.append(row)
+    return out
+
+
+def generate_db(out_dir, scale=1, seed=DEFAULT_SEED, release_dir=RELEASE_DIR):
+    # Writes scaled DB_* CSVs into out_dir and returns {tab_name: data row count}
+    rng = random.Random(seed)
+    counts = {}
+    for tab_name, csv_file in DB_FILES.items():
+        header, rows = _read_csv(os.path.join(release_dir, csv_file))
+        copies = scale if tab_name in SCALED_TABS else 1
+        with open(os.path.join(out_dir, csv_file), "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+            count = 0
+            for copy in range(copies):
+                for row in _scaled_rows(tab_name, rows, copy, rng):
+                    writer.writerow(row)
+                    count += 1
+        counts[tab_name] = count
+    return counts
+
+
+def generate_formulas(db, n=DEFAULT_FORMULAS, seed=DEFAULT_SEED, min_lines=5, max_lines=40):
+    # Random formulas over inventory names, bases, naturals and direct standards
+    rng = random.Random(seed)
+    names = sorted(set(db.inventory) | set(db.user_materials) | set(db.naturals) | set(db.std_by_name))
+    formulas = []
+    for _ in range(n):
+        lines = [[rng.choice(names), round(rng.uniform(0.01, 20.0), 4)] for _ in range(rng.randint(min_lines, max_lines))]
+        if rng.random() < 0.5:
+            lines.append(["DPG", round(rng.uniform(1.0, 50.0), 4)])
+        formulas.append(lines)
+    return formulas
+
+
+def _record(stages, name, times, count=None):
+    # The fastest run is the stage time (least disturbed by other load); the median shows the spread
+    seconds = min(times)
+    stages[name] = {"seconds": round(seconds, 6), "median_seconds": round(statistics.median(times), 6),
+                    "repeats": len(times)}
+    if count is not None:
+        stages[name]["items"] = count
+        stages[name]["per_second"] = round(count / seconds, 1) if seconds > 0 else None
+
+
+@contextlib.contextmanager
+def _quiet_gc():
+    # Like timeit: collect first, and keep the cyclic GC from firing inside a timed run
+    gc.collect()
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def _timed(stages, name, fn, count=None, repeats=1, setup=None):
+    # Runs fn `repeats` times (after the untimed `setup`, if any) and returns the last result
+    times = []
+    for _ in range(repeats):
+        if setup is not None:
+            setup()
+        with _quiet_gc():
+            start = time.perf_counter()
+            result = fn()
+            times.append(time.perf_counter() - start)
+    _record(stages, name, times, count)
+    return result
+
+
+def _clear_memo(db):
+    # Every repeat starts cold, like the first evaluation after a load
+    db._material_cache.clear()
+    db._material_id_cache.clear()
+    db._line_cache.clear()
+    db._line_id_cache.clear()
+
+
+def run_scale(scale, n_formulas=DEFAULT_FORMULAS, seed=DEFAULT_SEED, workbook=True, repeats=DEFAULT_REPEATS):
+    stages = {}
+    with tempfile.TemporaryDirectory(prefix=f"minipinscher-bench-{scale}x-") as tmp:
+        counts = _timed(stages, "generate_db", lambda: generate_db(tmp, scale, seed), repeats=repeats)
+        rows = sum(counts.values())
+        db = _timed(stages, "csv_load", lambda: ReferenceDB.from_csv_dir(tmp), rows, repeats)
+
+        formulas = generate_formulas(db, n_formulas, seed)
+        lines = [name for formula in formulas for name, _ in iter_formula_lines(formula)]
+        _timed(stages, "alias_resolution", lambda: [db.resolve_name(name) for name in lines], len(lines), repeats)
+
+        results = _timed(stages, "exposure_aggregation", lambda: [compute_exposure(f, db) for f in formulas],
+                         len(formulas), repeats, lambda: _clear_memo(db))
+        grouped = _timed(stages, "isomer_grouping",
+                         lambda: [group_by_standard(exposure, db) for exposure, _ in results], len(formulas), repeats)
+        _timed(stages, "limit_check",
+               lambda: [ifra_details(g, total, 20) for g, (_, total) in zip(grouped, results)], len(formulas),
+               repeats)
+
+        if workbook:
+            xlsx_path = os.path.join(tmp, "benchmark.xlsx")
+            # The build / verify steps print progress for humans; keep the benchmark output clean
+            with contextlib.redirect_stdout(io.StringIO()):
+                # A write-only workbook saves once: every repeat builds and saves its own
+                build_times, save_times = [], []
+                for _ in range(repeats):
+                    with _quiet_gc():
+                        start = time.perf_counter()
+                        wb = build_workbook(tmp)
+                        build_times.append(time.perf_counter() - start)
+                        start = time.perf_counter()
+                        wb.save(xlsx_path)
+                        save_times.append(time.perf_counter() - start)
+                _record(stages, "workbook_build", build_times, rows)
+                _record(stages, "workbook_save", save_times)
+                ok = _timed(stages, "verification", lambda: verify_sheet(xlsx_path, tmp, workers=1), repeats=repeats)
+            stages["workbook_save"]["bytes"] = os.path.getsize(xlsx_path)
+            if not ok:
+                raise RuntimeError(f"verification of the {scale}x benchmark workbook failed")
+
+    return {"scale": scale, "rows": counts, "formulas": n_formulas, "lines": len(lines), "stages": stages}
+
+
+def run_benchmarks(scales=DEFAULT_SCALES, n_formulas=DEFAULT_FORMULAS, seed=DEFAULT_SEED, workbook=True,
+                   repeats=DEFAULT_REPEATS):
+    runs = []
+    for scale in scales:
+        print(f"🚀 Benchmarking {scale}x database (best of {repeats})...", file=sys.stderr)
+        run = run_scale(scale, n_formulas, seed, workbook, repeats)
+        for name, stage in run["stages"].items():
+            print(f"  {name:<22} {stage['seconds']:>10.4f}s  (median {stage['median_seconds']:.4f}s)",
+                  file=sys.stderr)
+        runs.append(run)
+    return {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "seed": seed,
+        "repeats": repeats,
+        "runs": runs
+    }
+
+
+def compare_results(results, baseline, tolerance=1.25, min_delta=DEFAULT_MIN_DELTA):
+    # Stages slower than `tolerance` x the baseline: [(scale, stage, baseline_s, current_s)].
+    # Both sides are best-of-N times; compare runs made with enough --repeats
+    base_runs = {run["scale"]: run["stages"] for run in baseline.get("runs", [])}
+    regressions = []
+    for run in results["runs"]:
+        base = base_runs.get(run["scale"], {})
+        for name, stage in run["stages"].items():
+            if name not in base:
+                continue
+            before = base[name]["seconds"]
+            if stage["seconds"] > before * tolerance and stage["seconds"] - before > min_delta:
+                regressions.append((run["scale"], name, before, stage["seconds"]))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the miniPinscher pipeline on scaled synthetic data.")
+    parser.add_argument("--scales", default=",".join(map(str, DEFAULT_SCALES)), help="Comma-separated DB scales")
+    parser.add_argument("--formulas", type=int, default=DEFAULT_FORMULAS, help="Synthetic formulas per scale")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--no-workbook", action="store_true", help="Skip workbook build / save / verification")
+    parser.add_argument("--repeats", type=int, default=DEFAULT_REPEATS,
+                        help="Runs per stage; the fastest one is reported and compared")
+    parser.add_argument("--out", default=RESULTS_PATH, help="JSON results file")
+    parser.add_argument("--baseline", default=None, help="Earlier results file to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=1.25, help="Allowed slowdown vs the baseline")
+    parser.add_argument("--min-delta", type=float, default=DEFAULT_MIN_DELTA,
+                        help="Slowdowns smaller than this many seconds are ignored")
+    args = parser.parse_args()
+
+    results = run_benchmarks([int(s) for s in args.scales.split(",") if s.strip()],
+                             args.formulas, args.seed, not args.no_workbook, max(args.repeats, 1))
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"✅ Benchmark results written to {args.out}", file=sys.stderr)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare_results(results, json.load(f), args.tolerance, args.min_delta)
+        for scale, name, before, after in regressions:
+            print(f"❌ {scale}x {name}: {before:.4f}s -> {after:.4f}s", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print(f"✅ No stage slower than {args.tolerance}x the baseline.", file=sys.stderr)
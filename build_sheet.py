@@ -0,0 +1,249 @@
+import argparse
+import io
+import os
+import zipfile
+
+import openpyxl
+
+from compliance_engine import DB_FILES, RELEASE_DIR
+from db_snapshot import iter_db_table, open_snapshot
+from lookup_tab import LOOKUP_TAB, lookup_table
+from stage_trace import add_profile_arguments, annotate, current, profiled, span, timed_iter, traced
+
+RELEASE_DATE = "20260602"
+DEFAULT_VERSION = "0.6.1"
+
+IFRA_FORMULA = '=IFRA_COMPLIANCE_V5(Formula!A2:B, DB_Standards!A2:C, DB_Naturals!A2:D, DB_Inventory!A2:B, DB_User_Materials!A2:E, Formula!E1)'
+EU_FORMULA = '=EU_LABELING_V5(Formula!A2:B, DB_EU_Allergens!A2:B, DB_Naturals!A2:D, DB_Inventory!A2:B, DB_User_Materials!A2:E, "Leave-on", Formula!E1)'
+
+# Opt-in (--lookup): keyed lookups into the precomputed DB_Lookup tab. Same reports as the *_V5
+# functions, but DB_Lookup is a build-time copy: edits to the DB_* tabs in Sheets are not seen
+# until the workbook is rebuilt
+IFRA_LOOKUP_FORMULA = f'=IFRA_COMPLIANCE_LOOKUP(Formula!A2:B, {LOOKUP_TAB}!H2, Formula!E1)'
+EU_LOOKUP_FORMULA = f'=EU_LABELING_LOOKUP(Formula!A2:B, DB_EU_Allergens!A2:B, {LOOKUP_TAB}!H2, "Leave-on", Formula!E1)'
+
+# Pre-populated working test formula for the 'Formula' tab
+TEST_FORMULA = [
+    ["Bergamot oil expressed", 2.5],
+    ["Lemon oil cold pressed", 1.0],
+    ["Alpha Damascone", 0.01],
+    ["Beta Damascone", 0.02],
+    ["Hedione", 10.0],
+    ["DPG", 86.47]
+]
+DEFAULT_DOSAGE = 20
+
+# Tab order in the workbook; tab N is stored as xl/worksheets/sheet{N}.xml
+SHEET_ORDER = ["Formula", "IFRA_Compliance", "EU_Allergen_Labeling", *DB_FILES]
+LOOKUP_SHEET_ORDER = [*SHEET_ORDER, LOOKUP_TAB]
+
+
+def sheet_order(lookup=False):
+    return LOOKUP_SHEET_ORDER if lookup else SHEET_ORDER
+
+
+def calculation_formulas(lookup=False):
+    # A1 formulas of the IFRA_Compliance and EU_Allergen_Labeling tabs
+    return (IFRA_LOOKUP_FORMULA, EU_LOOKUP_FORMULA) if lookup else (IFRA_FORMULA, EU_FORMULA)
+
+
+def workbook_filename(version=DEFAULT_VERSION, release_date=RELEASE_DATE):
+    return f"{release_date} Kijjaz - miniPinscher {version}.xlsx"
+
+
+def output_paths(version=DEFAULT_VERSION, release_date=RELEASE_DATE):
+    # Root copy + release folder copy
+    filename = workbook_filename(version, release_date)
+    return [filename, os.path.join(RELEASE_DIR, filename)]
+
+
+def tab_table(tab_name, release_dir=RELEASE_DIR, source=None):
+    # (header, row iterator) of one DB tab, or of DB_Lookup (derived from all of them)
+    if tab_name == LOOKUP_TAB:
+        return lookup_table(release_dir, source)
+    return iter_db_table(tab_name, release_dir, source)
+
+
+def _append_db_tab(wb, tab_name, release_dir, source):
+    with span(f"tab:{tab_name}") as stage:
+        header, rows = tab_table(tab_name, release_dir, source)
+        ws_db = wb.create_sheet(tab_name)
+        ws_db.append(header)
+        count = 0
+        # read_seconds: time spent producing source rows; the rest of the span is ws_db.append
+        for row in timed_iter(rows, stage):
+            ws_db.append(row)
+            count += 1
+        stage.set(rows=count)
+    return count
+
+
+def _annotate_sheet_bytes(data, lookup=False):
+    # Per-tab bytes are only known once save() has zipped the sheet parts
+    if current() is None:
+        return
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        for n, tab_name in enumerate(sheet_order(lookup), start=1):
+            info = zf.getinfo(f"xl/worksheets/sheet{n}.xml")
+            annotate(f"tab:{tab_name}", bytes=info.file_size, compressed_bytes=info.compress_size)
+
+
+@traced("build_workbook")
+def build_workbook(release_dir=RELEASE_DIR, source=None, lookup=False):
+    # Streams every tab into a write-only workbook (rows go to temp files until save)
+    wb = openpyxl.Workbook(write_only=True)
+    ifra_formula, eu_formula = calculation_formulas(lookup)
+
+    # 1. 'Formula' Sheet (Workplace) with Finished Dosage (%) in D1/E1
+    ws_formula = wb.create_sheet("Formula")
+    ws_formula.append(["Ingredient", "Amount", None, "Finished Dosage (%)", DEFAULT_DOSAGE])
+    for row in TEST_FORMULA:
+        ws_formula.append(row)
+    print("  Created 'Formula' workspace tab with Finished Dosage (%) pre-set in cell E1.")
+
+    # 2. Custom calculation tabs
+    wb.create_sheet("IFRA_Compliance").append([ifra_formula])
+    print("  Created 'IFRA_Compliance' custom calculation tab.")
+    wb.create_sheet("EU_Allergen_Labeling").append([eu_formula])
+    print("  Created 'EU_Allergen_Labeling' custom calculation tab.")
+
+    # 3. Database tabs, rows fed straight from the snapshot / store / CSV reader
+    for tab_name, csv_file in DB_FILES.items():
+        print(f"  Populating tab '{tab_name}' from {csv_file}...")
+        count = _append_db_tab(wb, tab_name, release_dir, source)
+        print(f"    Tab '{tab_name}' complete ({count} rows loaded).")
+
+    # 4. Precomputed lookup (opt-in): every material resolved, flattened and grouped once at build time
+    if lookup:
+        count = _append_db_tab(wb, LOOKUP_TAB, release_dir, source)
+        print(f"  Created '{LOOKUP_TAB}' precomputed lookup tab ({count} rows).")
+    return wb
+
+
+def build_workbook_bytes(release_dir=RELEASE_DIR, source=None, lookup=False):
+    # Serializes the streamed workbook exactly once
+    wb = build_workbook(release_dir, source, lookup)
+    buffer = io.BytesIO()
+    with span("save") as stage:
+        wb.save(buffer)
+        stage.set(bytes=buffer.tell())
+    data = buffer.getvalue()
+    _annotate_sheet_bytes(data, lookup)
+    return data
+
+
+@traced("build_sheet")
+def build_sheet(version=DEFAULT_VERSION, destinations=None, release_dir=RELEASE_DIR, store_path=None, lookup=False):
+    print(f"🚀 Generating miniPinscher Spreadsheet Version {version}...")
+
+    for csv_file in DB_FILES.values():
+        csv_p = os.path.join(release_dir, csv_file)
+        if not os.path.exists(csv_p):
+            print(f"❌ Error: Required database file {csv_p} is missing!")
+            return False
+
+    if store_path:
+        # Rows queried from the SQLite materials store (refreshed from the CSVs first)
+        from materials_store import open_store
+        with span("open_source", kind="store"):
+            source = open_store(store_path, release_dir)
+        data = build_workbook_bytes(release_dir, source, lookup)
+    else:
+        with span("open_source", kind="snapshot"):
+            source = open_snapshot(release_dir=release_dir)
+        try:
+            data = build_workbook_bytes(release_dir, source, lookup)
+        finally:
+            if source is not None:
+                source.close()
+
+    # Serialized once; the same bytes are fanned out to every destination
+    destinations = destinations or output_paths(version)
+    _write_destinations(data, destinations)
+
+    listing = "\n".join(f"  - {p}" for p in destinations)
+    print(f"\n✅ Excel Workbook v{version} saved successfully ({len(data):,} bytes) to:\n{listing}")
+    return True
+
+
+def _write_destinations(data, destinations):
+    with span("write", bytes=len(data), files=len(destinations)):
+        for path in destinations:
+            with open(path, "wb") as f:
+                f.write(data)
+
+
+def render_tab_xml(tab_name, release_dir=RELEASE_DIR, source=None):
+    # Worksheet XML for one DB tab (cells are inline strings, so it is self-contained)
+    wb = openpyxl.Workbook(write_only=True)
+    count = _append_db_tab(wb, tab_name, release_dir, source)
+    buffer = io.BytesIO()
+    with span("save"):
+        wb.save(buffer)
+    with zipfile.ZipFile(buffer) as zf:
+        xml = zf.read("xl/worksheets/sheet1.xml")
+    annotate(f"tab:{tab_name}", bytes=len(xml))
+    return xml, count
+
+
+def workbook_has_lookup(path):
+    # DB_Lookup is the one optional (last) tab; None when there is no workbook yet
+    if not os.path.exists(path):
+        return None
+    with zipfile.ZipFile(path) as zin:
+        return f"xl/worksheets/sheet{len(LOOKUP_SHEET_ORDER)}.xml" in zin.namelist()
+
+
+@traced("rebuild_tabs")
+def rebuild_tabs(tab_names, version=DEFAULT_VERSION, destinations=None, release_dir=RELEASE_DIR, lookup=None):
+    # Re-renders only `tab_names` and swaps their parts inside the existing workbook.
+    # `lookup` None keeps the existing layout; True / False adds or drops DB_Lookup (a full build)
+    destinations = destinations or output_paths(version)
+    if not os.path.exists(destinations[0]):
+        return build_sheet(version, destinations, release_dir, lookup=bool(lookup))
+    with zipfile.ZipFile(destinations[0]) as zin:
+        names = set(zin.namelist())
+    if f"xl/worksheets/sheet{len(SHEET_ORDER)}.xml" not in names:
+        # Workbook from before a tab was added: the layout changed, build it fresh
+        return build_sheet(version, destinations, release_dir, lookup=bool(lookup))
+    has_lookup = f"xl/worksheets/sheet{len(LOOKUP_SHEET_ORDER)}.xml" in names
+    if lookup is not None and lookup != has_lookup:
+        print(f"  {'Adding' if lookup else 'Dropping'} the '{LOOKUP_TAB}' tab: building the workbook fresh.")
+        return build_sheet(version, destinations, release_dir, lookup=lookup)
+    lookup = has_lookup
+    order = sheet_order(lookup)
+
+    # DB_Lookup is derived from every DB tab (and only exists in --lookup workbooks)
+    tab_names = [tab for tab in tab_names if tab != LOOKUP_TAB]
+    if lookup and any(tab in DB_FILES for tab in tab_names):
+        tab_names = [*tab_names, LOOKUP_TAB]
+    parts = {}
+    for tab_name in tab_names:
+        xml, count = render_tab_xml(tab_name, release_dir)
+        parts[f"xl/worksheets/sheet{order.index(tab_name) + 1}.xml"] = xml
+        print(f"  Rebuilt tab '{tab_name}' ({count} rows).")
+
+    buffer = io.BytesIO()
+    with span("repack") as stage:
+        with zipfile.ZipFile(destinations[0]) as zin, zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zout:
+            for info in zin.infolist():
+                zout.writestr(info, parts.get(info.filename) or zin.read(info.filename))
+        data = buffer.getvalue()
+        stage.set(bytes=len(data))
+
+    _write_destinations(data, destinations)
+    print(f"✅ Workbook v{version} updated ({', '.join(tab_names)}).")
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the miniPinscher Google Sheets workbook.")
+    parser.add_argument("version", nargs="?", default=DEFAULT_VERSION, help="Release version, e.g. 0.6.1")
+    parser.add_argument("--store", default=None, help="Read DB tabs from this SQLite materials store")
+    parser.add_argument("--lookup", action="store_true",
+                        help="Add the precomputed DB_Lookup tab and calculate with the *_LOOKUP functions "
+                             "(faster, but edits to the DB_* tabs in Sheets need a rebuild)")
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+    with profiled(args):
+        build_sheet(args.version, store_path=args.store, lookup=args.lookup)
@@ -0,0 +1,856 @@
+"""Batch IFRA compliance engine (Python port of IFRA_COMPLIANCE_V5 in Code.js).
+
+The reference databases are parsed once into hash indexes so that a whole
+library of formulas can be evaluated without re-reading any CSV or scanning
+the standards list for every material / CAS.
+
+Every CAS number and material name is interned into an integer id. Base and
+natural compositions are CompositionTables: contiguous typed arrays (CSR
+offsets + cas id / percentage per constituent) instead of one dict per
+constituent, and standards are __slots__ records. compute_exposure() sums
+per CAS id and per source id; only the regulated groups are turned back
+into strings, in exactly the shape and order Code.js builds.
+"""
+import csv
+import math
+import os
+import threading
+from array import array
+from collections.abc import Mapping, MutableMapping
+from functools import cmp_to_key
+
+RELEASE_DIR = "google_sheets_release"
+
+DB_FILES = {
+    "DB_Standards": "DB_Standards.csv",
+    "DB_Naturals": "DB_Naturals.csv",
+    "DB_Inventory": "DB_Inventory.csv",
+    "DB_User_Materials": "DB_User_Materials.csv",
+    "DB_EU_Allergens": "DB_EU_Allergens.csv"
+}
+
+# Phototoxic oils whose (Usage / Limit) ratios are summed (Additivity Rule).
+# Must be normalized (lowercase) for matching, exactly as in Code.js.
+PHOTOTOXIC_OILS = frozenset([
+    "angelica root oil",
+    "bergamot oil expressed",
+    "bitter orange peel oil expressed",
+    "cumin oil",
+    "grapefruit oil expressed",
+    "lemon oil cold pressed",
+    "lime oil expressed",
+    "rue oil"
+])
+
+# IFRA product categories (51st Amendment); Code.js only reads Category 4
+IFRA_CATEGORIES = ["1", "2", "3", "4", "5A", "5B", "5C", "5D", "6", "7A", "7B", "8", "9", "10A", "10B", "11A", "11B", "12"]
+# DB_Standards limit columns from column C on: Limit_Cat4 first, then the other categories
+STANDARDS_LIMIT_CATEGORIES = ["4"] + [c for c in IFRA_CATEGORIES if c != "4"]
+
+PHOTOTOXICITY_ROW_NAME = "⚠️ Phototoxicity (Sum of Ratios)"
+IFRA_HEADERS = ["Regulated Ingredient", "CAS", "Your Level (%)", "IFRA Limit (%)", "Status", "Contribution Sources"]
+
+SOURCE_BASE = "Indirect (Base)"
+SOURCE_NATURAL = "Indirect (Natural)"
+SOURCE_DIRECT = "Direct"
+
+NO_ID = -1
+
+
+# --- Value Helpers (mirror the JavaScript coercions used by Code.js) ---
+
+def normalize(value):
+    if value is None or value == "" or value == 0:
+        return ""
+    return str(value).strip().lower()
+
+
+def to_number(value):
+    # JavaScript Number(): "" -> 0, unparsable -> NaN (returned here as None)
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return 1.0 if value else 0.0
+    if isinstance(value, (int, float)):
+        return None if math.isnan(value) else float(value)
+    text = str(value).strip()
+    if text == "":
+        return 0.0
+    if "_" in text or text.lower() in ("nan", "inf", "-inf", "+inf", "infinity", "-infinity", "+infinity"):
+        if text in ("Infinity", "+Infinity"):
+            return math.inf
+        if text == "-Infinity":
+            return -math.inf
+        return None
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+def js_number_str(value):
+    # String(number) in JavaScript prints integral values without ".0"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def parse_dosage(finished_dosage):
+    if finished_dosage is None or finished_dosage == "":
+        return 100.0
+    val = finished_dosage
+    if isinstance(val, (list, tuple)):
+        if len(val) > 0 and isinstance(val[0], (list, tuple)):
+            val = val[0][0] if len(val[0]) > 0 else None
+        elif len(val) > 0:
+            val = val[0]
+    if val is None or val == "":
+        return 100.0
+    if isinstance(val, str):
+        val = val.replace("%", "", 1).strip()
+    num = to_number(val)
+    return 100.0 if (num is None or num <= 0) else num
+
+
+# --- Interned IDs and Compact Records ---
+
+class Interner:
+    # Value <-> dense integer id. Ids are never reused, so they stay valid while the table grows
+    __slots__ = ("ids", "values", "_lock")
+
+    def __init__(self, values=()):
+        # `values` must be distinct (e.g. the string table of a snapshot)
+        self.values = list(values)
+        self.ids = dict(zip(self.values, range(len(self.values))))
+        self._lock = threading.Lock()
+
+    def intern(self, value):
+        i = self.ids.get(value)
+        if i is None:
+            # Threads sharing one ReferenceDB (workbench) may intern the same new value at once
+            with self._lock:
+                i = self.ids.get(value)
+                if i is None:
+                    i = len(self.values)
+                    self.values.append(value)
+                    self.ids[value] = i
+        return i
+
+    def get(self, value, default=NO_ID):
+        return self.ids.get(value, default)
+
+    def __getitem__(self, i):
+        return self.values[i]
+
+    def __len__(self):
+        return len(self.values)
+
+
+class StandardRecord:
+    # One DB_Standards row. `limits` holds every product category the row has a limit for
+    __slots__ = ("name", "norm_name", "cas", "limit", "limits")
+
+    def __init__(self, name, cas, limit, limits):
+        self.name = name
+        self.norm_name = name.strip().lower()
+        self.cas = cas
+        self.limit = limit
+        self.limits = limits
+
+    def category_limit(self, category=None):
+        # Limit_Cat4 for None, else the limit of one IFRA product category
+        if category is None:
+            return self.limit
+        if category not in self.limits:
+            raise ValueError(f"DB_Standards has no Category {category} limit for '{self.name}'")
+        return self.limits[category]
+
+    def __eq__(self, other):
+        if not isinstance(other, StandardRecord):
+            return NotImplemented
+        return (self.name, self.cas, self.limit, self.limits) == (other.name, other.cas, other.limit, other.limits)
+
+    def __repr__(self):
+        return f"StandardRecord({self.name!r}, {self.cas!r}, {self.limit!r})"
+
+
+def _grow(ids, size):
+    # Pads an id-indexed array with NO_ID up to `size` entries
+    if len(ids) < size:
+        ids.extend([NO_ID] * (size - len(ids)))
+
+
+class CompositionTable(MutableMapping):
+    # {normalized material name: [{"chemical", "cas", "percentage"}, ...]} stored in CSR layout:
+    #   row r -> constituents offsets[r]:offsets[r + 1] of comp_cas / comp_pct / comp_constituent
+    # Names, CAS numbers and constituent names are ids of the owning ReferenceDB's interners
+    # (comp_cas is NO_ID for a constituent without CAS; CAS numbers are stored stripped). Rows are
+    # append-only: assigning or deleting a material retires its old row, and a reassigned material
+    # iterates last.
+    ARRAYS = {"offsets": "q", "comp_cas": "i", "comp_pct": "d", "comp_constituent": "i", "row_name": "i",
+              "row_of_name": "i"}
+
+    def __init__(self, names, cas, constituents):
+        self.names = names
+        self.cas = cas
+        self.constituents = constituents
+        self.offsets = array("q", [0])
+        self.comp_cas = array("i")
+        self.comp_pct = array("d")
+        self.comp_constituent = array("i")
+        # row -> name id (NO_ID once retired) and name id -> row (NO_ID when not in this table)
+        self.row_name = array("i")
+        self.row_of_name = array("i")
+        self._size = 0
+
+    def load(self, parts):
+        # Bulk load of (normalized name, constituent, cas, percentage) rows in table order. The rows
+        # of one material may be scattered through the table: a stable sort then groups them by the
+        # material's first appearance, like parse_naturals / parse_user_materials append them
+        name_ids, cas_ids, pcts, constituent_ids = [], [], [], []
+        known_names, known_cas, known_constituents = self.names.ids, self.cas.ids, self.constituents.ids
+        first = {}
+        grouped = True
+        previous = NO_ID
+        for key, chemical, cas, pct in parts:
+            name_id = known_names.get(key)
+            if name_id is None:
+                name_id = self.names.intern(key)
+            if name_id != previous:
+                if name_id in first:
+                    grouped = False
+                else:
+                    first[name_id] = len(first)
+                previous = name_id
+            cas = cas.strip()
+            cas_id = known_cas.get(cas) if cas else NO_ID
+            if cas_id is None:
+                cas_id = self.cas.intern(cas)
+            constituent_id = known_constituents.get(chemical)
+            if constituent_id is None:
+                constituent_id = self.constituents.intern(chemical)
+            name_ids.append(name_id)
+            cas_ids.append(cas_id)
+            pcts.append(pct)
+            constituent_ids.append(constituent_id)
+        if not grouped:
+            order = sorted(range(len(name_ids)), key=[first[name_id] for name_id in name_ids].__getitem__)
+            name_ids, cas_ids, pcts, constituent_ids = ([column[i] for i in order]
+                                                        for column in (name_ids, cas_ids, pcts, constituent_ids))
+
+        start = len(self.comp_cas)
+        self.comp_cas.extend(cas_ids)
+        self.comp_pct.extend(pcts)
+        self.comp_constituent.extend(constituent_ids)
+        previous = NO_ID
+        for i, name_id in enumerate(name_ids):
+            if name_id != previous:
+                self.offsets[-1] = start + i
+                self._open_row(name_id)
+                previous = name_id
+        self.offsets[-1] = len(self.comp_cas)
+        return self
+
+    @classmethod
+    def from_arrays(cls, names, cas, constituents, arrays):
+        # Table over already interned ids; `arrays` maps every ARRAYS name to a buffer of that typecode
+        table = cls(names, cas, constituents)
+        for attr, typecode in cls.ARRAYS.items():
+            packed = array(typecode)
+            packed.frombytes(memoryview(arrays[attr]).cast("B"))
+            setattr(table, attr, packed)
+        table._size = len(table.row_name) - table.row_name.count(NO_ID)
+        return table
+
+    def copy(self):
+        # Same ids and interners, own arrays (rows can then change independently)
+        return CompositionTable.from_arrays(self.names, self.cas, self.constituents,
+                                            {attr: getattr(self, attr) for attr in self.ARRAYS})
+
+    def _open_row(self, name_id):
+        old = self.row_of_name[name_id] if name_id < len(self.row_of_name) else NO_ID
+        if old == NO_ID:
+            self._size += 1
+        else:
+            self.row_name[old] = NO_ID
+        _grow(self.row_of_name, name_id + 1)
+        self.row_of_name[name_id] = len(self.row_name)
+        self.row_name.append(name_id)
+        self.offsets.append(self.offsets[-1])
+
+    def _append(self, cas_id, pct, constituent_id):
+        self.comp_cas.append(cas_id)
+        self.comp_pct.append(pct)
+        self.comp_constituent.append(constituent_id)
+        self.offsets[-1] = len(self.comp_cas)
+
+    def row(self, key):
+        # Composition row of a normalized material name, or NO_ID
+        name_id = self.names.get(key)
+        if name_id == NO_ID or name_id >= len(self.row_of_name):
+            return NO_ID
+        return self.row_of_name[name_id]
+
+    def row_parts(self, row):
+        # (cas id, percentage) of every constituent of one row
+        start, end = self.offsets[row], self.offsets[row + 1]
+        return zip(self.comp_cas[start:end], self.comp_pct[start:end])
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, attr).itemsize * len(getattr(self, attr)) for attr in self.ARRAYS)
+
+    # --- Mapping view (rows materialized on access) ---
+
+    def __getitem__(self, key):
+        row = self.row(key)
+        if row == NO_ID:
+            raise KeyError(key)
+        cas, constituents = self.cas.values, self.constituents.values
+        return [{"chemical": constituents[self.comp_constituent[i]],
+                 "cas": cas[self.comp_cas[i]] if self.comp_cas[i] != NO_ID else "",
+                 "percentage": self.comp_pct[i]}
+                for i in range(self.offsets[row], self.offsets[row + 1])]
+
+    def __setitem__(self, key, parts):
+        self._open_row(self.names.intern(key))
+        for c in parts:
+            cas = str(c["cas"]).strip() if c["cas"] else ""
+            self._append(self.cas.intern(cas) if cas else NO_ID, c["percentage"],
+                         self.constituents.intern(c.get("chemical") or ""))
+
+    def __delitem__(self, key):
+        row = self.row(key)
+        if row == NO_ID:
+            raise KeyError(key)
+        self.row_of_name[self.row_name[row]] = NO_ID
+        self.row_name[row] = NO_ID
+        self._size -= 1
+
+    def __contains__(self, key):
+        return self.row(key) != NO_ID
+
+    def __iter__(self):
+        names = self.names.values
+        for name_id in self.row_name:
+            if name_id != NO_ID:
+                yield names[name_id]
+
+    def __len__(self):
+        return self._size
+
+
+# --- Database Parsers (same row rules as parseStandards / parseNaturals / ...) ---
+
+def iter_standards(rows):
+    # (name, cas list, Category 4 limit, {category: limit}) per valid row
+    for row in rows:
+        if not row or not row[0]:
+            continue
+        limit = to_number(row[2] if len(row) > 2 else None)
+        if limit is None:
+            continue
+        limits = {}
+        for i, category in enumerate(STANDARDS_LIMIT_CATEGORIES):
+            value = to_number(row[2 + i]) if len(row) > 2 + i else None
+            if value is not None:
+                limits[category] = value
+        yield str(row[0]), str(row[1]).split("|") if len(row) > 1 and row[1] else [], limit, limits
+
+
+def parse_standards(rows):
+    return [StandardRecord(name, cas_list, limit, limits) for name, cas_list, limit, limits in iter_standards(rows)]
+
+
+def iter_naturals(rows):
+    # (normalized natural name, constituent, cas, percentage) per valid row
+    for row in rows:
+        if not row or not row[0]:
+            continue
+        pct = to_number(row[3] if len(row) > 3 else None)
+        if pct is None:
+            continue
+        yield (str(row[0]).strip().lower(), str(row[1]) if len(row) > 1 and row[1] else "",
+               str(row[2]) if len(row) > 2 and row[2] else "", pct)
+
+
+def parse_naturals(rows):
+    naturals = {}
+    for key, chemical, cas, pct in iter_naturals(rows):
+        naturals.setdefault(key, []).append({"chemical": chemical, "cas": cas, "percentage": pct})
+    return naturals
+
+
+def _is_nan(value):
+    return to_number(value) is None
+
+
+def split_user_material_row(row):
+    # (sku, material name, constituent, cas, percentage) of one DB_User_Materials row, or None when
+    # parseUserMaterials in Code.js would skip it. The layout is detected per row
+    if not row or len(row) < 2:
+        return None
+    sku = ""
+    if len(row) >= 5 and _is_nan(row[0]) and not _is_nan(row[4]):
+        # 5-Column Format: SKU, Material Name, Constituent, CAS, Percentage
+        sku, mat_name, chemical, cas, pct_val = row[0], row[1], row[2], row[3], row[4]
+    elif len(row) >= 4 and not _is_nan(row[3]):
+        # 4-Column Format: Material Name, Constituent, CAS, Percentage
+        mat_name, chemical, cas, pct_val = row[0], row[1], row[2], row[3]
+    else:
+        # Fallback: search for percentage column (last numeric column)
+        pct_idx = -1
+        for i in range(len(row) - 1, -1, -1):
+            if row[i] != "" and not _is_nan(row[i]):
+                pct_idx = i
+                break
+        if pct_idx >= 3:
+            sku, mat_name, chemical = row[0], row[1], row[2]
+        elif pct_idx >= 2:
+            mat_name, chemical = row[0], row[1]
+        else:
+            return None  # Cannot parse
+        cas, pct_val = row[pct_idx - 1], row[pct_idx]
+
+    if not mat_name:
+        return None
+    if pct_val is None or pct_val == "":
+        return None
+    pct = to_number(pct_val)
+    if pct is None:
+        return None
+    return (str(sku) if sku else "", str(mat_name), str(chemical) if chemical else "",
+            str(cas).strip() if cas else "", pct)
+
+
+def iter_user_materials(rows):
+    # (normalized material name, constituent, cas, percentage) per valid row
+    for row in rows:
+        parsed = split_user_material_row(row)
+        if parsed is not None:
+            _, mat_name, chemical, cas, pct = parsed
+            yield mat_name.strip().lower(), chemical, cas, pct
+
+
+def parse_user_materials(rows):
+    user_materials = {}
+    for key, chemical, cas, pct in iter_user_materials(rows):
+        user_materials.setdefault(key, []).append({"chemical": chemical, "cas": cas, "percentage": pct})
+    return user_materials
+
+
+def parse_inventory(rows):
+    inventory = {}
+    for row in rows:
+        if len(row) >= 4:
+            stock_name, linked_name = row[2], row[3]
+        elif len(row) >= 2:
+            stock_name, linked_name = row[0], row[1]
+        else:
+            continue
+        if stock_name and linked_name:
+            inventory[str(stock_name).strip().lower()] = str(linked_name).strip()
+    return inventory
+
+
+def parse_allergens(rows):
+    allergens = []
+    for row in rows:
+        if not row or not row[0]:
+            continue
+        name = str(row[0]).strip()
+        allergens.append({
+            "name": name,
+            "normName": name.lower(),
+            "casList": [c.strip().lower() for c in str(row[1]).split("|")] if len(row) > 1 and row[1] else []
+        })
+    return allergens
+
+
+# --- Reference Database (parsed once, indexed for O(1) lookups) ---
+
+class ReferenceDB:
+    def __init__(self, standards, naturals, inventory, user_materials, allergens=None, interners=None):
+        # naturals / user_materials: CompositionTables on `interners`, {name: [rows]} dicts or
+        # (name, constituent, cas, percentage) iterables, which are packed into CompositionTables
+        self.names, self.cas, self.constituents = interners or (Interner(), Interner(), Interner())
+        # (formula line name, source type) pairs, the keys of the "Contribution Sources" sums
+        self.sources = Interner()
+        self.standards = standards
+        self.user_materials = self._composition_table(user_materials)
+        self.naturals = self._composition_table(naturals)
+        self.inventory = inventory
+        self.allergens = allergens or []
+        self.content_hash = None
+
+        self._index_standards()
+        self._material_cache = {}
+        self._material_id_cache = {}
+        self._line_cache = {}
+        self._line_id_cache = {}
+
+    def _composition_table(self, table):
+        if isinstance(table, CompositionTable) and table.cas is self.cas:
+            return table
+        packed = CompositionTable(self.names, self.cas, self.constituents)
+        if isinstance(table, Mapping):
+            packed.update(table)
+        else:
+            packed.load(table)
+        return packed
+
+    def _index_standards(self):
+        # Indexes keep the *first* match, mirroring Array.prototype.find
+        self.std_by_name = {}
+        self.std_by_cas = {}
+        # cas id -> position in self.standards (NO_ID: not regulated)
+        self.std_of_cas = array("i")
+        for i, std in enumerate(self.standards):
+            self.std_by_name.setdefault(std.norm_name, std)
+            for cas in std.cas:
+                if cas not in self.std_by_cas:
+                    self.std_by_cas[cas] = std
+                    cas_id = self.cas.intern(cas)
+                    _grow(self.std_of_cas, cas_id + 1)
+                    self.std_of_cas[cas_id] = i
+
+    def standard_of(self, cas_id):
+        # StandardRecord regulating one CAS id (first match), or None
+        if cas_id < len(self.std_of_cas) and self.std_of_cas[cas_id] != NO_ID:
+            return self.standards[self.std_of_cas[cas_id]]
+        return None
+
+    def limit_categories(self):
+        # Product categories every standard has a limit for (just "4" with a legacy DB_Standards)
+        return [c for c in IFRA_CATEGORIES if all(c in std.limits for std in self.standards)]
+
+    @classmethod
+    def from_tables(cls, tables):
+        # tables: {tab_name: data rows}; missing tabs are empty. Compositions are packed straight
+        # from the row iterators, without building a dict per constituent
+        return cls(
+            parse_standards(tables.get("DB_Standards", [])),
+            iter_naturals(tables.get("DB_Naturals", [])),
+            parse_inventory(tables.get("DB_Inventory", [])),
+            iter_user_materials(tables.get("DB_User_Materials", [])),
+            parse_allergens(tables.get("DB_EU_Allergens", []))
+        )
+
+    @classmethod
+    def from_csv_dir(cls, release_dir=RELEASE_DIR):
+        # Typed cells (NA markers -> "") exactly as the snapshot and the workbook tabs hold them
+        from db_snapshot import read_csv_table
+
+        tables = {}
+        for tab_name, csv_file in DB_FILES.items():
+            csv_p = os.path.join(release_dir, csv_file)
+            if os.path.exists(csv_p):
+                tables[tab_name] = read_csv_table(csv_p)[1]
+        return cls.from_tables(tables)
+
+    def resolve_name(self, mat_name):
+        # Inventory alias (Stock Name -> Linked Name), then normalize again
+        norm_name = normalize(mat_name)
+        return normalize(self.inventory.get(norm_name) or norm_name)
+
+    def material_parts(self, resolved_norm):
+        # Composition rows ({"cas", "percentage", ...}) and the source type of one resolved material
+        if resolved_norm in self.user_materials:
+            return self.user_materials[resolved_norm], SOURCE_BASE
+        if resolved_norm in self.naturals:
+            return self.naturals[resolved_norm], SOURCE_NATURAL
+        std = self.std_by_name.get(resolved_norm)
+        if std and std.cas:
+            return [{"cas": std.cas[0], "percentage": 100.0}], SOURCE_DIRECT
+        return [], SOURCE_DIRECT
+
+    def material_ids(self, resolved_norm):
+        # ((cas id, fraction), ...) and the source type of one resolved material, read off the CSR rows
+        cached = self._material_id_cache.get(resolved_norm)
+        if cached is not None:
+            return cached
+
+        name_id = self.names.ids.get(resolved_norm, len(self.names))
+        for table, source_type in ((self.user_materials, SOURCE_BASE), (self.naturals, SOURCE_NATURAL)):
+            row = table.row_of_name[name_id] if name_id < len(table.row_of_name) else NO_ID
+            if row != NO_ID:
+                # A constituent without CAS registers the material but contributes nothing
+                start, end = table.offsets[row], table.offsets[row + 1]
+                contributions = tuple((cas_id, pct / 100.0)
+                                      for cas_id, pct in zip(table.comp_cas[start:end], table.comp_pct[start:end])
+                                      if cas_id != NO_ID)
+                break
+        else:
+            std = self.std_by_name.get(resolved_norm)
+            direct = std.cas[0].strip() if std and std.cas else ""
+            contributions = ((self.cas.intern(direct), 1.0),) if direct else ()
+            source_type = SOURCE_DIRECT
+        cached = (contributions, source_type)
+        self._material_id_cache[resolved_norm] = cached
+        return cached
+
+    def material_contributions(self, resolved_norm):
+        # Returns ((cas, fraction), ...) and the source type for one resolved material
+        cached = self._material_cache.get(resolved_norm)
+        if cached is None:
+            contributions, source_type = self.material_ids(resolved_norm)
+            cas = self.cas.values
+            cached = (tuple((cas[cas_id], fraction) for cas_id, fraction in contributions), source_type)
+            self._material_cache[resolved_norm] = cached
+        return cached
+
+    def line_contributions(self, mat_name):
+        # One memoized lookup per formula line name: alias resolution + composition
+        cached = self._line_cache.get(mat_name)
+        if cached is None:
+            cached = self._line_cache[mat_name] = self.material_contributions(self.resolve_name(mat_name))
+        return cached
+
+    def intern_line(self, mat_name, contributions, source_type):
+        # ((cas id, fraction), ...) and the source id of one formula line's (cas, fraction) contributions
+        ids, intern = self.cas.ids, self.cas.intern
+        return (tuple((ids[cas] if cas in ids else intern(cas), fraction) for cas, fraction in contributions),
+                self.sources.intern((mat_name, source_type)))
+
+    def line_ids(self, mat_name):
+        # line_contributions() as the ids compute_exposure() sums under (memoized per line name)
+        cached = self._line_id_cache.get(mat_name)
+        if cached is None:
+            contributions, source_type = self.material_ids(self.resolve_name(mat_name))
+            cached = self._line_id_cache[mat_name] = (contributions, self.sources.intern((mat_name, source_type)))
+        return cached
+
+
+def load_reference_db(release_dir=RELEASE_DIR, snapshot_path=None, store_path=None, refresh_store=True):
+    # Prefer a fresh compiled snapshot (see db_snapshot.py), else parse the CSVs.
+    # With `store_path`, materials come from the SQLite materials store instead (materials_store.py),
+    # re-imported from the CSVs first unless refresh_store=False
+    if store_path:
+        from materials_store import store_reference_db
+        return store_reference_db(store_path, release_dir, refresh_store)
+
+    from db_snapshot import open_snapshot
+
+    snapshot = open_snapshot(snapshot_path, release_dir)
+    if snapshot is not None:
+        return snapshot.reference_db()
+    return ReferenceDB.from_csv_dir(release_dir)
+
+
+# --- Evaluation Stages ---
+
+def iter_formula_lines(formula):
+    # Yields (name, amount) for every valid formula row (same skip rules as Code.js)
+    for row in formula:
+        if not row:
+            continue
+        name = row[0]
+        amount = row[1] if len(row) > 1 else None
+        if not name or amount is None or amount == "":
+            continue
+        val = to_number(amount)
+        if val is None or val <= 0:
+            continue
+        yield name, val
+
+
+def read_formula_csv(path):
+    # Formula tab layout: Ingredient, Amount (header and blank rows are skipped like any bad row)
+    with open(path, newline="", encoding="utf-8") as f:
+        return [row[:2] for row in csv.reader(f) if row]
+
+
+def compute_exposure(formula, db, lookup=None):
+    # exposure: {cas id: [total, {source id: amount}]} in first-seen order (ids of db.cas / db.sources).
+    # `lookup` maps a formula line name to (((cas id, fraction), ...), source id); default IFRA rules
+    lookup = lookup or db.line_ids
+    exposure = {}
+    total_amount = 0.0
+    for name, amount in iter_formula_lines(formula):
+        total_amount += amount
+        contributions, source_id = lookup(name)
+        for cas_id, fraction in contributions:
+            c_amount = amount * fraction
+            entry = exposure.get(cas_id)
+            if entry is None:
+                entry = exposure[cas_id] = [0.0, {}]
+            entry[0] += c_amount
+            sources = entry[1]
+            sources[source_id] = sources.get(source_id, 0.0) + c_amount
+    return exposure, total_amount
+
+
+def new_group(std, category=None):
+    # Empty regulated group of one standard; `category` picks an IFRA product category limit
+    return {"limit": std.category_limit(category), "total": 0.0, "sources": [], "casList": [],
+            "normName": std.norm_name}
+
+
+def group_by_standard(exposure, db, category=None):
+    # Isomer aggregation: every CAS is folded into its regulated standard.
+    # `category` picks an IFRA product category limit instead of Limit_Cat4
+    grouped = {}
+    standards, std_of_cas = db.standards, db.std_of_cas
+    indexed = len(std_of_cas)
+    cas_values, source_values = db.cas.values, db.sources.values
+    for cas_id, (total, sources) in exposure.items():
+        if total <= 0 or cas_id >= indexed:
+            continue
+        i = std_of_cas[cas_id]
+        if i == NO_ID:
+            continue
+        std = standards[i]
+        group = grouped.get(std.name)
+        if group is None:
+            group = grouped[std.name] = new_group(std, category)
+        group["total"] += total
+        group["casList"].append(cas_values[cas_id])
+        group["sources"].extend(zip(map(source_values.__getitem__, sources), sources.values()))
+    return grouped
+
+
+def format_sources(sources, total_amount, dosage_val, max_sources=5):
+    merged = {}
+    for key, amount in sources:
+        merged[key] = merged.get(key, 0.0) + amount
+    parts = []
+    for (name, source_type), amount in sorted(merged.items(), key=lambda kv: -kv[1]):
+        if amount <= 0:
+            continue
+        src_conc = (amount / total_amount) * 100.0 * (dosage_val / 100.0)
+        if src_conc > 0:
+            label = "Direct" if source_type == SOURCE_DIRECT else str(name)
+            parts.append(f"{label} ({src_conc:.4f}%)")
+    return ", ".join(parts[:max_sources])
+
+
+def _limit_ratio(concentration, limit):
+    if limit == 0:
+        return math.inf if concentration > 0 else math.nan
+    return concentration / limit
+
+
+def ifra_details(grouped, total_amount, dosage_val):
+    details = []
+    photo_sum_ratio = 0.0
+    photo_sources = []
+
+    for std_name, data in grouped.items():
+        if total_amount == 0:
+            continue
+        concentration = (data["total"] / total_amount) * 100.0 * (dosage_val / 100.0)
+        limit = data["limit"]
+
+        status = "FAIL" if concentration > limit else "PASS"
+        if data["normName"] in PHOTOTOXIC_OILS:
+            ratio = _limit_ratio(concentration, limit)
+            photo_sum_ratio += ratio
+            photo_sources.append(f"{std_name} ({ratio * 100:.1f}% of limit)")
+
+        details.append({
+            "ingredient": std_name,
+            "cas": ", ".join(dict.fromkeys(data["casList"])),
+            "conc": concentration,
+            "limit": limit,
+            "status": status,
+            "sources": format_sources(data["sources"], total_amount, dosage_val)
+        })
+
+    if photo_sources:
+        photo_percentage = photo_sum_ratio * 100.0
+        details.append({
+            "ingredient": PHOTOTOXICITY_ROW_NAME,
+            "cas": "Special",
+            "conc": photo_percentage,
+            "limit": 100,
+            "status": "FAIL" if photo_percentage > 100.0 else "PASS",
+            "sources": ", ".join(photo_sources)
+        })
+
+    details.sort(key=cmp_to_key(_compare_details))
+    return details
+
+
+def _compare_details(a, b):
+    if a["status"] == "FAIL" and b["status"] != "FAIL":
+        return -1
+    if a["status"] != "FAIL" and b["status"] == "FAIL":
+        return 1
+    if a["ingredient"].startswith("⚠️") and a["status"] == "FAIL":
+        return -1
+    diff = b["conc"] - a["conc"]
+    return -1 if diff < 0 else (1 if diff > 0 else 0)
+
+
+def ifra_table(details, dosage_val):
+    result = [list(IFRA_HEADERS)]
+    if not details:
+        result.append(["No Regulated Ingredients Found", "-", "-", "-", "PASS", "-"])
+        return result
+    for d in details:
+        result.append([d["ingredient"], d["cas"], round(d["conc"], 4), d["limit"], d["status"], d["sources"]])
+    fail_count = sum(1 for d in details if d["status"] == "FAIL")
+    dosage_text = js_number_str(dosage_val)
+    if fail_count == 0:
+        result.append([f"✅ FINAL RESULT: ALL PASS (Dosage: {dosage_text}%)", "", "", "", "", ""])
+    else:
+        result.append([f"❌ FINAL RESULT: {fail_count} FAILS (Dosage: {dosage_text}%)", "", "", "", "", ""])
+    return result
+
+
+# --- Public API ---
+
+def evaluate_formula(formula, db, finished_dosage=None, category=None):
+    # Structured report: {"dosage", "total_amount", "details", "fail_count", "passed"}
+    dosage_val = parse_dosage(finished_dosage)
+    exposure, total_amount = compute_exposure(formula, db)
+    details = ifra_details(group_by_standard(exposure, db, category), total_amount, dosage_val)
+    fail_count = sum(1 for d in details if d["status"] == "FAIL")
+    return {
+        "dosage": dosage_val,
+        "total_amount": total_amount,
+        "details": details,
+        "fail_count": fail_count,
+        "passed": fail_count == 0
+    }
+
+
+def ifra_compliance(formula, db, finished_dosage=None, category=None):
+    # Same table as =IFRA_COMPLIANCE_V5(...) in Google Sheets (category None = Category 4)
+    report = evaluate_formula(formula, db, finished_dosage, category)
+    return ifra_table(report["details"], report["dosage"])
+
+
+def evaluate_formulas(formulas, db=None, finished_dosage=None):
+    # Evaluate many formulas against one parsed database.
+    # `formulas` is a list of formula row lists or a {name: rows} dict.
+    if db is None:
+        db = load_reference_db()
+    if isinstance(formulas, dict):
+        return {name: evaluate_formula(rows, db, finished_dosage) for name, rows in formulas.items()}
+    return [evaluate_formula(rows, db, finished_dosage) for rows in formulas]
+
+
+if __name__ == "__main__":
+    import time
+
+    print("🚀 Loading reference databases...")
+    db = load_reference_db()
+    print(f"  {len(db.standards)} standards, {len(db.naturals)} naturals, "
+          f"{len(db.user_materials)} user materials, {len(db.inventory)} inventory aliases.")
+
+    test_formula = [
+        ["Bergamot oil expressed", 2.5],
+        ["Lemon oil cold pressed", 1.0],
+        ["Alpha Damascone", 0.01],
+        ["Beta Damascone", 0.02],
+        ["Hedione", 10.0],
+        ["DPG", 86.47]
+    ]
+    for row in ifra_compliance(test_formula, db, 20):
+        print("  " + " | ".join(str(v) for v in row))
+
+    start = time.perf_counter()
+    reports = evaluate_formulas([test_formula] * 1000, db, 20)
+    elapsed = time.perf_counter() - start
+    print(f"\n✅ Evaluated {len(reports)} formulas in {elapsed:.3f}s ({len(reports) / elapsed:,.0f} formulas/s).")
@@ -0,0 +1,481 @@
+"""Compiled, memory-mappable snapshot of the five DB_*.csv reference tables.
+
+File layout:
+  MAGIC (8 bytes) | header length (uint64) | JSON header | padding | array data
+
+The JSON header records the content hash of the source CSVs, a fingerprint
+of the parsing code, the table schemas and the (dtype, shape, offset) of
+every array. Arrays are opened zero-copy with numpy.frombuffer over an mmap,
+so opening a snapshot costs a stat + a small JSON parse. Strings are
+interned once into a single UTF-8 blob.
+
+Stored arrays:
+  strings.blob / strings.offsets           interned string table
+  <tab>.<col>                              columnar cells (string ids or numbers)
+  index.names / index.cas / index.constituents
+                                           the ReferenceDB interners (string ids, in id order)
+  naturals.<array> / user_materials.<array>
+                                           CSR arrays of both CompositionTables
+  standards.* / inventory.* / allergens.*  the other parsed tables (string ids, limits,
+                                           CAS lists as <name>_offsets + string ids)
+
+Everything is plain typed arrays: reading a snapshot never unpickles or
+executes anything. reference_db() parses nothing either: the interners and
+records are rebuilt from the string table and the composition arrays are
+copied straight out of the mmap. The snapshot lives in the release
+directory, next to the CSVs it was compiled from.
+"""
+import csv
+import hashlib
+import json
+import mmap
+import os
+
+import numpy as np
+
+from compliance_engine import (
+    DB_FILES, RELEASE_DIR, STANDARDS_LIMIT_CATEGORIES, CompositionTable, Interner, ReferenceDB, StandardRecord
+)
+
+SNAPSHOT_FILE = "reference_db.snapshot"
+MAGIC = b"MPSNAP01"
+# Bump when the file layout changes; parse rule changes are caught by code_fingerprint()
+SNAPSHOT_VERSION = 4
+ALIGN = 64
+
+# Same default NA markers as pandas.read_csv, so cells come out identical to
+# the previous `"" if pd.isna(v) else v` cleanup in the build scripts.
+NA_VALUES = frozenset([
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND",
+    "1.#QNAN", "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null"
+])
+
+
+# --- Content Hashing ---
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def combine_hashes(file_hashes):
+    # file_hashes: {tab_name: sha256 hex}; order-independent combined digest
+    h = hashlib.sha256()
+    for tab_name in sorted(file_hashes):
+        h.update(f"{tab_name}={file_hashes[tab_name]}\n".encode("utf-8"))
+    return h.hexdigest()
+
+
+def source_fingerprints(release_dir=RELEASE_DIR):
+    sources = {}
+    for tab_name, csv_file in DB_FILES.items():
+        csv_p = os.path.join(release_dir, csv_file)
+        st = os.stat(csv_p)
+        sources[tab_name] = {
+            "file": csv_file,
+            "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+            "sha256": file_sha256(csv_p)
+        }
+    return sources
+
+
+_code_fingerprint = None
+
+
+def code_fingerprint():
+    # Hash of the modules whose parse rules the stored indexes bake in
+    global _code_fingerprint
+    if _code_fingerprint is None:
+        import compliance_engine
+
+        h = hashlib.sha256()
+        for path in (compliance_engine.__file__, __file__):
+            with open(path, "rb") as f:
+                h.update(f.read())
+        _code_fingerprint = h.hexdigest()
+    return _code_fingerprint
+
+
+def db_content_hash(release_dir=RELEASE_DIR):
+    # Combined content hash of the five DB_* tables
+    return combine_hashes({tab: s["sha256"] for tab, s in source_fingerprints(release_dir).items()})
+
+
+# --- Typed CSV Reading (pandas-compatible column inference) ---
+
+def _parse_int(text):
+    if "_" in text:
+        raise ValueError(text)
+    return int(text)
+
+
+def _parse_float(text):
+    if "_" in text or text.strip().lower() in ("inf", "+inf", "-inf", "infinity", "+infinity", "-infinity"):
+        raise ValueError(text)
+    return float(text)
+
+
+def _clean_cell(value):
+    if "\x00" in value:
+        # pandas' C parser ends a field at NUL (and XLSX cannot store it)
+        value = value.split("\x00", 1)[0]
+    return value
+
+
+def _iter_raw_rows(csv_path, n_cols):
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        for row in reader:
+            if not row:
+                continue
+            if len(row) < n_cols:
+                row = row + [""] * (n_cols - len(row))
+            yield [_clean_cell(row[c]) for c in range(n_cols)]
+
+
+def csv_table_kinds(csv_path):
+    # First streaming pass: (header, kinds) with the column kind pandas would infer
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        header = next(csv.reader(f), [])
+    n_cols = len(header)
+    all_int = [True] * n_cols
+    all_float = [True] * n_cols
+    has_na = [False] * n_cols
+    any_present = [False] * n_cols
+
+    for row in _iter_raw_rows(csv_path, n_cols):
+        for c, v in enumerate(row):
+            if v in NA_VALUES:
+                has_na[c] = True
+                continue
+            any_present[c] = True
+            if all_int[c]:
+                try:
+                    _parse_int(v)
+                    continue
+                except ValueError:
+                    all_int[c] = False
+            if all_float[c]:
+                try:
+                    _parse_float(v)
+                except ValueError:
+                    all_float[c] = False
+
+    kinds = []
+    for c in range(n_cols):
+        if not any_present[c]:
+            kinds.append("float")
+        elif all_int[c]:
+            kinds.append("float" if has_na[c] else "int")
+        elif all_float[c]:
+            kinds.append("float")
+        else:
+            kinds.append("str")
+    return header, kinds
+
+
+def _typed_value(value, kind):
+    if kind == "int":
+        return _parse_int(value)
+    if value in NA_VALUES:
+        return ""
+    return _parse_float(value) if kind == "float" else value
+
+
+def iter_csv_rows(csv_path, kinds):
+    # Second streaming pass: typed rows, NaN cells as ""
+    for row in _iter_raw_rows(csv_path, len(kinds)):
+        yield [_typed_value(v, kind) for v, kind in zip(row, kinds)]
+
+
+def read_csv_table(csv_path):
+    # Returns (header, rows, kinds) with numbers typed like pandas and NaN cells as ""
+    header, kinds = csv_table_kinds(csv_path)
+    return header, list(iter_csv_rows(csv_path, kinds)), kinds
+
+
+# --- Compile ---
+
+class _StringTable:
+    def __init__(self):
+        self.ids = {}
+        self.strings = []
+
+    def intern(self, value):
+        value = "" if value is None else str(value)
+        sid = self.ids.get(value)
+        if sid is None:
+            sid = self.ids[value] = len(self.strings)
+            self.strings.append(value)
+        return sid
+
+
+INTERNERS = ("names", "cas", "constituents")
+COMPOSITION_TABLES = ("naturals", "user_materials")
+
+
+def snapshot_path(release_dir=RELEASE_DIR):
+    # Next to the CSVs it is compiled from (never resolved against the working directory)
+    return os.path.join(release_dir, SNAPSHOT_FILE)
+
+
+def _string_ids(values, strings):
+    return np.asarray([strings.intern(v) for v in values], dtype=np.int32)
+
+
+def _ragged(name, lists, strings):
+    # Lists of strings as <name>_offsets + <name> string ids
+    offsets = np.zeros(len(lists) + 1, dtype=np.int64)
+    np.cumsum([len(values) for values in lists], out=offsets[1:])
+    return {f"{name}_offsets": offsets, name: _string_ids([v for values in lists for v in values], strings)}
+
+
+def _index_arrays(db, strings):
+    # The finished ReferenceDB indexes: interners as string ids, compositions as their CSR arrays
+    arrays = {f"index.{attr}": _string_ids(getattr(db, attr).values, strings) for attr in INTERNERS}
+    for attr in COMPOSITION_TABLES:
+        table = getattr(db, attr)
+        for column, typecode in CompositionTable.ARRAYS.items():
+            arrays[f"{attr}.{column}"] = np.array(getattr(table, column), dtype=typecode)
+
+    standards = db.standards
+    arrays["standards.name"] = _string_ids([std.name for std in standards], strings)
+    arrays.update(_ragged("standards.cas", [std.cas for std in standards], strings))
+    arrays["standards.limit"] = np.asarray([std.limit for std in standards], dtype=np.float64)
+    # One column per STANDARDS_LIMIT_CATEGORIES entry; NaN (never a parsed limit) marks a missing one
+    arrays["standards.limits"] = np.asarray(
+        [[std.limits.get(c, np.nan) for c in STANDARDS_LIMIT_CATEGORIES] for std in standards], dtype=np.float64
+    ).reshape(len(standards), len(STANDARDS_LIMIT_CATEGORIES))
+    arrays["inventory.keys"] = _string_ids(db.inventory.keys(), strings)
+    arrays["inventory.values"] = _string_ids(db.inventory.values(), strings)
+    arrays["allergens.name"] = _string_ids([a["name"] for a in db.allergens], strings)
+    arrays.update(_ragged("allergens.cas", [a["casList"] for a in db.allergens], strings))
+    return arrays
+
+
+def compile_snapshot(release_dir=RELEASE_DIR, out_path=None):
+    out_path = out_path or snapshot_path(release_dir)
+    print(f"🚀 Compiling reference DB snapshot from {release_dir}...")
+    sources = source_fingerprints(release_dir)
+    strings = _StringTable()
+    arrays = {}
+    tables = {}
+    table_rows = {}
+
+    # 1. Columnar tables
+    for tab_name, csv_file in DB_FILES.items():
+        header, rows, kinds = read_csv_table(os.path.join(release_dir, csv_file))
+        table_rows[tab_name] = rows
+        for c, (column, kind) in enumerate(zip(header, kinds)):
+            values = [row[c] for row in rows]
+            if kind == "int":
+                arr = np.asarray(values, dtype=np.int64)
+            elif kind == "float":
+                arr = np.asarray([np.nan if v == "" else v for v in values], dtype=np.float64)
+            else:
+                arr = np.asarray([strings.intern(v) for v in values], dtype=np.int32)
+            arrays[f"{tab_name}.{c}"] = arr
+        tables[tab_name] = {"columns": header, "kinds": kinds, "n_rows": len(rows)}
+        print(f"  Packed '{tab_name}' ({len(rows)} rows, {len(header)} columns).")
+
+    # 2. Finished lookup indexes, parsed from the same typed rows as ReferenceDB.from_csv_dir
+    arrays.update(_index_arrays(ReferenceDB.from_tables(table_rows), strings))
+
+    # 3. Interned string table
+    encoded = [s.encode("utf-8") for s in strings.strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    arrays["strings.offsets"] = offsets
+    arrays["strings.blob"] = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+    # 4. Layout + write
+    layout = {}
+    position = 0
+    for name, arr in arrays.items():
+        position = -(-position // ALIGN) * ALIGN
+        layout[name] = {"dtype": arr.dtype.str, "shape": list(arr.shape), "offset": position}
+        position += arr.nbytes
+
+    header = {
+        "version": SNAPSHOT_VERSION,
+        "code": code_fingerprint(),
+        "content_hash": combine_hashes({tab: s["sha256"] for tab, s in sources.items()}),
+        "sources": sources,
+        "tables": tables,
+        "arrays": layout
+    }
+    header_bytes = json.dumps(header, ensure_ascii=False).encode("utf-8")
+    data_start = -(-(len(MAGIC) + 8 + len(header_bytes)) // ALIGN) * ALIGN
+
+    tmp_path = out_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(len(header_bytes).to_bytes(8, "little"))
+        f.write(header_bytes)
+        f.write(b"\0" * (data_start - f.tell()))
+        for name, arr in arrays.items():
+            f.write(b"\0" * (data_start + layout[name]["offset"] - f.tell()))
+            f.write(np.ascontiguousarray(arr).tobytes())
+    os.replace(tmp_path, out_path)
+
+    print(f"✅ Snapshot written to {out_path} ({os.path.getsize(out_path):,} bytes, "
+          f"{len(strings.strings):,} interned strings, hash {header['content_hash'][:12]}).")
+    return header["content_hash"]
+
+
+# --- Read ---
+
+class Snapshot:
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a miniPinscher reference DB snapshot")
+        header_len = int.from_bytes(self._mm[len(MAGIC):len(MAGIC) + 8], "little")
+        header_end = len(MAGIC) + 8 + header_len
+        self.header = json.loads(self._mm[len(MAGIC) + 8:header_end].decode("utf-8"))
+        if self.header["version"] != SNAPSHOT_VERSION:
+            raise ValueError(f"{path} has unsupported snapshot version {self.header['version']}")
+        self._data_start = -(-header_end // ALIGN) * ALIGN
+        self.content_hash = self.header["content_hash"]
+        self.tables = self.header["tables"]
+        self._strings = None
+
+    def array(self, name):
+        spec = self.header["arrays"][name]
+        dtype = np.dtype(spec["dtype"])
+        count = int(np.prod(spec["shape"])) if spec["shape"] else 1
+        arr = np.frombuffer(self._mm, dtype=dtype, count=count, offset=self._data_start + spec["offset"])
+        return arr.reshape(spec["shape"])
+
+    @property
+    def strings(self):
+        # Decoded lazily, once, as a single blob
+        if self._strings is None:
+            offsets = self.array("strings.offsets").tolist()
+            blob = memoryview(self.array("strings.blob"))
+            self._strings = [str(blob[offsets[i]:offsets[i + 1]], "utf-8") for i in range(len(offsets) - 1)]
+        return self._strings
+
+    def is_stale(self, release_dir=RELEASE_DIR):
+        # Built by other parsing code, or from other CSVs. Fast path compares size + mtime;
+        # only changed-looking files are re-hashed
+        if self.header.get("code") != code_fingerprint():
+            return True
+        for tab_name, src in self.header["sources"].items():
+            csv_p = os.path.join(release_dir, src["file"])
+            if not os.path.exists(csv_p):
+                return True
+            st = os.stat(csv_p)
+            if st.st_size == src["size"] and st.st_mtime_ns == src["mtime_ns"]:
+                continue
+            if st.st_size != src["size"] or file_sha256(csv_p) != src["sha256"]:
+                return True
+        return False
+
+    def column(self, tab_name, c):
+        kind = self.tables[tab_name]["kinds"][c]
+        arr = self.array(f"{tab_name}.{c}")
+        if kind == "str":
+            strings = self.strings
+            return [strings[i] for i in arr.tolist()]
+        if kind == "int":
+            return arr.tolist()
+        return ["" if v != v else v for v in arr.tolist()]
+
+    def columns(self, tab_name):
+        return list(self.tables[tab_name]["columns"])
+
+    def iter_rows(self, tab_name):
+        spec = self.tables[tab_name]
+        columns = [self.column(tab_name, c) for c in range(len(spec["columns"]))]
+        for cells in zip(*columns):
+            yield list(cells)
+
+    def table(self, tab_name):
+        # (header, rows) with the same cell values as read_csv_table
+        return list(self.tables[tab_name]["columns"]), list(self.iter_rows(tab_name))
+
+    def string_column(self, name):
+        strings = self.strings
+        return [strings[i] for i in self.array(name).tolist()]
+
+    def ragged(self, name):
+        # Lists of strings stored by _ragged()
+        values = self.string_column(name)
+        offsets = self.array(f"{name}_offsets").tolist()
+        return [values[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+
+    def reference_db(self):
+        # ReferenceDB without parsing anything. Every value is copied out of the mmap,
+        # so the DB outlives this Snapshot
+        interners = tuple(Interner(self.string_column(f"index.{attr}")) for attr in INTERNERS)
+        tables = {attr: CompositionTable.from_arrays(
+            *interners, {column: self.array(f"{attr}.{column}") for column in CompositionTable.ARRAYS})
+            for attr in COMPOSITION_TABLES}
+
+        standards = [
+            StandardRecord(name, cas, limit, {c: v for c, v in zip(STANDARDS_LIMIT_CATEGORIES, limits) if v == v})
+            for name, cas, limit, limits in zip(self.string_column("standards.name"), self.ragged("standards.cas"),
+                                                self.array("standards.limit").tolist(),
+                                                self.array("standards.limits").tolist())
+        ]
+        inventory = dict(zip(self.string_column("inventory.keys"), self.string_column("inventory.values")))
+        allergens = [{"name": name, "normName": name.lower(), "casList": cas}
+                     for name, cas in zip(self.string_column("allergens.name"), self.ragged("allergens.cas"))]
+
+        db = ReferenceDB(standards, tables["naturals"], inventory, tables["user_materials"], allergens,
+                         interners=interners)
+        db.content_hash = self.content_hash
+        return db
+
+    def close(self):
+        self._mm.close()
+
+
+def open_snapshot(path=None, release_dir=RELEASE_DIR):
+    # Returns a fresh Snapshot, or None when it is missing, unreadable or stale.
+    # `path` defaults to the snapshot inside `release_dir`
+    path = path or snapshot_path(release_dir)
+    if not os.path.exists(path):
+        return None
+    try:
+        snapshot = Snapshot(path)
+    except (OSError, ValueError, KeyError):
+        return None
+    if snapshot.is_stale(release_dir):
+        snapshot.close()
+        return None
+    return snapshot
+
+
+def load_db_tables(release_dir=RELEASE_DIR, path=None):
+    # {tab_name: (header, rows)} from a fresh snapshot, falling back to the CSVs
+    snapshot = open_snapshot(path, release_dir)
+    if snapshot is not None:
+        return {tab_name: snapshot.table(tab_name) for tab_name in DB_FILES}
+    tables = {}
+    for tab_name, csv_file in DB_FILES.items():
+        header, rows, _ = read_csv_table(os.path.join(release_dir, csv_file))
+        tables[tab_name] = (header, rows)
+    return tables
+
+
+def iter_db_table(tab_name, release_dir=RELEASE_DIR, source=None):
+    # (header, row iterator) for one tab, streamed from `source` (a Snapshot or
+    # a materials_store.MaterialsStore) or else from its CSV
+    if source is not None:
+        return source.columns(tab_name), source.iter_rows(tab_name)
+    csv_p = os.path.join(release_dir, DB_FILES[tab_name])
+    header, kinds = csv_table_kinds(csv_p)
+    return header, iter_csv_rows(csv_p, kinds)
+
+
+if __name__ == "__main__":
+    compile_snapshot()
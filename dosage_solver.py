@@ -0,0 +1,149 @@
+"""Analytic maximum-safe finished dosage for IFRA compliance.
+
+Every concentration the engine reports is linear in the finished dosage:
+    conc = (group_total / total_amount) * dosage
+so each regulated group sets the ceiling  limit / (group_total / total_amount)
+and the phototoxic sum-of-ratios sets  1 / sum(ratio per 1% dosage).
+The lowest ceiling is the maximum compliant dosage and its constraint is the
+binding one. The result is nudged down to the last float the engine itself
+(ifra_details) still reports as ALL PASS, so it never disagrees with a recalc.
+"""
+import argparse
+import json
+import math
+import os
+
+from compliance_engine import (
+    PHOTOTOXIC_OILS, PHOTOTOXICITY_ROW_NAME, compute_exposure, group_by_standard, ifra_details,
+    load_reference_db, parse_dosage, read_formula_csv
+)
+
+# A finished product can never contain more than 100% of the fragrance
+MAX_DOSAGE = 100.0
+
+
+def dosage_constraints(grouped, total_amount):
+    # One {"ingredient", "cas", "limit", "conc_per_dosage", "max_dosage"} per constraint
+    constraints = []
+    if total_amount == 0:
+        return constraints
+    photo_rate = 0.0
+    for std_name, data in grouped.items():
+        rate = (data["total"] / total_amount) * 100.0 * (1.0 / 100.0)
+        limit = data["limit"]
+        constraints.append({
+            "ingredient": std_name,
+            "cas": ", ".join(dict.fromkeys(data["casList"])),
+            "limit": limit,
+            "conc_per_dosage": rate,
+            "max_dosage": limit / rate if rate > 0 else math.inf
+        })
+        if data["normName"] in PHOTOTOXIC_OILS:
+            photo_rate += rate / limit if limit != 0 else math.inf
+    if any(data["normName"] in PHOTOTOXIC_OILS for data in grouped.values()):
+        constraints.append({
+            "ingredient": PHOTOTOXICITY_ROW_NAME,
+            "cas": "Special",
+            "limit": 100,
+            "conc_per_dosage": photo_rate * 100.0,
+            "max_dosage": 1.0 / photo_rate if photo_rate > 0 else math.inf
+        })
+    constraints.sort(key=lambda c: c["max_dosage"])
+    return constraints
+
+
+def _passes(grouped, total_amount, dosage):
+    return all(d["status"] != "FAIL" for d in ifra_details(grouped, total_amount, dosage))
+
+
+def _engine_ceiling(grouped, total_amount, dosage):
+    # Float rounding can put limit / rate one ulp above the limit; step down until it passes
+    while dosage > 0 and not _passes(grouped, total_amount, dosage):
+        dosage = math.nextafter(dosage, 0.0)
+    return dosage
+
+
+def solve_formula(formula, db, finished_dosage=None, category=None):
+    # {"max_dosage", "binding", "constraints", "dosage", "headroom", "headroom_factor"}
+    exposure, total_amount = compute_exposure(formula, db)
+    return solve_grouped(group_by_standard(exposure, db, category), total_amount, finished_dosage)
+
+
+def solve_grouped(grouped, total_amount, finished_dosage=None):
+    # solve_formula() on already aggregated groups (e.g. FormulaSession.grouped())
+    constraints = dosage_constraints(grouped, total_amount)
+
+    binding = constraints[0] if constraints and constraints[0]["max_dosage"] <= MAX_DOSAGE else None
+    max_dosage = MAX_DOSAGE if binding is None else max(binding["max_dosage"], 0.0)
+    max_dosage = _engine_ceiling(grouped, total_amount, max_dosage)
+
+    dosage_val = parse_dosage(finished_dosage)
+    return {
+        "max_dosage": max_dosage,
+        "binding": binding,
+        "constraints": constraints,
+        "dosage": dosage_val,
+        "headroom": max_dosage - dosage_val,
+        "headroom_factor": max_dosage / dosage_val
+    }
+
+
+def solve_formulas(formulas, db=None, finished_dosage=None, category=None):
+    # Same shapes as evaluate_formulas: a list of formulas or a {name: rows} dict
+    if db is None:
+        db = load_reference_db()
+    if isinstance(formulas, dict):
+        return {name: solve_formula(rows, db, finished_dosage, category) for name, rows in formulas.items()}
+    return [solve_formula(rows, db, finished_dosage, category) for rows in formulas]
+
+
+def _formula_paths(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.lower().endswith(".csv"):
+                    yield os.path.join(path, name)
+        else:
+            yield path
+
+
+def _summary(name, result):
+    binding = result["binding"]
+    return {
+        "formula": name,
+        "max_dosage": result["max_dosage"],
+        "binding": binding["ingredient"] if binding else None,
+        "binding_cas": binding["cas"] if binding else None,
+        "binding_limit": binding["limit"] if binding else None,
+        "dosage": result["dosage"],
+        "headroom": result["headroom"],
+        "headroom_factor": result["headroom_factor"]
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maximum IFRA-compliant finished dosage of formula CSVs.")
+    parser.add_argument("formulas", nargs="+", help="Formula CSV files (Ingredient, Amount) or folders of them")
+    parser.add_argument("--dosage", default=None, help="Current finished dosage (%%) to report headroom against")
+    parser.add_argument("--category", default=None, help="IFRA product category (default: 4, as in Code.js)")
+    parser.add_argument("--json", action="store_true", help="Print one JSON object per formula")
+    args = parser.parse_args()
+
+    db = load_reference_db()
+    categories = db.limit_categories()
+    if args.category is not None and args.category not in categories:
+        parser.error(f"argument --category: DB_Standards has no '{args.category}' limits "
+                     f"(choose from {', '.join(categories)})")
+    for path in _formula_paths(args.formulas):
+        result = solve_formula(read_formula_csv(path), db, args.dosage, args.category)
+        summary = _summary(os.path.basename(path), result)
+        if args.json:
+            print(json.dumps(summary, ensure_ascii=False))
+            continue
+        if summary["binding"] is None:
+            print(f"✅ {summary['formula']}: no regulated limit binds, max dosage {MAX_DOSAGE:g}%")
+            continue
+        status = "✅" if summary["headroom"] >= 0 else "❌"
+        print(f"{status} {summary['formula']}: max dosage {summary['max_dosage']:.4f}% "
+              f"(binding: {summary['binding']}, limit {summary['binding_limit']}%), "
+              f"headroom {summary['headroom']:+.4f}% at {summary['dosage']:g}%")
@@ -0,0 +1,216 @@
+"""EU allergen labeling engine (Python port of EU_LABELING_V5 in Code.js).
+
+DB_EU_Allergens is inverted once into a CAS id -> allergen index, so a formula
+only touches the allergens whose CAS numbers actually occur in its exposure
+map instead of scanning every allergen x CAS. Concentrations are computed
+once and checked against the leave-on (0.001) and rinse-off (0.01)
+thresholds together. label_skus() produces the allergen part of the INCI
+label for every SKU in DB_User_Materials in one batch.
+"""
+import argparse
+import csv
+import re
+from functools import cmp_to_key
+
+from compliance_engine import (
+    RELEASE_DIR, SOURCE_DIRECT, compute_exposure, format_sources, js_number_str, load_reference_db,
+    normalize, parse_dosage, read_formula_csv
+)
+
+LEAVE_ON = "leave-on"
+RINSE_OFF = "rinse-off"
+# EU 2023/1545 labeling thresholds, compared like EU_LABELING_V5: concentration (%) > threshold * 100
+THRESHOLDS = {LEAVE_ON: 0.001, RINSE_OFF: 0.01}
+
+EU_HEADERS = ["Allergen Name", "CAS References", "Concentration (%)", "Threshold (%)", "Required on Label",
+              "Contribution Sources"]
+SKU_LABELS_CSV = "EU_Allergen_Labels.csv"
+
+_CAS_PATTERN = re.compile(r"[0-9]+-[0-9]+-[0-9]+")
+
+
+def product_type_key(product_type):
+    return RINSE_OFF if normalize(product_type) == RINSE_OFF else LEAVE_ON
+
+
+class AllergenIndex:
+    def __init__(self, db):
+        self.db = db
+        self.allergens = db.allergens
+        # CAS id -> allergen positions (a CAS listed by several allergens counts for each of them)
+        self.by_cas = {}
+        self.by_name = {}
+        # Allergen position -> the CAS ids of its casList
+        self.cas_ids = []
+        for i, allergen in enumerate(self.allergens):
+            self.cas_ids.append([db.cas.intern(cas) for cas in allergen["casList"]])
+            for cas_id in self.cas_ids[i]:
+                self.by_cas.setdefault(cas_id, []).append(i)
+            self.by_name.setdefault(allergen["normName"], i)
+        self._line_cache = {}
+        self._line_id_cache = {}
+
+    def line_contributions(self, mat_name):
+        # Base > natural like IFRA; otherwise a literal CAS number or an allergen named in the formula
+        cached = self._line_cache.get(mat_name)
+        if cached is None:
+            resolved = self.db.resolve_name(mat_name)
+            if resolved in self.db.user_materials or resolved in self.db.naturals:
+                cached = self.db.material_contributions(resolved)
+            else:
+                clean_name = str(mat_name).strip()
+                i = self.by_name.get(resolved)
+                if _CAS_PATTERN.fullmatch(clean_name):
+                    cached = (((clean_name, 1.0),), SOURCE_DIRECT)
+                elif i is not None and self.allergens[i]["casList"]:
+                    cached = (((self.allergens[i]["casList"][0].strip(), 1.0),), SOURCE_DIRECT)
+                else:
+                    cached = ((), SOURCE_DIRECT)
+            self._line_cache[mat_name] = cached
+        return cached
+
+    def line_ids(self, mat_name):
+        # line_contributions() as the ids compute_exposure() sums under
+        cached = self._line_id_cache.get(mat_name)
+        if cached is None:
+            cached = self._line_id_cache[mat_name] = self.db.intern_line(mat_name, *self.line_contributions(mat_name))
+        return cached
+
+
+def allergen_details(exposure, total_amount, dosage_val, index):
+    # One entry per allergen present, with both product-type decisions
+    touched = sorted({i for cas_id in exposure for i in index.by_cas.get(cas_id, ())})
+    source_keys = index.db.sources
+    details = []
+    for i in touched:
+        allergen = index.allergens[i]
+        allergen_total = 0.0
+        sources = []
+        for cas_id in index.cas_ids[i]:
+            entry = exposure.get(cas_id)
+            if entry is not None:
+                allergen_total += entry[0]
+                sources.extend((source_keys[source_id], amount) for source_id, amount in entry[1].items())
+        if not (allergen_total > 0 and total_amount > 0):
+            continue
+        concentration = (allergen_total / total_amount) * 100.0 * (dosage_val / 100.0)
+        details.append({
+            "name": allergen["name"],
+            "cas": ", ".join(allergen["casList"]),
+            "conc": concentration,
+            "required": {k: concentration > threshold * 100.0 for k, threshold in THRESHOLDS.items()},
+            "sources": format_sources(sources, total_amount, dosage_val)
+        })
+    return details
+
+
+def evaluate_labeling(formula, db, finished_dosage=None, index=None):
+    # {"dosage", "total_amount", "details", "labels": {"leave-on": [...], "rinse-off": [...]}}
+    index = index or AllergenIndex(db)
+    dosage_val = parse_dosage(finished_dosage)
+    exposure, total_amount = compute_exposure(formula, db, index.line_ids)
+    details = allergen_details(exposure, total_amount, dosage_val, index)
+    return {
+        "dosage": dosage_val,
+        "total_amount": total_amount,
+        "details": details,
+        "labels": {k: [d["name"] for d in details if d["required"][k]] for k in THRESHOLDS}
+    }
+
+
+def _compare_allergens(key):
+    def compare(a, b):
+        if a["required"][key] != b["required"][key]:
+            return -1 if a["required"][key] else 1
+        diff = b["conc"] - a["conc"]
+        return -1 if diff < 0 else (1 if diff > 0 else 0)
+    return compare
+
+
+def labeling_table(report, product_type="Leave-on"):
+    # Same table as =EU_LABELING_V5(...) for one product type
+    key = product_type_key(product_type)
+    threshold = THRESHOLDS[key] * 100.0
+    result = [list(EU_HEADERS)]
+    for d in sorted(report["details"], key=cmp_to_key(_compare_allergens(key))):
+        result.append([d["name"], d["cas"], round(d["conc"], 4), round(threshold, 4),
+                       "REQUIRED" if d["required"][key] else "NO", d["sources"]])
+    dosage_text = js_number_str(report["dosage"])
+    required = report["labels"][key]
+    if required:
+        result.append([f"Required Labels: {', '.join(required)} (Dosage: {dosage_text}%)", "", "", "", "", ""])
+    else:
+        result.append([f"No allergens exceed threshold (Dosage: {dosage_text}%)", "", "", "", "", ""])
+    return result
+
+
+def eu_labeling(formula, db, product_type="Leave-on", finished_dosage=None, index=None):
+    return labeling_table(evaluate_labeling(formula, db, finished_dosage, index), product_type)
+
+
+def inci_allergens(report, product_type="Leave-on"):
+    # Allergen names for the INCI list, highest concentration first
+    key = product_type_key(product_type)
+    required = [d for d in report["details"] if d["required"][key]]
+    return [d["name"] for d in sorted(required, key=lambda d: -d["conc"])]
+
+
+def iter_sku_catalogue(release_dir=RELEASE_DIR, source=None):
+    # (sku, material name) for every SKU in DB_User_Materials, first row wins
+    from db_snapshot import iter_db_table
+
+    _, rows = iter_db_table("DB_User_Materials", release_dir, source)
+    seen = set()
+    for row in rows:
+        if len(row) < 2 or row[0] in ("", None) or not row[1]:
+            continue
+        sku = str(row[0])
+        if sku not in seen:
+            seen.add(sku)
+            yield sku, str(row[1])
+
+
+def label_skus(db=None, finished_dosage=None, release_dir=RELEASE_DIR, source=None):
+    # One row per SKU: the material as a single-line formula, labeled for both product types
+    db = db or load_reference_db(release_dir)
+    index = AllergenIndex(db)
+    for sku, name in iter_sku_catalogue(release_dir, source):
+        report = evaluate_labeling([[name, 100]], db, finished_dosage, index)
+        yield {
+            "sku": sku,
+            "material": name,
+            LEAVE_ON: inci_allergens(report, LEAVE_ON),
+            RINSE_OFF: inci_allergens(report, RINSE_OFF)
+        }
+
+
+def write_sku_labels(path=SKU_LABELS_CSV, db=None, finished_dosage=None, release_dir=RELEASE_DIR):
+    count = 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["SKU", "Material Name", "Leave-on Allergens", "Rinse-off Allergens"])
+        for label in label_skus(db, finished_dosage, release_dir):
+            writer.writerow([label["sku"], label["material"], ", ".join(label[LEAVE_ON]), ", ".join(label[RINSE_OFF])])
+            count += 1
+    return count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="EU 2023/1545 allergen labeling for formulas or the SKU catalogue.")
+    parser.add_argument("formulas", nargs="*", help="Formula CSV files (Ingredient, Amount)")
+    parser.add_argument("--type", default="Leave-on", help="Leave-on or Rinse-off")
+    parser.add_argument("--dosage", default=None, help="Finished dosage (%%)")
+    parser.add_argument("--skus", default=None, metavar="CSV", nargs="?", const=SKU_LABELS_CSV,
+                        help="Write allergen labels for every DB_User_Materials SKU to this CSV")
+    args = parser.parse_args()
+
+    db = load_reference_db()
+    index = AllergenIndex(db)
+    for path in args.formulas:
+        print(f"🧪 {path}")
+        for row in eu_labeling(read_formula_csv(path), db, args.type, args.dosage, index):
+            print("  " + " | ".join(str(v) for v in row))
+    if args.skus:
+        print("🚀 Labeling every SKU in DB_User_Materials...")
+        count = write_sku_labels(args.skus, db, args.dosage)
+        print(f"✅ Wrote allergen labels for {count} SKUs to {args.skus}")
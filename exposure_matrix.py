@@ -0,0 +1,272 @@
+"""Vectorized batch scoring: formulas x materials x CAS x standards as sparse matrices.
+
+The reference DB is compiled once into
+  composition (material x CAS)  - fraction of each CAS in each resolved material
+  grouping    (CAS x standard)  - 1 where a CAS belongs to a regulated standard
+so scoring N formulas is  (F @ composition) @ grouping  followed by a
+vectorized comparison against the IFRA limits. Resolution, the per-CAS
+`total <= 0` skip and the concentration formula follow
+compliance_engine.evaluate_formula, but the sparse products sum in another
+order, so concentrations may differ from the engine's in the last bits.
+Formulas within BOUNDARY_TOLERANCE of a limit (or of a phototoxic sum of 1)
+are re-evaluated through ifra_details(), so pass / fail and fail_count always
+match the engine. score_categories() compares the same concentrations against
+the limits of every IFRA product category in one pass (formula x category
+matrices).
+"""
+import numpy as np
+from scipy import sparse
+
+from compliance_engine import (
+    PHOTOTOXIC_OILS, _limit_ratio, compute_exposure, group_by_standard, ifra_details, iter_formula_lines,
+    load_reference_db, parse_dosage
+)
+
+# Relative distance to a limit below which a formula is re-checked by the engine
+BOUNDARY_TOLERANCE = 1e-9
+
+
+class ExposureMatrix:
+    def __init__(self, db):
+        self.db = db
+
+        # 1. Material x CAS composition matrix (one row per resolvable material, one column per CAS id)
+        self.material_index = {}
+        self.cas_index = {}
+        rows, cols, vals = [], [], []
+        for key in dict.fromkeys([*db.user_materials, *db.naturals, *db.std_by_name]):
+            contributions, _ = db.material_contributions(key)
+            if not contributions:
+                continue
+            m = self.material_index.setdefault(key, len(self.material_index))
+            for cas, fraction in contributions:
+                k = self.cas_index.setdefault(db.cas.intern(cas), len(self.cas_index))
+                rows.append(m)
+                cols.append(k)
+                vals.append(fraction)
+        self.composition = sparse.csr_matrix(
+            (np.asarray(vals, dtype=np.float64), (rows, cols)),
+            shape=(len(self.material_index), len(self.cas_index))
+        )
+
+        # 2. CAS x Standard grouping matrix (isomer aggregation)
+        self.standard_names = [std.name for std in db.standards]
+        self.std_ids = std_ids = {std.name: i for i, std in enumerate(db.standards)}
+        g_rows, g_cols = [], []
+        for cas_id, k in self.cas_index.items():
+            std = db.standard_of(cas_id)
+            if std is not None:
+                g_rows.append(k)
+                g_cols.append(std_ids[std.name])
+        self.grouping = sparse.csr_matrix(
+            (np.ones(len(g_rows)), (g_rows, g_cols)),
+            shape=(len(self.cas_index), len(self.standard_names))
+        )
+
+        self.limits = np.array([std.limit for std in db.standards], dtype=np.float64)
+        # Dense standard x category limits for every IFRA product category in DB_Standards
+        self.categories = db.limit_categories()
+        self.category_limits = np.array(
+            [[std.limits[c] for c in self.categories] for std in db.standards], dtype=np.float64
+        ).reshape(len(db.standards), len(self.categories))
+        self.phototoxic = np.array([std.norm_name in PHOTOTOXIC_OILS for std in db.standards], dtype=bool)
+
+        self._row_cache = {}
+
+    def material_row(self, name):
+        # Raw formula name -> composition row (or -1 when it contributes nothing)
+        row = self._row_cache.get(name)
+        if row is None:
+            row = self.material_index.get(self.db.resolve_name(name), -1)
+            self._row_cache[name] = row
+        return row
+
+    def formula_matrix(self, formulas):
+        # Formula x Material amounts plus the total amount of every formula
+        totals = np.zeros(len(formulas), dtype=np.float64)
+        rows, cols, vals = [], [], []
+        for i, formula in enumerate(formulas):
+            for name, amount in iter_formula_lines(formula):
+                totals[i] += amount
+                m = self.material_row(name)
+                if m >= 0:
+                    rows.append(i)
+                    cols.append(m)
+                    vals.append(amount)
+        F = sparse.csr_matrix(
+            (np.asarray(vals, dtype=np.float64), (rows, cols)),
+            shape=(len(formulas), len(self.material_index))
+        )
+        return F, totals
+
+    def concentrations(self, formulas, finished_dosage=None):
+        # Formula x standard concentrations (CSR), total amounts and dosages.
+        # finished_dosage: a single value for all formulas or one value per formula
+        formulas = list(formulas)
+        n = len(formulas)
+        F, totals = self.formula_matrix(formulas)
+
+        # Two sparse products: formula -> CAS exposure -> regulated group totals.
+        # Like group_by_standard(), a CAS whose formula total is not positive is left out of its group
+        exposure = (F @ self.composition).tocsr()
+        exposure.data[exposure.data <= 0] = 0.0
+        grouped = (exposure @ self.grouping).tocsr()
+
+        if isinstance(finished_dosage, (list, tuple, np.ndarray)) and len(finished_dosage) == n:
+            dosage = np.array([parse_dosage(d) for d in finished_dosage], dtype=np.float64)
+        else:
+            dosage = np.full(n, parse_dosage(finished_dosage), dtype=np.float64)
+
+        # Same expression as ifra_details(): (total / total amount) * 100 * (dosage / 100)
+        row_ids = np.repeat(np.arange(n), np.diff(grouped.indptr))
+        safe_totals = np.where(totals > 0, totals, 1.0)
+        conc = grouped.copy()
+        conc.data = np.where(totals[row_ids] > 0,
+                             (grouped.data / safe_totals[row_ids]) * 100.0 * (dosage[row_ids] / 100.0), 0.0)
+        conc.eliminate_zeros()
+        return conc, totals, dosage
+
+    def engine_row(self, formula, dosage_val, category=None):
+        # One formula through the engine: ({standard index: conc}, fail_count, phototoxic sum of ratios)
+        exposure, total_amount = compute_exposure(formula, self.db)
+        grouped = group_by_standard(exposure, self.db, category)
+        details = ifra_details(grouped, total_amount, dosage_val)
+        conc = {self.std_ids[d["ingredient"]]: d["conc"] for d in details if d["ingredient"] in grouped}
+        photo_ratio = 0.0
+        for std_name, data in grouped.items():
+            if total_amount != 0 and data["normName"] in PHOTOTOXIC_OILS:
+                photo_ratio += _limit_ratio(conc[self.std_ids[std_name]], data["limit"])
+        return conc, sum(1 for d in details if d["status"] == "FAIL"), photo_ratio
+
+    def _recheck_rows(self, conc, limits, phototoxic_ratio):
+        # Formulas with a concentration or phototoxic sum within BOUNDARY_TOLERANCE of its limit
+        row_ids = np.repeat(np.arange(len(phototoxic_ratio)), np.diff(conc.indptr))
+        with np.errstate(invalid="ignore"):
+            near = np.abs(conc.data[:, None] - limits) <= BOUNDARY_TOLERANCE * np.abs(limits)
+            near_photo = np.abs(phototoxic_ratio - 1.0) <= BOUNDARY_TOLERANCE
+        rows = set(row_ids[near.any(axis=1)].tolist())
+        rows.update(np.flatnonzero(near_photo.reshape(len(phototoxic_ratio), -1).any(axis=1)).tolist())
+        return sorted(rows)
+
+    def _set_engine_conc(self, conc, i, engine_conc):
+        start, end = conc.indptr[i], conc.indptr[i + 1]
+        conc.data[start:end] = [engine_conc.get(j, 0.0) for j in conc.indices[start:end]]
+
+    def score(self, formulas, finished_dosage=None):
+        formulas = list(formulas)
+        conc, totals, dosage = self.concentrations(formulas, finished_dosage)
+        n = len(totals)
+
+        # Vectorized limit comparison on the non-zero entries only
+        row_ids = np.repeat(np.arange(n), np.diff(conc.indptr))
+        limits = self.limits[conc.indices]
+        fails = conc.data > limits
+        fail_count = np.bincount(row_ids[fails], minlength=n)
+
+        photo = self.phototoxic[conc.indices]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ratios = conc.data[photo] / limits[photo]
+        phototoxic_ratio = np.bincount(row_ids[photo], weights=ratios, minlength=n)
+        fail_count = fail_count + (phototoxic_ratio * 100.0 > 100.0)
+
+        for i in self._recheck_rows(conc, limits[:, None], phototoxic_ratio):
+            engine_conc, fail_count[i], phototoxic_ratio[i] = self.engine_row(formulas[i], dosage[i])
+            self._set_engine_conc(conc, i, engine_conc)
+
+        return {
+            "concentrations": conc,
+            "standard_names": self.standard_names,
+            "total_amount": totals,
+            "dosage": dosage,
+            "fail_count": fail_count,
+            "phototoxic_ratio": phototoxic_ratio,
+            "passed": fail_count == 0
+        }
+
+    def score_categories(self, formulas, finished_dosage=None):
+        # One exposure pass, compared against every product category at once.
+        # Returns formula x category matrices (columns follow self.categories)
+        formulas = list(formulas)
+        conc, totals, dosage = self.concentrations(formulas, finished_dosage)
+        n = len(totals)
+
+        # Every non-zero concentration against its standard's whole limit row (nnz x category)
+        row_ids = np.repeat(np.arange(n), np.diff(conc.indptr))
+        limits = self.category_limits[conc.indices]
+        values = conc.data[:, None]
+        per_formula = sparse.csr_matrix(
+            (np.ones(conc.nnz), (row_ids, np.arange(conc.nnz))), shape=(n, conc.nnz)
+        )
+        fail_count = np.asarray(per_formula @ (values > limits).astype(np.int64))
+
+        photo = self.phototoxic[conc.indices]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ratios = values[photo] / limits[photo]
+        phototoxic_ratio = np.asarray(per_formula[:, photo] @ ratios).reshape(n, len(self.categories))
+        fail_count = fail_count + (phototoxic_ratio * 100.0 > 100.0)
+
+        for i in self._recheck_rows(conc, limits, phototoxic_ratio):
+            for c, category in enumerate(self.categories):
+                engine_conc, fail_count[i, c], phototoxic_ratio[i, c] = self.engine_row(formulas[i], dosage[i],
+                                                                                        category)
+            self._set_engine_conc(conc, i, engine_conc)
+
+        return {
+            "categories": self.categories,
+            "concentrations": conc,
+            "standard_names": self.standard_names,
+            "total_amount": totals,
+            "dosage": dosage,
+            "fail_count": fail_count,
+            "phototoxic_ratio": phototoxic_ratio,
+            "passed": fail_count == 0
+        }
+
+    def failing_standards(self, scores, i):
+        conc = scores["concentrations"]
+        start, end = conc.indptr[i], conc.indptr[i + 1]
+        idx = conc.indices[start:end]
+        failing = conc.data[start:end] > self.limits[idx]
+        return [self.standard_names[j] for j in idx[failing]]
+
+
+def compile_exposure_matrix(db=None):
+    return ExposureMatrix(db if db is not None else load_reference_db())
+
+
+def score_formulas(formulas, db=None, finished_dosage=None):
+    return compile_exposure_matrix(db).score(formulas, finished_dosage)
+
+
+def score_formula_categories(formulas, db=None, finished_dosage=None):
+    return compile_exposure_matrix(db).score_categories(formulas, finished_dosage)
+
+
+if __name__ == "__main__":
+    import random
+    import time
+
+    print("🚀 Compiling sparse exposure matrices...")
+    db = load_reference_db()
+    matrix = compile_exposure_matrix(db)
+    print(f"  composition: {matrix.composition.shape[0]} materials x {matrix.composition.shape[1]} CAS "
+          f"({matrix.composition.nnz} non-zeros)")
+    print(f"  grouping: {matrix.grouping.shape[0]} CAS x {matrix.grouping.shape[1]} standards")
+
+    random.seed(0)
+    names = list(matrix.material_index)
+    formulas = [
+        [[random.choice(names), random.uniform(0.01, 20.0)] for _ in range(random.randint(5, 40))]
+        for _ in range(10000)
+    ]
+    start = time.perf_counter()
+    scores = matrix.score(formulas, 20)
+    elapsed = time.perf_counter() - start
+    print(f"\n✅ Scored {len(formulas)} formulas in {elapsed:.3f}s "
+          f"({len(formulas) / elapsed:,.0f} formulas/s, {int(scores['passed'].sum())} pass).")
+
+    start = time.perf_counter()
+    scores = matrix.score_categories(formulas, 20)
+    elapsed = time.perf_counter() - start
+    passing = ", ".join(f"Cat {c}: {int(n)}" for c, n in zip(matrix.categories, scores["passed"].sum(axis=0)))
+    print(f"✅ Scored {len(formulas)} formulas x {len(matrix.categories)} categories in {elapsed:.3f}s ({passing}).")
@@ -0,0 +1,379 @@
+"""Stateful, incrementally updated compliance engine for interactive what-if edits.
+
+A FormulaSession keeps the per-CAS exposure entries, the regulated group
+aggregates and (optionally) the EU allergen exposure of one formula. Adding,
+removing or rescaling a line only re-sums the CAS entries that line feeds and
+re-aggregates the groups those CAS belong to. Every re-sum walks the
+contributing lines in formula order (a line appended after them just
+continues the sum), so totals are bit-identical to a full
+compliance_engine.evaluate_formula() of the same lines (no drift from
+repeated +/- deltas). The formula total keeps its running sums per line:
+an edit only re-folds the lines after it (C-level accumulate), and adding a
+line at the end costs one addition.
+
+sweep() answers "what if this one ingredient were X" for a whole range of
+amounts at once with numpy, without touching the session state.
+"""
+from bisect import bisect_left
+from functools import reduce
+from itertools import accumulate
+from operator import add
+
+import numpy as np
+
+from compliance_engine import (
+    PHOTOTOXIC_OILS, _limit_ratio, ifra_details, ifra_table, new_group, parse_dosage, to_number
+)
+
+
+class _ExposureState:
+    # compute_exposure() kept up to date line by line (same cas id / source id keys).
+    # An edited CAS entry is re-summed over all its lines in formula order rather than patched with
+    # +/- deltas: float addition is not associative, and the re-sum keeps every total bit-identical
+    # to a from-scratch compute_exposure(). A line added after every other line of a CAS extends the
+    # fold instead (the same additions in the same order), so building a formula stays linear.
+    def __init__(self, lookup):
+        self.lookup = lookup
+        self.exposure = {}
+        # cas id -> {line_id: (position in the line's contributions, (c_amount, ...), source id)}
+        self._cas_lines = {}
+        # line_id -> the CAS ids it feeds (so removing a line never scans every CAS)
+        self._line_cas = {}
+        # cas id -> an upper bound of its line ids (exact after every re-sum)
+        self._cas_last = {}
+
+    def set_line(self, line_id, name, amount):
+        # amount None removes the line; returns the CAS ids whose entry changed
+        touched = set()
+        appended = set()
+        if name is not None:
+            contributions, source_id = self.lookup(name)
+            per_cas = {}
+            for pos, (cas, fraction) in enumerate(contributions):
+                slot = per_cas.setdefault(cas, [pos, []])
+                slot[1].append(amount * fraction)
+            for cas, (pos, amounts) in per_cas.items():
+                lines = self._cas_lines.setdefault(cas, {})
+                if line_id not in lines and line_id > self._cas_last.get(cas, -1):
+                    appended.add(cas)
+                    self._cas_last[cas] = line_id
+                lines[line_id] = (pos, tuple(amounts), source_id)
+                touched.add(cas)
+            self._line_cas[line_id] = tuple(per_cas)
+        else:
+            touched.update(self._line_cas.get(line_id, ()))
+        if amount is None:
+            self._line_cas.pop(line_id, None)
+            for cas in touched:
+                self._cas_lines[cas].pop(line_id, None)
+        for cas in touched:
+            if cas in appended:
+                self._extend(cas, line_id)
+            else:
+                self._resum(cas)
+        return touched
+
+    def _extend(self, cas, line_id):
+        _, amounts, key = self._cas_lines[cas][line_id]
+        entry = self.exposure.get(cas)
+        if entry is None:
+            entry = self.exposure[cas] = [0.0, {}]
+        sources = entry[1]
+        for c_amount in amounts:
+            entry[0] += c_amount
+            sources[key] = sources.get(key, 0.0) + c_amount
+
+    def _resum(self, cas):
+        lines = self._cas_lines.get(cas)
+        if not lines:
+            self._cas_lines.pop(cas, None)
+            self._cas_last.pop(cas, None)
+            self.exposure.pop(cas, None)
+            return
+        total = 0.0
+        sources = {}
+        ordered = sorted(lines)
+        for line_id in ordered:
+            _, amounts, key = lines[line_id]
+            for c_amount in amounts:
+                total += c_amount
+                sources[key] = sources.get(key, 0.0) + c_amount
+        self.exposure[cas] = [total, sources]
+        self._cas_last[cas] = ordered[-1]
+
+    def first_seen(self, cas):
+        # Position the CAS would have in a from-scratch exposure map
+        lines = self._cas_lines[cas]
+        line_id = min(lines)
+        return line_id, lines[line_id][0]
+
+
+class FormulaSession:
+    def __init__(self, db, formula=None, finished_dosage=None, category=None, labeling=False):
+        self.db = db
+        self.category = category
+        self.dosage = parse_dosage(finished_dosage)
+        self._lines = {}
+        self._amounts = {}
+        self._next_id = 0
+        # Valid lines in formula order, their amounts and the running total after each (_running[0] = 0.0)
+        self._order = []
+        self._values = []
+        self._running = [0.0]
+        self._dirty_from = None
+
+        self._ifra = _ExposureState(db.line_ids)
+        self._groups = {}
+        self._group_cas = {}
+        self._eu = None
+        self._allergen_index = None
+        if labeling:
+            self._enable_labeling()
+
+        for row in formula or []:
+            if row:
+                self.add_line(row[0], row[1] if len(row) > 1 else None)
+
+    # --- Edits ---
+
+    def add_line(self, name, amount):
+        line_id = self._next_id
+        self._next_id += 1
+        self._lines[line_id] = [name, amount]
+        self._apply(line_id)
+        return line_id
+
+    def set_amount(self, line_id, amount):
+        self._lines[line_id][1] = amount
+        self._apply(line_id)
+
+    def set_line(self, line_id, name, amount):
+        # Renames and / or re-amounts a line in place, keeping its position in the formula
+        if self._lines[line_id][0] != name:
+            # Drop the old name's contributions first (its CAS numbers are not the new name's)
+            self._lines[line_id] = [self._lines[line_id][0], None]
+            self._apply(line_id)
+        self._lines[line_id] = [name, amount]
+        self._apply(line_id)
+
+    def remove_line(self, line_id):
+        del self._lines[line_id]
+        self._apply(line_id)
+
+    def set_dosage(self, finished_dosage):
+        self.dosage = parse_dosage(finished_dosage)
+
+    def _valid_amount(self, line_id):
+        # Same skip rules as iter_formula_lines; None means the line contributes nothing
+        row = self._lines.get(line_id)
+        if row is None or not row[0] or row[1] is None or row[1] == "":
+            return None
+        val = to_number(row[1])
+        return val if val is not None and val > 0 else None
+
+    def _apply(self, line_id):
+        amount = self._valid_amount(line_id)
+        name = self._lines[line_id][0] if amount is not None else None
+        if amount is None:
+            self._amounts.pop(line_id, None)
+        else:
+            self._amounts[line_id] = amount
+        self._update_total(line_id, amount)
+
+        touched = self._ifra.set_line(line_id, name, amount)
+        by_group = {}
+        for cas in touched:
+            std = self.db.standard_of(cas)
+            if std is not None:
+                by_group.setdefault(std.name, set()).add(cas)
+        for std_name, changed in by_group.items():
+            self._refresh_group(std_name, changed)
+        if self._eu is not None:
+            self._eu.set_line(line_id, name, amount)
+
+    def _update_total(self, line_id, amount):
+        # Line ids grow in formula order, so a line's position is a bisect of the valid ids
+        pos = bisect_left(self._order, line_id)
+        present = pos < len(self._order) and self._order[pos] == line_id
+        if amount is None:
+            if not present:
+                return
+            del self._order[pos]
+            del self._values[pos]
+            del self._running[pos + 1]
+        elif present:
+            self._values[pos] = amount
+        else:
+            self._order.insert(pos, line_id)
+            self._values.insert(pos, amount)
+            self._running.insert(pos + 1, 0.0)
+        if self._dirty_from is None or pos < self._dirty_from:
+            self._dirty_from = pos
+
+    def _refold(self):
+        # Running sums re-folded from the first edited line on, left to right exactly like compute_exposure
+        pos = self._dirty_from
+        if pos is not None:
+            tail = accumulate(self._values[pos:], initial=self._running[pos])
+            next(tail)
+            self._running[pos + 1:] = tail
+            self._dirty_from = None
+
+    @property
+    def total_amount(self):
+        self._refold()
+        return self._running[-1]
+
+    def _total_without(self, line_id):
+        # Formula total with one line left out, folded in the same order
+        self._refold()
+        pos = bisect_left(self._order, line_id)
+        return reduce(add, self._values[pos + 1:], self._running[pos])
+
+    def _refresh_group(self, std_name, changed):
+        # Re-aggregates one regulated group from its CAS entries (group_by_standard for one group);
+        # membership can only change through the CAS numbers the edit touched
+        exposure = self._ifra.exposure
+        candidates = set(self._group_cas.get(std_name, ())) | changed
+        # `not total <= 0` keeps NaN totals, exactly like group_by_standard
+        members = sorted((cas for cas in candidates if cas in exposure and not exposure[cas][0] <= 0),
+                         key=self._ifra.first_seen)
+        self._group_cas[std_name] = members
+        if not members:
+            self._groups.pop(std_name, None)
+            return
+        db = self.db
+        group = new_group(db.standard_of(members[0]), self.category)
+        for cas in members:
+            total, sources = exposure[cas]
+            group["total"] += total
+            group["casList"].append(db.cas[cas])
+            group["sources"].extend((db.sources[source_id], amount) for source_id, amount in sources.items())
+        self._groups[std_name] = group
+
+    # --- Results ---
+
+    @property
+    def formula(self):
+        return [list(row) for row in self._lines.values()]
+
+    def grouped(self):
+        # Same dict (and order) group_by_standard() builds from scratch
+        order = {name: self._ifra.first_seen(members[0]) for name, members in self._group_cas.items() if members}
+        return {name: self._groups[name] for name in sorted(self._groups, key=order.get)}
+
+    def status(self):
+        # Fast summary without formatting any source text
+        if self.total_amount == 0:
+            return {"fail_count": 0, "passed": True, "phototoxic_ratio": 0.0}
+        fail_count = 0
+        photo = None
+        for group in self.grouped().values():
+            conc = (group["total"] / self.total_amount) * 100.0 * (self.dosage / 100.0)
+            if conc > group["limit"]:
+                fail_count += 1
+            if group["normName"] in PHOTOTOXIC_OILS:
+                photo = (photo or 0.0) + _limit_ratio(conc, group["limit"])
+        if photo is not None and photo * 100.0 > 100.0:
+            fail_count += 1
+        return {"fail_count": fail_count, "passed": fail_count == 0, "phototoxic_ratio": photo or 0.0}
+
+    def report(self):
+        # Same structure as evaluate_formula()
+        details = ifra_details(self.grouped(), self.total_amount, self.dosage)
+        fail_count = sum(1 for d in details if d["status"] == "FAIL")
+        return {
+            "dosage": self.dosage,
+            "total_amount": self.total_amount,
+            "details": details,
+            "fail_count": fail_count,
+            "passed": fail_count == 0
+        }
+
+    def table(self):
+        return ifra_table(self.report()["details"], self.dosage)
+
+    def _enable_labeling(self):
+        from eu_labeling import AllergenIndex
+
+        self._allergen_index = AllergenIndex(self.db)
+        self._eu = _ExposureState(self._allergen_index.line_ids)
+        for line_id in self._lines:
+            amount = self._amounts.get(line_id)
+            if amount is not None:
+                self._eu.set_line(line_id, self._lines[line_id][0], amount)
+
+    def labeling(self):
+        # Same structure as eu_labeling.evaluate_labeling(), kept incrementally
+        from eu_labeling import THRESHOLDS, allergen_details
+
+        if self._eu is None:
+            self._enable_labeling()
+        details = allergen_details(self._eu.exposure, self.total_amount, self.dosage, self._allergen_index)
+        return {
+            "dosage": self.dosage,
+            "total_amount": self.total_amount,
+            "details": details,
+            "labels": {k: [d["name"] for d in details if d["required"][k]] for k in THRESHOLDS}
+        }
+
+    # --- What-if ---
+
+    def sweep(self, line, amounts):
+        # Evaluates the formula with `line` (a line id, or an ingredient name to add) at every amount.
+        # Returns arrays over `amounts`: fail_count, passed, phototoxic_ratio and the worst group
+        amounts = np.asarray(amounts, dtype=np.float64)
+        if isinstance(line, int) and line in self._lines:
+            name, line_id = self._lines[line][0], line
+        else:
+            name, line_id = line, None
+
+        # Group totals and formula total without this line (exact, no subtraction)
+        base_total = self.total_amount
+        base_groups = {g: data["total"] for g, data in self._groups.items()}
+        if line_id in self._amounts:
+            base_total = self._total_without(line_id)
+            for g in list(base_groups):
+                total = 0.0
+                for cas in self._group_cas[g]:
+                    for i, (_, c_amounts, _) in sorted(self._ifra._cas_lines[cas].items()):
+                        if i != line_id:
+                            total += sum(c_amounts)
+                base_groups[g] = total
+
+        # The line's weight in every group it feeds (fraction of its amount)
+        weights = {}
+        group_limits = {g: (data["limit"], data["normName"]) for g, data in self._groups.items()}
+        contributions, _ = self.db.line_ids(name)
+        for cas, fraction in contributions:
+            std = self.db.standard_of(cas)
+            if std is not None:
+                weights[std.name] = weights.get(std.name, 0.0) + fraction
+                base_groups.setdefault(std.name, 0.0)
+                group_limits.setdefault(std.name, (std.category_limit(self.category), std.norm_name))
+
+        names = list(base_groups)
+        limits = np.array([group_limits[g][0] for g in names], dtype=np.float64)
+        photo = np.array([group_limits[g][1] in PHOTOTOXIC_OILS for g in names], dtype=bool)
+        G = np.array([base_groups[g] for g in names], dtype=np.float64)
+        W = np.array([weights.get(g, 0.0) for g in names], dtype=np.float64)
+
+        totals = base_total + np.where(amounts > 0, amounts, 0.0)
+        group_totals = G[None, :] + np.where(amounts > 0, amounts, 0.0)[:, None] * W[None, :]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            conc = np.where(totals[:, None] > 0, group_totals / totals[:, None] * self.dosage, 0.0)
+            ratios = np.where(conc > 0, conc / limits[None, :], 0.0)
+        present = group_totals > 0
+        fails = (conc > limits[None, :]) & present
+        phototoxic_ratio = np.where(present & photo[None, :], ratios, 0.0).sum(axis=1)
+        fail_count = fails.sum(axis=1) + (phototoxic_ratio * 100.0 > 100.0)
+        worst = ratios.argmax(axis=1) if names else np.zeros(len(amounts), dtype=int)
+
+        return {
+            "amounts": amounts,
+            "fail_count": fail_count,
+            "passed": fail_count == 0,
+            "phototoxic_ratio": phototoxic_ratio,
+            "worst_group": [names[i] if names and ratios[k, i] > 0 else None for k, i in enumerate(worst)],
+            "worst_ratio": ratios.max(axis=1) if names else np.zeros(len(amounts))
+        }
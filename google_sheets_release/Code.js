@@ -24,20 +24,6 @@
  */
 function IFRA_COMPLIANCE_V5(formula, standardsTable, naturalsTable, inventoryTable, userMatsTable, finishedDosage) {
 
-    // --- Hardcoded Phototoxic Oils List (Additivity Rule) ---
-    // These specific oils must have their (Usage/Limit) summed up.
-    // If Sum > 1.0 (100%), it fails.
-    const PHOTOTOXIC_OILS = [
-        "angelica root oil",
-        "bergamot oil expressed",
-        "bitter orange peel oil expressed", // Matches 'Bitter orange peel oil expressed' in DB
-        "cumin oil",
-        "grapefruit oil expressed",
-        "lemon oil cold pressed",
-        "lime oil expressed",
-        "rue oil"
-    ]; // Must be normalized (lowercase) for matching
-
     // 1. Parsing Helper: Normalize Strings
     const normalize = (str) => str ? str.toString().trim().toLowerCase() : "";
 
@@ -47,12 +33,8 @@ function IFRA_COMPLIANCE_V5(formula, standardsTable, naturalsTable, inventoryTab
     const inventory = inventoryTable ? parseInventory(inventoryTable) : {};
     const userMaterials = userMatsTable ? parseUserMaterials(userMatsTable) : {}; // Use new parser
 
-    // 2. Calculate Exposure (CAS Level)
-    const exposureMap = {};
-    let totalFormulaAmount = 0;
-
     // Helper to process a material
-    const processMaterial = (matName, amount) => {
+    const processMaterial = (exposureMap, matName, amount) => {
         const normName = normalize(matName);
 
         // 1. Resolve Link/Alias
@@ -85,8 +67,33 @@ function IFRA_COMPLIANCE_V5(formula, standardsTable, naturalsTable, inventoryTab
         }
     };
 
-    // Loop Formula Rows
+    // 2. Calculate Exposure (CAS Level)
     if (!Array.isArray(formula)) return [["Error: Formula must be a range"]];
+    const exposure = computeExposure(formula, processMaterial);
+
+    return buildIfraReport(exposure.map, exposure.total, finishedDosage, (cas) => standards.find(s => s.cas.includes(cas)));
+}
+
+// --- Shared Report Builders ---
+
+// --- Hardcoded Phototoxic Oils List (Additivity Rule) ---
+// These specific oils must have their (Usage/Limit) summed up.
+// If Sum > 1.0 (100%), it fails.
+const PHOTOTOXIC_OILS = [
+    "angelica root oil",
+    "bergamot oil expressed",
+    "bitter orange peel oil expressed", // Matches 'Bitter orange peel oil expressed' in DB
+    "cumin oil",
+    "grapefruit oil expressed",
+    "lemon oil cold pressed",
+    "lime oil expressed",
+    "rue oil"
+]; // Must be normalized (lowercase) for matching
+
+function computeExposure(formula, processMaterial) {
+    // Loop Formula Rows; processMaterial(exposureMap, name, amount) adds one line
+    const exposureMap = {};
+    let totalFormulaAmount = 0;
 
     for (let row of formula) {
         const name = row[0];
@@ -97,8 +104,13 @@ function IFRA_COMPLIANCE_V5(formula, standardsTable, naturalsTable, inventoryTab
         if (isNaN(val) || val <= 0) continue;
 
         totalFormulaAmount += val;
-        processMaterial(name, val);
+        processMaterial(exposureMap, name, val);
     }
+    return { map: exposureMap, total: totalFormulaAmount };
+}
+
+function buildIfraReport(exposureMap, totalFormulaAmount, finishedDosage, findStandard) {
+    // findStandard(cas) -> { name, limit, normName } of the regulated group, or undefined
 
     // 3. Group by Standard (Isomer Aggregation) & Prepare Phototoxicity Sum
     const groupedMap = {};
@@ -112,7 +124,7 @@ function IFRA_COMPLIANCE_V5(formula, standardsTable, naturalsTable, inventoryTab
         const currentCas = cas.toString().trim();
         if (!currentCas) continue;
 
-        const std = standards.find(s => s.cas.includes(currentCas));
+        const std = findStandard(currentCas);
 
         if (std) {
             const key = std.name;
@@ -434,9 +446,6 @@ function parseInventory(data) {
  */
 function EU_LABELING_V5(formula, allergensTable, naturalsTable, inventoryTable, userMatsTable, productType, finishedDosage) {
     const normalize = (str) => str ? str.toString().trim().toLowerCase() : "";
-    const typeStr = normalize(productType) === "rinse-off" ? "rinse-off" : "leave-on";
-    const threshold = typeStr === "rinse-off" ? 0.01 : 0.001;
-    const dosageVal = parseDosage(finishedDosage);
 
     // Parse Databases
     const allergens = parseAllergens(allergensTable);
@@ -445,10 +454,7 @@ function EU_LABELING_V5(formula, allergensTable, naturalsTable, inventoryTable,
     const userMaterials = userMatsTable ? parseUserMaterials(userMatsTable) : {};
 
     // Calculate Exposure
-    const exposureMap = {};
-    let totalFormulaAmount = 0;
-
-    const processMaterial = (matName, amount) => {
+    const processMaterial = (exposureMap, matName, amount) => {
         const normName = normalize(matName);
         const resolvedName = inventory[normName] || normName;
         const resolvedNorm = normalize(resolvedName);
@@ -464,32 +470,35 @@ function EU_LABELING_V5(formula, allergensTable, naturalsTable, inventoryTable,
                 addExposure(exposureMap, c.cas, c_amount, matName, "Indirect (Natural)");
             }
         } else {
-            const cleanName = matName.toString().trim();
-            if (/^\d+-\d+-\d+$/.test(cleanName)) {
-                addExposure(exposureMap, cleanName, amount, matName, "Direct");
-            } else {
-                const matchedAllergen = allergens.find(a => a.normName === resolvedNorm);
-                if (matchedAllergen && matchedAllergen.casList.length > 0) {
-                    addExposure(exposureMap, matchedAllergen.casList[0], amount, matName, "Direct");
-                }
-            }
+            addDirectAllergen(exposureMap, matName, amount, resolvedNorm, allergens);
         }
     };
 
     // Loop Formula Rows
     if (!Array.isArray(formula)) return [["Error: Formula must be a range"]];
+    const exposure = computeExposure(formula, processMaterial);
 
-    for (let row of formula) {
-        const name = row[0];
-        const amount = row[1];
-
-        if (!name || amount === "" || amount == null) continue;
-        const val = Number(amount);
-        if (isNaN(val) || val <= 0) continue;
+    return buildEuReport(exposure.map, exposure.total, allergens, productType, finishedDosage);
+}
 
-        totalFormulaAmount += val;
-        processMaterial(name, val);
+function addDirectAllergen(exposureMap, matName, amount, resolvedNorm, allergens) {
+    // Neither a base nor a natural: a literal CAS number, or an allergen named in the formula
+    const cleanName = matName.toString().trim();
+    if (/^\d+-\d+-\d+$/.test(cleanName)) {
+        addExposure(exposureMap, cleanName, amount, matName, "Direct");
+    } else {
+        const matchedAllergen = allergens.find(a => a.normName === resolvedNorm);
+        if (matchedAllergen && matchedAllergen.casList.length > 0) {
+            addExposure(exposureMap, matchedAllergen.casList[0], amount, matName, "Direct");
+        }
     }
+}
+
+function buildEuReport(exposureMap, totalFormulaAmount, allergens, productType, finishedDosage) {
+    const normalize = (str) => str ? str.toString().trim().toLowerCase() : "";
+    const typeStr = normalize(productType) === "rinse-off" ? "rinse-off" : "leave-on";
+    const threshold = typeStr === "rinse-off" ? 0.01 : 0.001;
+    const dosageVal = parseDosage(finishedDosage);
 
     const details = [];
     const requiredLabels = [];
@@ -592,3 +601,183 @@ function parseAllergens(data) {
     }
     return list;
 }
+
+// --- Precomputed Lookup (DB_Lookup tab written by the Python build) ---
+
+const LOOKUP_SHEET = "DB_Lookup";
+const LOOKUP_CACHE_SECONDS = 21600; // CacheService maximum (6 hours)
+const LOOKUP_CHUNK_CHARS = 30000;   // CacheService values are capped at 100KB (UTF-8)
+let LOOKUP_MEMO = null;             // Reused by later calls in the same execution
+
+/**
+ * Same report as IFRA_COMPLIANCE_V5, from the precomputed DB_Lookup tab (no database parsing).
+ * DB_Lookup is written at build time (build_sheet.py --lookup): edits to the DB_* tabs are not seen until a rebuild.
+ *
+ * Usage:
+ * =IFRA_COMPLIANCE_LOOKUP(FormulaRange, Lookup, FinishedDosage)
+ *
+ * Example:
+ * =IFRA_COMPLIANCE_LOOKUP(Formula!A2:B, DB_Lookup!H2, Formula!E1)
+ *
+ * @param {Array<Array<string|number>>} formula The formula range (Name, Amount).
+ * @param {string|Array<Array<string|number>>} lookup The DB hash cell DB_Lookup!H2 (the tab is then read once per database version and kept in CacheService), or the DB_Lookup!A2:H range.
+ * @param {number} finishedDosage [Optional] The concentration percentage of compound in finished product (0-100%, defaults to 100%).
+ * @return The compliance report table.
+ * @customfunction
+ */
+function IFRA_COMPLIANCE_LOOKUP(formula, lookup, finishedDosage) {
+    const normalize = (str) => str ? str.toString().trim().toLowerCase() : "";
+
+    const db = loadLookup(lookup);
+    if (!db) return [["Error: " + LOOKUP_SHEET + " tab not found"]];
+
+    // Every line name is already resolved and flattened: one keyed lookup per line
+    const processMaterial = (exposureMap, matName, amount) => {
+        const line = lookupLine(db, normalize(matName));
+        if (!line) return;
+        for (let part of line[2]) {
+            addExposure(exposureMap, part[0], amount * (part[1] / 100.0), matName, line[1]);
+        }
+    };
+
+    if (!Array.isArray(formula)) return [["Error: Formula must be a range"]];
+    const exposure = computeExposure(formula, processMaterial);
+
+    return buildIfraReport(exposure.map, exposure.total, finishedDosage, (cas) => {
+        const group = Object.prototype.hasOwnProperty.call(db.groups, cas) ? db.groups[cas] : null;
+        return group ? { name: group[0], limit: group[1], normName: group[0].trim().toLowerCase() } : undefined;
+    });
+}
+
+/**
+ * Same report as EU_LABELING_V5, from the precomputed DB_Lookup tab (no database parsing).
+ * DB_Lookup is written at build time (build_sheet.py --lookup): edits to the DB_* tabs are not seen until a rebuild.
+ *
+ * Usage:
+ * =EU_LABELING_LOOKUP(FormulaRange, AllergensRange, Lookup, ProductType, FinishedDosage)
+ *
+ * Example:
+ * =EU_LABELING_LOOKUP(Formula!A2:B, DB_EU_Allergens!A2:B, DB_Lookup!H2, "Leave-on", Formula!E1)
+ *
+ * @param {Array<Array<string|number>>} formula The formula range (Name, Amount).
+ * @param {Array<Array<string|number>>} allergensTable The EU Allergens data (INCI Name, CAS).
+ * @param {string|Array<Array<string|number>>} lookup The DB hash cell DB_Lookup!H2, or the DB_Lookup!A2:H range.
+ * @param {string} productType [Optional] "Leave-on" (default, 0.001% threshold) or "Rinse-off" (0.01% threshold).
+ * @param {number} finishedDosage [Optional] The concentration percentage of compound in finished product (0-100%, defaults to 100%).
+ * @return The EU Allergen Labeling report table.
+ * @customfunction
+ */
+function EU_LABELING_LOOKUP(formula, allergensTable, lookup, productType, finishedDosage) {
+    const normalize = (str) => str ? str.toString().trim().toLowerCase() : "";
+
+    const allergens = parseAllergens(allergensTable);
+    const db = loadLookup(lookup);
+    if (!db) return [["Error: " + LOOKUP_SHEET + " tab not found"]];
+
+    const processMaterial = (exposureMap, matName, amount) => {
+        const normName = normalize(matName);
+        const line = lookupLine(db, normName);
+        if (line && (line[1] === "Indirect (Base)" || line[1] === "Indirect (Natural)")) {
+            for (let part of line[2]) {
+                addExposure(exposureMap, part[0], amount * (part[1] / 100.0), matName, line[1]);
+            }
+        } else {
+            // IFRA direct standards do not count here; the resolved name may still be an allergen
+            addDirectAllergen(exposureMap, matName, amount, line ? line[0] : normName, allergens);
+        }
+    };
+
+    if (!Array.isArray(formula)) return [["Error: Formula must be a range"]];
+    const exposure = computeExposure(formula, processMaterial);
+
+    return buildEuReport(exposure.map, exposure.total, allergens, productType, finishedDosage);
+}
+
+function lookupLine(db, normName) {
+    // [resolvedName, sourceType, [[cas, percentage], ...]] or null
+    return Object.prototype.hasOwnProperty.call(db.lines, normName) ? db.lines[normName] : null;
+}
+
+function parseLookup(data) {
+    // DB_Lookup Format: [Lookup Name, Resolved Name, Source Type, CAS, Percentage, Regulated Group, IFRA Limit, DB Hash]
+    const db = { hash: "", lines: {}, groups: {} };
+    for (let row of data) {
+        if (!row[2]) continue; // Blank rows below the data
+        if (!db.hash && row[7]) db.hash = row[7].toString();
+
+        const key = row[0].toString();
+        if (!Object.prototype.hasOwnProperty.call(db.lines, key)) {
+            db.lines[key] = [row[1].toString(), row[2].toString(), []];
+        }
+        const cas = row[3] ? row[3].toString().trim() : "";
+        if (!cas) continue;
+        db.lines[key][2].push([cas, Number(row[4])]);
+        if (row[5] && !Object.prototype.hasOwnProperty.call(db.groups, cas)) {
+            db.groups[cas] = [row[5].toString(), Number(row[6])];
+        }
+    }
+    return db;
+}
+
+function loadLookup(lookup) {
+    // `lookup` is the DB hash (DB_Lookup!H2) or the DB_Lookup data range itself
+    let rows = null;
+    let hash = "";
+    if (Array.isArray(lookup)) {
+        rows = lookup;
+        hash = rows.length > 0 && rows[0][7] ? rows[0][7].toString() : "";
+    } else if (lookup) {
+        hash = lookup.toString();
+    }
+
+    if (LOOKUP_MEMO && hash && LOOKUP_MEMO.hash === hash) return LOOKUP_MEMO;
+    let db = readCachedLookup(hash);
+    if (!db) {
+        if (!rows) {
+            const sheet = SpreadsheetApp.getActiveSpreadsheet().getSheetByName(LOOKUP_SHEET);
+            if (!sheet) return null;
+            rows = sheet.getDataRange().getValues().slice(1);
+        }
+        db = parseLookup(rows);
+        writeCachedLookup(db);
+    }
+    LOOKUP_MEMO = db;
+    return db;
+}
+
+function readCachedLookup(hash) {
+    // Compact JSON blob split over "<hash>:0", "<hash>:1", ... with the chunk count in "<hash>:n"
+    if (!hash || typeof CacheService === "undefined") return null;
+    try {
+        const cache = CacheService.getScriptCache();
+        const count = Number(cache.get(hash + ":n"));
+        if (!count) return null;
+        const keys = [];
+        for (let i = 0; i < count; i++) keys.push(hash + ":" + i);
+        const chunks = cache.getAll(keys);
+        let json = "";
+        for (let key of keys) {
+            if (chunks[key] == null) return null; // Partly evicted
+            json += chunks[key];
+        }
+        return JSON.parse(json);
+    } catch (e) {
+        return null;
+    }
+}
+
+function writeCachedLookup(db) {
+    if (!db.hash || typeof CacheService === "undefined") return;
+    try {
+        const json = JSON.stringify(db);
+        const values = {};
+        let count = 0;
+        for (let i = 0; i < json.length; i += LOOKUP_CHUNK_CHARS) {
+            values[db.hash + ":" + count++] = json.substring(i, i + LOOKUP_CHUNK_CHARS);
+        }
+        values[db.hash + ":n"] = String(count);
+        CacheService.getScriptCache().putAll(values, LOOKUP_CACHE_SECONDS);
+    } catch (e) {
+        // Over the cache quota: keep working from the tab
+    }
+}
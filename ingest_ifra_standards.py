@@ -0,0 +1,217 @@
+"""Streams the official IFRA Standards overview workbook into DB_Standards.csv.
+
+The overview is read row by row through openpyxl's read_only mode (memory
+stays flat however long the amendment gets). Every product category limit is
+written; Limit_Cat4 stays in column C because Code.js reads DB_Standards!A2:C.
+Before the CSV is replaced, the new standards are diffed against the previous
+amendment (the current CSV, or an older overview workbook): added, removed,
+renamed, CAS-changed, tightened and relaxed limits.
+"""
+import argparse
+import csv
+import json
+import os
+import re
+
+import openpyxl
+
+from compliance_engine import RELEASE_DIR, STANDARDS_LIMIT_CATEGORIES as LIMIT_CATEGORIES, normalize, to_number
+
+OVERVIEW_XLSX = "ifra-51st-amendment-ifra-standards-overview.xlsx"
+STANDARDS_CSV = os.path.join(RELEASE_DIR, "DB_Standards.csv")
+DIFF_PATH = "ifra_amendment_diff.json"
+
+# Category 4 (fine fragrance) first, so A:C keeps the Code.js layout
+STANDARDS_HEADER = ["Ingredient_Name", "CAS_Numbers"] + [f"Limit_Cat{c}" for c in LIMIT_CATEGORIES]
+
+# Local display names that differ from the overview (matched by name in formulas)
+LOCAL_NAMES = {
+    "2,6,6-Trimethylcyclohex-1,3-dienyl methanal": "Safranal (2,6,6-Trimethylcyclohex-1,3-dienyl methanal)"
+}
+
+# Cells without a usable number: prohibitions are 0%, specifications / notes carry no % cap
+PROHIBITED_LIMIT = 0.0
+UNRESTRICTED_LIMIT = 100.0
+
+_LEADING_NUMBER = re.compile(r"^\s*(\d+(?:[.,]\d+)?)")
+
+
+def parse_limit(value, standard_type=""):
+    # "0,40" -> 0.4, "0.0015 (5-MOP)" -> 0.0015, "No Restriction" / "See Notebox" -> 100.0
+    if isinstance(value, bool) or (isinstance(value, str) and not value.strip()):
+        value = None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        match = _LEADING_NUMBER.match(value)
+        if match:
+            return float(match.group(1).replace(",", "."))
+        return UNRESTRICTED_LIMIT
+    return PROHIBITED_LIMIT if standard_type == "PROHIBITION" else UNRESTRICTED_LIMIT
+
+
+def split_cas(value):
+    if value is None:
+        return []
+    return [c.strip() for c in str(value).replace("\r", "\n").split("\n") if c.strip()]
+
+
+def iter_overview(xlsx_path=OVERVIEW_XLSX):
+    # Yields {"key", "amendment", "name", "cas", "type", "limits": {category: float}}
+    wb = openpyxl.load_workbook(xlsx_path, read_only=True, data_only=True)
+    try:
+        columns = None
+        for row in wb.worksheets[0].iter_rows(values_only=True):
+            if columns is None:
+                # Disclaimer rows come first; the header row starts with "Key"
+                if row and row[0] == "Key":
+                    columns = {str(h).strip(): i for i, h in enumerate(row) if h is not None}
+                    name_col = columns["Name of the IFRA Standard"]
+                    cas_col = columns["CAS numbers"]
+                    type_col = columns.get("IFRA Standard type")
+                    amendment_col = columns.get("Amendment number")
+                    category_cols = {c: columns[f"Category {c} (%)"] for c in LIMIT_CATEGORIES}
+                continue
+            if not row or not row[0] or row[name_col] in (None, ""):
+                continue
+            standard_type = str(row[type_col]).strip() if type_col is not None and row[type_col] else ""
+            name = str(row[name_col]).strip()
+            yield {
+                "key": str(row[0]).strip(),
+                "amendment": row[amendment_col] if amendment_col is not None else None,
+                "name": LOCAL_NAMES.get(name, name),
+                "cas": split_cas(row[cas_col]),
+                "type": standard_type,
+                "limits": {c: parse_limit(row[i], standard_type) for c, i in category_cols.items()}
+            }
+        if columns is None:
+            raise ValueError(f"{xlsx_path}: no header row starting with 'Key' found")
+    finally:
+        wb.close()
+
+
+def read_standards_csv(csv_path=STANDARDS_CSV):
+    # Previous DB_Standards.csv in the same shape as iter_overview (only the categories it has)
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        categories = {h[len("Limit_Cat"):]: i for i, h in enumerate(header) if h.startswith("Limit_Cat")}
+        standards = []
+        for row in reader:
+            if not row or not row[0]:
+                continue
+            limits = {}
+            for category, i in categories.items():
+                limit = to_number(row[i]) if i < len(row) else None
+                if limit is not None:
+                    limits[category] = limit
+            standards.append({
+                "name": row[0],
+                "cas": [c for c in row[1].split("|") if c] if len(row) > 1 else [],
+                "limits": limits
+            })
+    return standards
+
+
+def load_standards(path):
+    if path.lower().endswith(".xlsx"):
+        return list(iter_overview(path))
+    return read_standards_csv(path)
+
+
+def write_standards_csv(standards, csv_path=STANDARDS_CSV):
+    tmp_path = csv_path + ".tmp"
+    with open(tmp_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f, lineterminator="\n")
+        writer.writerow(STANDARDS_HEADER)
+        for std in standards:
+            writer.writerow([std["name"], "|".join(std["cas"])] + [repr(std["limits"][c]) for c in LIMIT_CATEGORIES])
+    os.replace(tmp_path, csv_path)
+    return len(standards)
+
+
+def diff_standards(previous, current):
+    # Structured amendment diff, matched by name first and by shared CAS for renames
+    old_by_name = {normalize(s["name"]): s for s in previous}
+    new_by_name = {normalize(s["name"]): s for s in current}
+    pairs = [(old_by_name[k], new_by_name[k]) for k in new_by_name if k in old_by_name]
+    added = [s for k, s in new_by_name.items() if k not in old_by_name]
+    removed = [s for k, s in old_by_name.items() if k not in new_by_name]
+
+    renamed = []
+    for new in list(added):
+        match = next((old for old in removed if set(old["cas"]) & set(new["cas"])), None)
+        if match is not None:
+            removed.remove(match)
+            added.remove(new)
+            pairs.append((match, new))
+            renamed.append({"from": match["name"], "to": new["name"]})
+
+    tightened, relaxed, cas_changed = [], [], []
+    for old, new in pairs:
+        for category in LIMIT_CATEGORIES:
+            before, after = old["limits"].get(category), new["limits"].get(category)
+            if before is None or after is None or before == after:
+                continue
+            change = {"name": new["name"], "category": category, "from": before, "to": after}
+            (tightened if after < before else relaxed).append(change)
+        if set(old["cas"]) != set(new["cas"]):
+            cas_changed.append({
+                "name": new["name"],
+                "added": [c for c in new["cas"] if c not in old["cas"]],
+                "removed": [c for c in old["cas"] if c not in new["cas"]]
+            })
+
+    return {
+        "added": [{"name": s["name"], "cas": s["cas"], "limits": s["limits"]} for s in added],
+        "removed": [{"name": s["name"], "cas": s["cas"]} for s in removed],
+        "renamed": renamed,
+        "cas_changed": cas_changed,
+        "tightened": tightened,
+        "relaxed": relaxed
+    }
+
+
+def ingest_overview(xlsx_path=OVERVIEW_XLSX, csv_path=STANDARDS_CSV, previous_path=None, diff_path=DIFF_PATH,
+                    dry_run=False):
+    print(f"🚀 Ingesting IFRA Standards overview {xlsx_path}...")
+    current = list(iter_overview(xlsx_path))
+    amendments = sorted({s["amendment"] for s in current if isinstance(s["amendment"], int)})
+    print(f"  Read {len(current)} standards (amendments {', '.join(map(str, amendments)) or '?'}).")
+
+    previous_path = previous_path or csv_path
+    diff = None
+    if os.path.exists(previous_path):
+        diff = diff_standards(load_standards(previous_path), current)
+        for kind in ("added", "removed", "renamed", "cas_changed", "tightened", "relaxed"):
+            print(f"  {kind.replace('_', ' ').capitalize()}: {len(diff[kind])}")
+        for change in diff["tightened"]:
+            print(f"    👀 {change['name']} (Cat {change['category']}): {change['from']}% -> {change['to']}%")
+        if diff_path:
+            with open(diff_path, "w", encoding="utf-8") as f:
+                json.dump({"previous": previous_path, "current": xlsx_path, **diff}, f, indent=2, ensure_ascii=False)
+            print(f"  Amendment diff written to {diff_path}")
+
+    if dry_run:
+        print("✅ Dry run: DB_Standards.csv left untouched.")
+    else:
+        count = write_standards_csv(current, csv_path)
+        print(f"✅ Wrote {count} standards x {len(LIMIT_CATEGORIES)} categories to {csv_path}")
+    return current, diff
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Regenerate DB_Standards.csv from the IFRA Standards overview.")
+    parser.add_argument("xlsx", nargs="?", default=OVERVIEW_XLSX, help="IFRA Standards overview workbook")
+    parser.add_argument("--out", default=STANDARDS_CSV, help="DB_Standards.csv to regenerate")
+    parser.add_argument("--previous", default=None, help="Previous amendment (CSV or overview .xlsx); default --out")
+    parser.add_argument("--diff", default=DIFF_PATH, help="Where to write the JSON amendment diff")
+    parser.add_argument("--dry-run", action="store_true", help="Only print / write the diff")
+    parser.add_argument("--rebuild", default=None, metavar="VERSION",
+                        help="Afterwards swap the new DB_Standards tab into this workbook version")
+    args = parser.parse_args()
+
+    ingest_overview(args.xlsx, args.out, args.previous, args.diff, args.dry_run)
+    if args.rebuild and not args.dry_run:
+        from build_sheet import rebuild_tabs
+        rebuild_tabs(["DB_Standards"], args.rebuild)
@@ -0,0 +1,83 @@
+"""Precomputed DB_Lookup tab: every formula line name already resolved and flattened.
+
+On every recalculation Code.js re-parses DB_Standards, DB_Naturals,
+DB_Inventory and DB_User_Materials (guessing the column layout of each
+user-material row) before it can look a single line up. DB_Lookup holds the
+outcome of that work, one row per (lookup name, constituent): inventory
+aliases applied, base > natural > direct priority decided, and every CAS
+assigned to its regulated IFRA group and Category 4 limit. Percentages are
+the source cells themselves, so Code.js computes amount * (pct / 100) exactly
+as IFRA_COMPLIANCE_V5 does. The DB content hash sits in H2;
+IFRA_COMPLIANCE_LOOKUP / EU_LABELING_LOOKUP in Code.js keep the parsed tab as
+a compact JSON blob in CacheService under that hash, so a recalculation is one
+keyed lookup per formula line. The tab is opt-in (build_sheet.py --lookup): it
+is a build-time copy, so DB_* edits made in Sheets need a rebuild.
+"""
+import argparse
+import csv
+
+from compliance_engine import DB_FILES, RELEASE_DIR, SOURCE_DIRECT, ReferenceDB
+from db_snapshot import db_content_hash, iter_db_table
+
+LOOKUP_TAB = "DB_Lookup"
+LOOKUP_HEADER = ["Lookup_Name", "Resolved_Name", "Source_Type", "CAS", "Percentage", "Regulated_Group", "IFRA_Limit",
+                 "DB_Hash"]
+# Aliases whose target has no composition: only the resolved name matters (EU allergen names)
+SOURCE_ALIAS = "Alias"
+
+
+def tab_reference_db(release_dir=RELEASE_DIR, source=None):
+    # ReferenceDB parsed from the same typed cells the workbook tabs are written from
+    return ReferenceDB.from_tables({tab_name: iter_db_table(tab_name, release_dir, source)[1] for tab_name in DB_FILES})
+
+
+def lookup_names(db):
+    # Every normalized name a formula line can resolve through: bases, naturals, standards, stock aliases
+    names = dict.fromkeys(db.user_materials)
+    names.update(dict.fromkeys(db.naturals))
+    names.update(dict.fromkeys(std.norm_name for std in db.standards))
+    names.update(dict.fromkeys(db.inventory))
+    return list(names)
+
+
+def iter_lookup_rows(db, db_hash=""):
+    # DB_Lookup data rows; the DB hash is written once, in the first row
+    for name in lookup_names(db):
+        resolved = db.resolve_name(name)
+        parts, source_type = db.material_parts(resolved)
+        # Same CAS filter as ReferenceDB.material_contributions
+        parts = [(str(c["cas"]).strip(), c["percentage"]) for c in parts if c["cas"] and str(c["cas"]).strip()]
+        if not parts:
+            if source_type == SOURCE_DIRECT:
+                if resolved == name:
+                    continue
+                source_type = SOURCE_ALIAS
+            # A base / natural without any CAS still wins over the later fallbacks
+            parts = [("", "")]
+        for cas, pct in parts:
+            std = db.std_by_cas.get(cas) if cas else None
+            row = [name, resolved, source_type, cas, pct, std.name if std else "", std.limit if std else "", db_hash]
+            db_hash = ""
+            yield row
+
+
+def lookup_table(release_dir=RELEASE_DIR, source=None):
+    # (header, rows) for the DB_Lookup tab, same shape as db_snapshot.iter_db_table
+    db = tab_reference_db(release_dir, source)
+    return list(LOOKUP_HEADER), iter_lookup_rows(db, db_content_hash(release_dir))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write the precomputed DB_Lookup tab as a CSV.")
+    parser.add_argument("--out", default="DB_Lookup.csv", help="CSV path")
+    args = parser.parse_args()
+
+    header, rows = lookup_table()
+    with open(args.out, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        count = 0
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    print(f"✅ Wrote {count} lookup rows to {args.out}")
@@ -0,0 +1,235 @@
+"""Recursive flattening of nested bases, dilutions and alias chains.
+
+Code.js expands a formula line exactly one level (user base > natural >
+direct standard). NestedReferenceDB keeps that priority at every level but
+keeps going: a constituent whose name resolves (through the full inventory
+alias chain) to another user base or natural is replaced by that material's
+own flattened composition, scaled by its percentage. The rule is the same
+at every depth as for a formula line: a nested base or natural contributes
+its constituents only, never its own CAS as well (so a nested "Bergamot oil
+expressed" is not counted twice towards the phototoxicity sum).
+
+Every flattened composition is memoized. The memo records which names each
+entry depends on, so apply_row_change() only drops the entries that can see
+the changed row (and the formula-line lookups built on them).
+"""
+from compliance_engine import (
+    SOURCE_BASE, SOURCE_NATURAL, ReferenceDB, load_reference_db, normalize,
+    parse_inventory, parse_naturals, parse_standards, parse_user_materials
+)
+
+
+class MaterialCycleError(ValueError):
+    def __init__(self, path, kind="material"):
+        self.path = list(path)
+        self.kind = kind
+        super().__init__(f"Cyclic {kind} reference: {' -> '.join(self.path)}")
+
+
+class NestedReferenceDB(ReferenceDB):
+    def __init__(self, standards, naturals, inventory, user_materials, allergens=None, interners=None):
+        super().__init__(standards, naturals, inventory, user_materials, allergens, interners)
+        self._dependents = {}
+
+    @classmethod
+    def from_reference_db(cls, db):
+        # Copies the composition arrays (sharing the interned ids) so row changes never leak into `db`
+        return cls(
+            list(db.standards),
+            db.naturals.copy(),
+            dict(db.inventory),
+            db.user_materials.copy(),
+            db.allergens,
+            interners=(db.names, db.cas, db.constituents)
+        )
+
+    # --- Dependency tracking ---
+
+    def _depend(self, node, entry):
+        self._dependents.setdefault(node, set()).add(entry)
+
+    def _invalidate(self, node):
+        pending = [node]
+        seen = set()
+        while pending:
+            n = pending.pop()
+            if n in seen:
+                continue
+            seen.add(n)
+            for kind, key in self._dependents.pop(n, ()):
+                if kind == "mat":
+                    self._material_cache.pop(key, None)
+                    self._material_id_cache.pop(key, None)
+                    pending.append(key)
+                else:
+                    self._line_cache.pop(key, None)
+                    self._line_id_cache.pop(key, None)
+
+    # --- Resolution ---
+
+    def _alias_chain(self, norm_name):
+        # Follows Stock Name -> Linked Name until it stops changing
+        chain = [norm_name]
+        current = norm_name
+        while True:
+            linked = self.inventory.get(current)
+            nxt = normalize(linked) if linked else current
+            if nxt == current:
+                return chain
+            if nxt in chain:
+                raise MaterialCycleError(chain + [nxt], kind="alias")
+            chain.append(nxt)
+            current = nxt
+
+    def resolve_name(self, mat_name):
+        return self._alias_chain(normalize(mat_name))[-1]
+
+    def line_contributions(self, mat_name):
+        cached = self._line_cache.get(mat_name)
+        if cached is None:
+            chain = self._alias_chain(normalize(mat_name))
+            cached = self._line_cache[mat_name] = self.material_contributions(chain[-1])
+            for node in chain:
+                self._depend(node, ("line", mat_name))
+        return cached
+
+    def line_ids(self, mat_name):
+        # The flattened compositions are (cas, fraction) strings: intern them once per line name
+        cached = self._line_id_cache.get(mat_name)
+        if cached is None:
+            cached = self._line_id_cache[mat_name] = self.intern_line(mat_name, *self.line_contributions(mat_name))
+        return cached
+
+    def material_contributions(self, resolved_norm):
+        return self._flatten(resolved_norm, ())
+
+    def _flatten(self, key, stack):
+        cached = self._material_cache.get(key)
+        if cached is not None:
+            return cached
+        if key in stack:
+            raise MaterialCycleError(stack[stack.index(key):] + (key,))
+        stack = stack + (key,)
+        self._depend(key, ("mat", key))
+
+        if key in self.user_materials:
+            parts, source_type = self.user_materials[key], SOURCE_BASE
+        elif key in self.naturals:
+            parts, source_type = self.naturals[key], SOURCE_NATURAL
+        else:
+            cached = super().material_contributions(key)
+            self._material_cache[key] = cached
+            return cached
+
+        contributions = []
+        for c in parts:
+            fraction = c["percentage"] / 100.0
+            cas = str(c["cas"]).strip() if c["cas"] else ""
+            child = self._composite_child(c.get("chemical"), key)
+            if child is None:
+                if cas:
+                    contributions.append((cas, fraction))
+                continue
+            sub, _ = self._flatten(child, stack)
+            contributions.extend((sub_cas, fraction * sub_fraction) for sub_cas, sub_fraction in sub)
+
+        cached = (tuple(contributions), source_type)
+        self._material_cache[key] = cached
+        return cached
+
+    def _composite_child(self, constituent_name, parent_key):
+        # Resolved name of a constituent that is itself a base / natural, else None
+        if not constituent_name:
+            return None
+        chain = self._alias_chain(normalize(constituent_name))
+        for node in chain:
+            self._depend(node, ("mat", parent_key))
+        resolved = chain[-1]
+        if resolved == parent_key:
+            return None
+        if resolved in self.user_materials or resolved in self.naturals:
+            return resolved
+        return None
+
+    def flatten_all(self):
+        # Precomputes every material; returns {name: MaterialCycleError} for cyclic ones
+        errors = {}
+        for key in dict.fromkeys([*self.user_materials, *self.naturals]):
+            try:
+                self.material_contributions(key)
+            except MaterialCycleError as e:
+                errors[key] = e
+        return errors
+
+    # --- Incremental updates ---
+
+    def apply_row_change(self, tab_name, old_row=None, new_row=None):
+        # Applies one edited / added / deleted source row and invalidates only
+        # the memo entries that depend on it. Returns the touched names.
+        touched = set()
+        if tab_name in ("DB_User_Materials", "DB_Naturals"):
+            table = self.user_materials if tab_name == "DB_User_Materials" else self.naturals
+            parse = parse_user_materials if tab_name == "DB_User_Materials" else parse_naturals
+            if old_row is not None:
+                for key, entries in parse([old_row]).items():
+                    current = table.get(key, [])
+                    for entry in entries:
+                        if entry in current:
+                            current.remove(entry)
+                    if key in table:
+                        # Rows come back materialized from the packed table: write the edit back
+                        if current:
+                            table[key] = current
+                        else:
+                            del table[key]
+                    touched.add(key)
+            if new_row is not None:
+                for key, entries in parse([new_row]).items():
+                    table[key] = table.get(key, []) + entries
+                    touched.add(key)
+        elif tab_name == "DB_Inventory":
+            if old_row is not None:
+                for key, linked in parse_inventory([old_row]).items():
+                    if self.inventory.get(key) == linked:
+                        del self.inventory[key]
+                    touched.add(key)
+            if new_row is not None:
+                for key, linked in parse_inventory([new_row]).items():
+                    self.inventory[key] = linked
+                    touched.add(key)
+        elif tab_name == "DB_Standards":
+            if old_row is not None:
+                for std in parse_standards([old_row]):
+                    if std in self.standards:
+                        self.standards.remove(std)
+                    touched.add(std.norm_name)
+            if new_row is not None:
+                for std in parse_standards([new_row]):
+                    self.standards.append(std)
+                    touched.add(std.norm_name)
+            # Only direct-standard lookups (keyed by the standard's name) read DB_Standards
+            self._index_standards()
+        else:
+            raise ValueError(f"Unsupported table for row changes: {tab_name}")
+
+        for key in touched:
+            self._invalidate(key)
+        return touched
+
+
+def load_nested_reference_db(release_dir=None):
+    db = load_reference_db(release_dir) if release_dir else load_reference_db()
+    return NestedReferenceDB.from_reference_db(db)
+
+
+if __name__ == "__main__":
+    print("🚀 Flattening every material (bases, dilutions, naturals)...")
+    db = load_nested_reference_db()
+    errors = db.flatten_all()
+    nested = [k for k in db.user_materials
+              if any(db._composite_child(c.get("chemical"), k) for c in db.user_materials[k])]
+    print(f"  {len(db._material_cache)} materials flattened, {len(nested)} contain nested materials.")
+    for key, error in errors.items():
+        print(f"❌ {key}: {error}")
+    if not errors:
+        print("✅ No cyclic material or alias references found.")
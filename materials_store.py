@@ -0,0 +1,431 @@
+"""Indexed SQLite materials store (SQLModel) for the DB_* reference tables.
+
+Every table keeps the CSV row order (`row_index`) and a stable `row_key`
+(natural key + occurrence number, so duplicate CSV rows survive). Rows the
+Code.js parsers would skip are not stored, and DB_User_Materials rows go
+through the same per-row layout detection as parse_user_materials. Re-imports
+are bulk upserts on `row_key`; rows that disappeared from the CSV are pruned.
+Tables whose CSV hash is unchanged are skipped entirely.
+"""
+import argparse
+import json
+import os
+import time
+from typing import Optional
+
+from sqlalchemy import delete, event, inspect, select
+from sqlalchemy.dialects.sqlite import insert
+from sqlmodel import Field, Session, SQLModel, create_engine
+
+from compliance_engine import (
+    DB_FILES, RELEASE_DIR, SOURCE_BASE, SOURCE_NATURAL, ReferenceDB, iter_naturals, iter_user_materials, normalize,
+    parse_allergens, parse_inventory, parse_naturals, parse_standards, parse_user_materials, split_user_material_row,
+    to_number
+)
+from db_snapshot import combine_hashes, file_sha256, read_csv_table
+
+STORE_PATH = "materials.db"
+
+
+# --- Schema ---
+
+class Standard(SQLModel, table=True):
+    __tablename__ = "standards"
+    id: Optional[int] = Field(default=None, primary_key=True)
+    row_key: str = Field(unique=True)
+    row_index: int = Field(index=True)
+    batch: int
+    name: str
+    norm_name: str = Field(index=True)
+    cas_numbers: str = ""
+    limit_cat4: Optional[float] = None
+    other_limits: str = "[]"  # JSON list of the remaining Limit_Cat* cells, in CSV order
+
+
+class StandardCAS(SQLModel, table=True):
+    __tablename__ = "standard_cas"
+    id: Optional[int] = Field(default=None, primary_key=True)
+    standard_row_key: str = Field(index=True)
+    position: int
+    cas: str = Field(index=True)
+
+
+class NaturalConstituent(SQLModel, table=True):
+    __tablename__ = "naturals"
+    id: Optional[int] = Field(default=None, primary_key=True)
+    row_key: str = Field(unique=True)
+    row_index: int = Field(index=True)
+    batch: int
+    natural_name: str
+    norm_name: str = Field(index=True)
+    constituent_name: str = ""
+    cas: str = Field(default="", index=True)
+    percentage: Optional[float] = None
+
+
+class InventoryAlias(SQLModel, table=True):
+    __tablename__ = "inventory"
+    id: Optional[int] = Field(default=None, primary_key=True)
+    row_key: str = Field(unique=True)
+    row_index: int = Field(index=True)
+    batch: int
+    stock_name: str
+    norm_stock_name: str = Field(index=True)
+    linked_name: str = ""
+    note: str = ""
+
+
+class UserMaterialConstituent(SQLModel, table=True):
+    __tablename__ = "user_materials"
+    id: Optional[int] = Field(default=None, primary_key=True)
+    row_key: str = Field(unique=True)
+    row_index: int = Field(index=True)
+    batch: int
+    sku: str = Field(default="", index=True)
+    material_name: str
+    norm_name: str = Field(index=True)
+    constituent: str = ""
+    norm_constituent: str = Field(default="", index=True)
+    cas: str = Field(default="", index=True)
+    percentage: Optional[float] = None
+    cells: str = "[]"  # JSON list of the CSV row as written (4- and 5-column layouts both round-trip)
+
+
+class EUAllergen(SQLModel, table=True):
+    __tablename__ = "eu_allergens"
+    id: Optional[int] = Field(default=None, primary_key=True)
+    row_key: str = Field(unique=True)
+    row_index: int = Field(index=True)
+    batch: int
+    name: str
+    norm_name: str = Field(index=True)
+    cas_numbers: str = ""
+
+
+class AllergenCAS(SQLModel, table=True):
+    __tablename__ = "allergen_cas"
+    id: Optional[int] = Field(default=None, primary_key=True)
+    allergen_row_key: str = Field(index=True)
+    position: int
+    cas: str = Field(index=True)
+
+
+class ImportState(SQLModel, table=True):
+    __tablename__ = "import_state"
+    tab_name: str = Field(primary_key=True)
+    sha256: str
+    header: str  # JSON list, to reproduce the CSV header exactly
+    rows: int
+    imported_at: float
+
+
+# --- Row mapping (CSV row <-> table record) ---
+# Rows the Code.js parsers skip (no name, a non-numeric limit / percentage ...) map to None and are not stored
+
+def _text(value):
+    return "" if value is None else str(value)
+
+
+def _number(value):
+    # Blank cells stay blank (None) so the CSV round-trips; they still read as 0 like Number("")
+    return None if value in ("", None) else to_number(value)
+
+
+def _cell(value):
+    return "" if value is None else value
+
+
+def _standard_record(r):
+    if not r or not r[0] or to_number(r[2] if len(r) > 2 else None) is None:
+        return None
+    return {"name": _text(r[0]), "norm_name": normalize(r[0]), "cas_numbers": _text(r[1]),
+            "limit_cat4": _number(r[2]), "other_limits": json.dumps(list(r[3:]))}
+
+
+def _natural_record(r):
+    if not r or not r[0] or to_number(r[3] if len(r) > 3 else None) is None:
+        return None
+    return {"natural_name": _text(r[0]), "norm_name": normalize(r[0]), "constituent_name": _text(r[1]),
+            "cas": _text(r[2]), "percentage": _number(r[3])}
+
+
+def _user_material_record(r):
+    # Same per-row layout detection as parse_user_materials; `cells` keeps the row as written
+    parsed = split_user_material_row(r)
+    if parsed is None:
+        return None
+    sku, mat_name, chemical, cas, pct = parsed
+    return {"sku": sku, "material_name": mat_name, "norm_name": mat_name.strip().lower(),
+            "constituent": chemical, "norm_constituent": normalize(chemical), "cas": cas, "percentage": pct,
+            "cells": json.dumps(list(r), ensure_ascii=False)}
+
+
+TABLES = {
+    # tab_name: (model, natural key columns, csv row -> record or None, record -> csv row)
+    "DB_Standards": (
+        Standard, ("name",), _standard_record,
+        lambda m: [m.name, m.cas_numbers, _cell(m.limit_cat4), *json.loads(m.other_limits)]
+    ),
+    "DB_Naturals": (
+        NaturalConstituent, ("natural_name", "constituent_name", "cas"), _natural_record,
+        lambda m: [m.natural_name, m.constituent_name, m.cas, _cell(m.percentage)]
+    ),
+    "DB_Inventory": (
+        InventoryAlias, ("stock_name",),
+        lambda r: {"stock_name": _text(r[0]), "norm_stock_name": normalize(r[0]), "linked_name": _text(r[1]),
+                   "note": _text(r[2]) if len(r) > 2 else ""} if len(r) >= 2 else None,
+        lambda m: [m.stock_name, m.linked_name, m.note]
+    ),
+    "DB_User_Materials": (
+        UserMaterialConstituent, ("sku", "material_name", "constituent", "cas"), _user_material_record,
+        lambda m: json.loads(m.cells)
+    ),
+    "DB_EU_Allergens": (
+        EUAllergen, ("name",),
+        lambda r: {"name": _text(r[0]), "norm_name": normalize(r[0]),
+                   "cas_numbers": _text(r[1]) if len(r) > 1 else ""} if r else None,
+        lambda m: [m.name, m.cas_numbers]
+    )
+}
+
+
+def _with_row_keys(records, key_columns):
+    # row_key = natural key + occurrence, so duplicate CSV rows stay distinct
+    seen = {}
+    for record in records:
+        natural = tuple(record[c] for c in key_columns)
+        occurrence = seen.get(natural, 0)
+        seen[natural] = occurrence + 1
+        record["row_key"] = json.dumps([*natural, occurrence], ensure_ascii=False)
+    return records
+
+
+# --- Store ---
+
+class MaterialsStore:
+    def __init__(self, path=STORE_PATH):
+        self.path = path
+        self.engine = create_engine(f"sqlite:///{path}")
+
+        @event.listens_for(self.engine, "connect")
+        def _pragmas(dbapi_conn, _):
+            cursor = dbapi_conn.cursor()
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=NORMAL")
+            cursor.close()
+
+        # The store is a cache of the CSVs: an outdated schema is simply rebuilt
+        existing = inspect(self.engine)
+        for table in SQLModel.metadata.sorted_tables:
+            if existing.has_table(table.name) and \
+                    {c.name for c in table.columns} - {c["name"] for c in existing.get_columns(table.name)}:
+                SQLModel.metadata.drop_all(self.engine)
+                break
+        SQLModel.metadata.create_all(self.engine)
+
+    # Import
+
+    def import_csv_dir(self, release_dir=RELEASE_DIR, force=False, log=print):
+        # `log` takes the progress lines (the minipinscher CLI sends them to stderr)
+        log(f"🚀 Importing reference tables from {release_dir} into {self.path}...")
+        batch = time.time_ns()
+        imported = []
+        with Session(self.engine) as session:
+            for tab_name, csv_file in DB_FILES.items():
+                csv_p = os.path.join(release_dir, csv_file)
+                if not os.path.exists(csv_p):
+                    log(f"  Skipped '{tab_name}': {csv_p} not found.")
+                    continue
+                sha = file_sha256(csv_p)
+                state = session.get(ImportState, tab_name)
+                if state is not None and state.sha256 == sha and not force:
+                    log(f"  '{tab_name}' unchanged ({state.rows} rows).")
+                    continue
+
+                header, rows, _ = read_csv_table(csv_p)
+                count = self._upsert_table(session, tab_name, rows, batch)
+                session.merge(ImportState(tab_name=tab_name, sha256=sha, header=json.dumps(header),
+                                          rows=count, imported_at=time.time()))
+                imported.append(tab_name)
+                log(f"  Upserted '{tab_name}' ({count} rows).")
+            session.commit()
+        log(f"✅ Materials store is up to date ({len(imported)} tables imported).")
+        return imported
+
+    def _upsert_table(self, session, tab_name, rows, batch):
+        model, key_columns, to_record, _ = TABLES[tab_name]
+        table = model.__table__
+        records = _with_row_keys([record for record in map(to_record, rows) if record is not None], key_columns)
+        for i, record in enumerate(records):
+            record["row_index"] = i
+            record["batch"] = batch
+
+        if records:
+            stmt = insert(table)
+            update_cols = {c: stmt.excluded[c] for c in records[0] if c != "row_key"}
+            session.execute(stmt.on_conflict_do_update(index_elements=["row_key"], set_=update_cols), records)
+        session.execute(delete(table).where(table.c.batch != batch))
+
+        # Derived CAS link tables are rebuilt from the pipe-joined column
+        if tab_name in ("DB_Standards", "DB_EU_Allergens"):
+            link, key_col = (StandardCAS, "standard_row_key") if tab_name == "DB_Standards" \
+                else (AllergenCAS, "allergen_row_key")
+            session.execute(delete(link.__table__))
+            links = [
+                {key_col: r["row_key"], "position": p, "cas": cas.strip()}
+                for r in records for p, cas in enumerate(r["cas_numbers"].split("|")) if r["cas_numbers"] and cas.strip()
+            ]
+            if links:
+                session.execute(insert(link.__table__), links)
+        return len(records)
+
+    # Row access (same shape as the CSV, in CSV order)
+
+    def columns(self, tab_name):
+        with Session(self.engine) as session:
+            state = session.get(ImportState, tab_name)
+            return json.loads(state.header) if state else []
+
+    def iter_rows(self, tab_name):
+        model, _, _, to_row = TABLES[tab_name]
+        with Session(self.engine) as session:
+            for m in session.execute(select(model).order_by(model.row_index)).scalars():
+                yield to_row(m)
+
+    def table(self, tab_name):
+        return self.columns(tab_name), list(self.iter_rows(tab_name))
+
+    def content_hash(self):
+        # db_content_hash() of the CSVs last imported, without re-reading them
+        with Session(self.engine) as session:
+            return combine_hashes({s.tab_name: s.sha256 for s in session.execute(select(ImportState)).scalars()})
+
+    # Indexed queries
+
+    def materials_containing_cas(self, cas):
+        cas = str(cas).strip()
+        results = []
+        with Session(self.engine) as session:
+            stmt = select(UserMaterialConstituent).where(UserMaterialConstituent.cas == cas) \
+                .order_by(UserMaterialConstituent.row_index)
+            for m in session.execute(stmt).scalars():
+                results.append({"material": m.material_name, "source": SOURCE_BASE, "sku": m.sku,
+                                "constituent": m.constituent, "percentage": m.percentage})
+            stmt = select(NaturalConstituent).where(NaturalConstituent.cas == cas) \
+                .order_by(NaturalConstituent.row_index)
+            for m in session.execute(stmt).scalars():
+                results.append({"material": m.natural_name, "source": SOURCE_NATURAL, "sku": "",
+                                "constituent": m.constituent_name, "percentage": m.percentage})
+        return results
+
+    def bases_using_sku(self, sku):
+        # Materials registered under `sku` plus every user base that lists one of them as a constituent
+        with Session(self.engine) as session:
+            stmt = select(UserMaterialConstituent.norm_name, UserMaterialConstituent.material_name) \
+                .where(UserMaterialConstituent.sku == str(sku)).distinct()
+            own = {norm: name for norm, name in session.execute(stmt)}
+            if not own:
+                return []
+            stmt = select(UserMaterialConstituent.material_name) \
+                .where(UserMaterialConstituent.norm_constituent.in_(list(own))) \
+                .where(UserMaterialConstituent.norm_name.not_in(list(own))) \
+                .order_by(UserMaterialConstituent.row_index)
+            using = [name for (name,) in session.execute(stmt)]
+        return list(dict.fromkeys([*own.values(), *using]))
+
+    def standard_for_cas(self, cas):
+        with Session(self.engine) as session:
+            stmt = select(Standard).join(StandardCAS, StandardCAS.standard_row_key == Standard.row_key) \
+                .where(StandardCAS.cas == str(cas).strip()).order_by(Standard.row_index).limit(1)
+            return session.execute(stmt).scalars().first()
+
+    def reference_db(self):
+        # Full in-memory ReferenceDB built from the store (CSV order preserved)
+        rows = {tab_name: list(self.iter_rows(tab_name)) for tab_name in DB_FILES}
+        return ReferenceDB(
+            parse_standards(rows["DB_Standards"]),
+            iter_naturals(rows["DB_Naturals"]),
+            parse_inventory(rows["DB_Inventory"]),
+            iter_user_materials(rows["DB_User_Materials"]),
+            parse_allergens(rows["DB_EU_Allergens"])
+        )
+
+
+class StoreReferenceDB(ReferenceDB):
+    # ReferenceDB that looks materials and aliases up in SQLite on demand
+    # (memoized), instead of loading every constituent row up front.
+    def __init__(self, store):
+        super().__init__(
+            parse_standards(store.iter_rows("DB_Standards")), {}, {}, {},
+            parse_allergens(store.iter_rows("DB_EU_Allergens"))
+        )
+        self.store = store
+        self.content_hash = store.content_hash()
+        self._session = Session(store.engine)
+        self._alias_cache = {}
+
+    def resolve_name(self, mat_name):
+        norm_name = normalize(mat_name)
+        resolved = self._alias_cache.get(norm_name)
+        if resolved is None:
+            stmt = select(InventoryAlias.linked_name).where(InventoryAlias.norm_stock_name == norm_name) \
+                .where(InventoryAlias.linked_name != "").order_by(InventoryAlias.row_index.desc()).limit(1)
+            linked = self._session.execute(stmt).scalar()
+            # A whitespace-only Linked Name is no alias (parse_inventory keeps it as "")
+            resolved = self._alias_cache[norm_name] = normalize((linked or "").strip() or norm_name)
+        return resolved
+
+    def material_ids(self, resolved_norm):
+        cached = self._material_id_cache.get(resolved_norm)
+        if cached is not None:
+            return cached
+        stmt = select(UserMaterialConstituent).where(UserMaterialConstituent.norm_name == resolved_norm) \
+            .order_by(UserMaterialConstituent.row_index)
+        rows = [TABLES["DB_User_Materials"][3](m) for m in self._session.execute(stmt).scalars()]
+        if rows:
+            self.user_materials.update(parse_user_materials(rows))
+        else:
+            stmt = select(NaturalConstituent).where(NaturalConstituent.norm_name == resolved_norm) \
+                .order_by(NaturalConstituent.row_index)
+            rows = [TABLES["DB_Naturals"][3](m) for m in self._session.execute(stmt).scalars()]
+            self.naturals.update(parse_naturals(rows))
+        return super().material_ids(resolved_norm)
+
+    def close(self):
+        self._session.close()
+
+
+def open_store(path=STORE_PATH, release_dir=RELEASE_DIR, refresh=True, log=print):
+    store = MaterialsStore(path)
+    if refresh:
+        store.import_csv_dir(release_dir, log=log)
+    return store
+
+
+def _silent(message):
+    pass
+
+
+def store_reference_db(path=STORE_PATH, release_dir=RELEASE_DIR, refresh=True, log=_silent):
+    # Evaluation-path entry point (load_reference_db(store_path=...)): refreshes the store from the
+    # CSVs when they changed (unless refresh=False), then looks materials up in it on demand
+    return StoreReferenceDB(open_store(path, release_dir, refresh, log))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import the DB_* CSVs into the SQLite materials store.")
+    parser.add_argument("--db", default=STORE_PATH, help="SQLite database path")
+    parser.add_argument("--release-dir", default=RELEASE_DIR, help="Directory holding the DB_*.csv files")
+    parser.add_argument("--force", action="store_true", help="Re-import tables even when unchanged")
+    parser.add_argument("--cas", help="List all materials that contain this CAS")
+    parser.add_argument("--sku", help="List all bases using this SKU")
+    args = parser.parse_args()
+
+    store = MaterialsStore(args.db)
+    store.import_csv_dir(args.release_dir, force=args.force)
+    if args.cas:
+        for r in store.materials_containing_cas(args.cas):
+            print(f"  {r['material']} [{r['source']}] {r['constituent']} {r['percentage']}%")
+    if args.sku:
+        for name in store.bases_using_sku(args.sku):
+            print(f"  {name}")
@@ -0,0 +1,254 @@
+"""minipinscher: command-line IFRA / EU checks of whole formula libraries.
+
+    python minipinscher.py check formulas/ "launch/**/*.xlsx" --dosage 20
+
+Formula files (CSV: Ingredient, Amount; XLSX: the Formula tab of a workbook,
+with its Finished Dosage (%) in E1) are evaluated in a process pool. Every
+worker opens the read-only reference DB once (the mmap snapshot when it is
+fresh, or the SQLite materials store with --store) and then takes files in
+small batches. One JSONL record per formula is written, in input order, as
+soon as its batch (and every batch before it) finishes, so a QA gate can pipe
+the stream and still get the exit status: 1 when any formula fails or cannot
+be read.
+Records are kept in the persistent result cache (result_cache.py), so a
+re-run only evaluates formulas whose lines, dosage or DB tables changed.
+"""
+import glob
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+
+import typer
+
+from compliance_engine import RELEASE_DIR, evaluate_formula, load_reference_db, read_formula_csv
+from eu_labeling import AllergenIndex, evaluate_labeling, inci_allergens, product_type_key
+from result_cache import CACHE_PATH, ResultCache, reference_db_hash
+
+FORMULA_EXTENSIONS = (".csv", ".xlsx")
+BATCH_SIZE = 16
+
+app = typer.Typer(help="miniPinscher fragrance compliance tools.", add_completion=False)
+
+# Per-process reference DB, loaded once by _init_worker
+_worker = {}
+
+
+# --- Formula Files ---
+
+def iter_formula_paths(patterns):
+    # Files, folders (every CSV / XLSX directly inside) and glob patterns, each path once
+    seen = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            paths = [os.path.join(pattern, name) for name in sorted(os.listdir(pattern))]
+        elif os.path.exists(pattern):
+            paths = [pattern]
+        else:
+            paths = sorted(glob.glob(pattern, recursive=True))
+        for path in paths:
+            name = os.path.basename(path)
+            if name.startswith("~$") or not name.lower().endswith(FORMULA_EXTENSIONS) or path in seen:
+                continue
+            if os.path.isfile(path):
+                seen.add(path)
+                yield path
+
+
+def read_formula_xlsx(path):
+    # (rows, finished dosage or None) from the 'Formula' tab (else the first tab) of a workbook
+    import openpyxl
+
+    wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        ws = wb["Formula"] if "Formula" in wb.sheetnames else wb.worksheets[0]
+        rows = []
+        dosage = None
+        for i, row in enumerate(ws.iter_rows(max_col=5, values_only=True)):
+            if i == 0 and len(row) >= 5 and str(row[3] or "").startswith("Finished Dosage"):
+                dosage = row[4]
+            rows.append(list(row[:2]))
+        return rows, dosage
+    finally:
+        wb.close()
+
+
+def read_formula_file(path):
+    if path.lower().endswith(".xlsx"):
+        return read_formula_xlsx(path)
+    return read_formula_csv(path), None
+
+
+# --- Evaluation (runs inside the workers) ---
+
+def _init_worker(release_dir, cache_path=None, store_path=None):
+    # iter_records() refreshed the store once already: workers only read it
+    db = load_reference_db(release_dir, store_path=store_path, refresh_store=False)
+    _worker["db"] = db
+    _worker["index"] = AllergenIndex(db)
+    _worker["cache"] = ResultCache(cache_path, reference_db_hash(db, release_dir)) if cache_path else None
+
+
+def evaluate_path(path, dosage=None, category=None, product_type="Leave-on"):
+    # One JSON-ready record: IFRA report and EU labeling of one formula file
+    key = product_type_key(product_type)
+    try:
+        rows, file_dosage = read_formula_file(path)
+        finished_dosage = dosage if dosage is not None else file_dosage
+        cache = _worker.get("cache")
+        if cache is None:
+            record = check_formula(rows, finished_dosage, category, key)
+        else:
+            record = cache.cached(lambda: check_formula(rows, finished_dosage, category, key), rows,
+                                  finished_dosage, "check", category=category or "4", product_type=key)
+    except Exception as e:
+        return {"formula": path, "error": f"{type(e).__name__}: {e}"}
+    return {"formula": path, **record}
+
+
+def check_formula(rows, finished_dosage=None, category=None, product_type="Leave-on"):
+    report = evaluate_formula(rows, _worker["db"], finished_dosage, category)
+    labeling = evaluate_labeling(rows, _worker["db"], finished_dosage, _worker["index"])
+    key = product_type_key(product_type)
+    return {
+        "dosage": report["dosage"],
+        "category": category or "4",
+        "total_amount": report["total_amount"],
+        "passed": report["passed"],
+        "fail_count": report["fail_count"],
+        "ifra": report["details"],
+        "labeling": {
+            "product_type": key,
+            "required": inci_allergens(labeling, key),
+            "details": [{"name": d["name"], "cas": d["cas"], "conc": d["conc"], "required": d["required"][key],
+                         "sources": d["sources"]} for d in labeling["details"]]
+        }
+    }
+
+
+def evaluate_batch(paths, dosage=None, category=None, product_type="Leave-on"):
+    records = [evaluate_path(path, dosage, category, product_type) for path in paths]
+    _flush_cache()
+    return records
+
+
+def _flush_cache():
+    # Pool workers are never closed explicitly: hand the buffered cache counters over per batch
+    if _worker.get("cache") is not None:
+        _worker["cache"].flush()
+
+
+def iter_records(paths, dosage=None, category=None, product_type="Leave-on", workers=None,
+                 release_dir=RELEASE_DIR, cache_path=None, store_path=None, log=print):
+    # Records in the order of `paths`; workers=1 evaluates in this process
+    workers = workers or os.cpu_count() or 1
+    if store_path:
+        # Imported once here, so the workers only ever read the store
+        from materials_store import open_store
+        open_store(store_path, release_dir, log=log).engine.dispose()
+    if workers == 1 or len(paths) <= BATCH_SIZE:
+        _init_worker(release_dir, cache_path, store_path)
+        try:
+            for path in paths:
+                yield evaluate_path(path, dosage, category, product_type)
+        finally:
+            _flush_cache()
+        return
+
+    batches = [paths[i:i + BATCH_SIZE] for i in range(0, len(paths), BATCH_SIZE)]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(release_dir, cache_path, store_path)) as pool:
+        futures = [pool.submit(evaluate_batch, batch, dosage, category, product_type) for batch in batches]
+        for future in futures:
+            yield from future.result()
+
+
+# --- Commands ---
+
+@app.callback()
+def main():
+    """miniPinscher fragrance compliance tools."""
+
+
+@app.command()
+def check(
+    paths: List[str] = typer.Argument(..., help="Formula CSV / XLSX files, folders or glob patterns"),
+    dosage: Optional[str] = typer.Option(None, help="Finished dosage (%) for every formula (default: XLSX E1, else 100)"),
+    category: Optional[str] = typer.Option(None, help="IFRA product category (default: 4, as in Code.js)"),
+    product_type: str = typer.Option("Leave-on", "--type", help="EU labeling product type: Leave-on or Rinse-off"),
+    workers: int = typer.Option(0, help="Worker processes (default: one per CPU)"),
+    out: Optional[str] = typer.Option(None, help="Write the JSONL stream to this file instead of stdout"),
+    release_dir: str = typer.Option(RELEASE_DIR, help="Directory holding the DB_*.csv files"),
+    cache: str = typer.Option(CACHE_PATH, help="Result cache file"),
+    no_cache: bool = typer.Option(False, "--no-cache", help="Evaluate every formula, bypassing the result cache"),
+    store: Optional[str] = typer.Option(None, help="Look materials up in this SQLite materials store "
+                                                   "(refreshed from the DB_*.csv files first)")
+):
+    """Evaluate formula files in parallel and stream one JSONL record per formula."""
+    formula_paths = list(iter_formula_paths(paths))
+    if not formula_paths:
+        typer.echo("❌ No formula CSV / XLSX files found.", err=True)
+        raise typer.Exit(2)
+    typer.echo(f"🚀 Checking {len(formula_paths)} formulas...", err=True)
+
+    cache_path = None if no_cache else cache
+    before = _cache_counts(cache_path, release_dir)
+    stream = open(out, "w", encoding="utf-8") if out else sys.stdout
+    counts = {"passed": 0, "failed": 0, "errors": 0}
+    try:
+        for record in iter_records(formula_paths, dosage, category, product_type, workers or None, release_dir,
+                                   cache_path, store, log=lambda message: typer.echo(message, err=True)):
+            stream.write(json.dumps(record, ensure_ascii=False) + "\n")
+            stream.flush()
+            if "error" in record:
+                counts["errors"] += 1
+                typer.echo(f"❌ {record['formula']}: {record['error']}", err=True)
+            elif record["passed"]:
+                counts["passed"] += 1
+            else:
+                counts["failed"] += 1
+    finally:
+        if out:
+            stream.close()
+
+    if cache_path:
+        after = _cache_counts(cache_path, release_dir)
+        typer.echo(f"💾 Cache: {after['hits'] - before['hits']} hits, {after['misses'] - before['misses']} misses "
+                   f"({after['entries']} reports, {after['bytes']:,} bytes in {cache_path})", err=True)
+    status = "✅" if counts["failed"] == 0 and counts["errors"] == 0 else "❌"
+    typer.echo(f"{status} {counts['passed']} passed, {counts['failed']} failed, {counts['errors']} unreadable.",
+               err=True)
+    if status != "✅":
+        raise typer.Exit(1)
+
+
+def _cache_counts(cache_path, release_dir):
+    if not cache_path:
+        return None
+    result_cache = ResultCache(cache_path, reference_db_hash(release_dir=release_dir))
+    try:
+        return result_cache.stats()
+    finally:
+        result_cache.close()
+
+
+@app.command("cache")
+def cache_command(
+    cache: str = typer.Option(CACHE_PATH, help="Result cache file"),
+    clear: bool = typer.Option(False, help="Drop every cached report and reset the counters"),
+    release_dir: str = typer.Option(RELEASE_DIR, help="Directory holding the DB_*.csv files")
+):
+    """Show (or clear) the result cache statistics."""
+    result_cache = ResultCache(cache, reference_db_hash(release_dir=release_dir))
+    try:
+        if clear:
+            result_cache.clear()
+            typer.echo(f"✅ Cleared {cache}")
+        typer.echo(json.dumps(result_cache.stats(), indent=2))
+    finally:
+        result_cache.close()
+
+
+if __name__ == "__main__":
+    app()
@@ -1,77 +1,292 @@
+import argparse
+import csv
+import json
 import os
 import shutil
+import threading
+import time
+
+from db_snapshot import file_sha256
+from stage_trace import add_profile_arguments, profiled, span, traced
 
 RELEASE_DIR = "google_sheets_release"
+RELEASE_MANIFEST = "release_manifest.json"
+# Watch mode rebuilds once the sources have been quiet this long (editor saves come in bursts)
+QUIET_SECONDS = 0.5
+
+# (source path, release file name, workbook tab fed by it)
+RELEASE_ASSETS = [
+    ("google_sheets_assets/Code.js", "Code.js", None),                              # Custom Apps Script Code
+    ("google_sheets_assets/DB_Standards.csv", "DB_Standards.csv", "DB_Standards"),  # IFRA limits
+    ("google_sheets_assets/DB_Naturals.csv", "DB_Naturals.csv", "DB_Naturals"),     # Essential oil constituents
+    ("v0.5.0_Legacy/DB_Inventory.csv", "DB_Inventory.csv", "DB_Inventory"),         # Stock alias map
+    ("DB_User_Materials.csv", "DB_User_Materials.csv", "DB_User_Materials"),        # Bases & Dilutions
+    ("google_sheets_data/DB_EU_Allergens.csv", "DB_EU_Allergens.csv", "DB_EU_Allergens")  # EU reference INCI list
+]
+
+
+# --- Manifest (content hash + row count per asset) ---
+
+def load_manifest(path=RELEASE_MANIFEST):
+    # Anything unreadable or not shaped like a manifest counts as no manifest (everything is re-synced)
+    if os.path.exists(path):
+        try:
+            with open(path, encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            manifest = None
+        if isinstance(manifest, dict) and isinstance(manifest.get("sources"), dict) \
+                and isinstance(manifest.get("assets"), dict):
+            return manifest
+    return {"sources": {}, "assets": {}}
+
+
+def save_manifest(manifest, path=RELEASE_MANIFEST):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def fingerprint(path, cached=None):
+    # Reuses the cached hash when size + mtime are unchanged
+    st = os.stat(path)
+    if cached and cached.get("size") == st.st_size and cached.get("mtime_ns") == st.st_mtime_ns:
+        return dict(cached)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": file_sha256(path)}
+
+
+def count_csv_rows(path):
+    # Data rows (header excluded, blank lines skipped like pd.read_csv)
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        return sum(1 for row in reader if row)
+
+
+# --- Packaging ---
 
-def build_release():
+@traced("build_release")
+def build_release(force=False, rebuild_workbook=True, lookup=None):
+    # Copies only changed assets and rebuilds the workbook tabs they feed; returns the release file
+    # names whose content changed. Without `rebuild_workbook` the changed DB_* CSVs stay pending in
+    # the manifest, so the next rebuilding run still sees them as changed. `lookup` True / False
+    # adds / drops the DB_Lookup tab (None keeps the workbook's current layout)
     print("🚀 Packaging Google Sheets Compliance Suite...")
-    
+
     # 1. Create Release Directory
     if not os.path.exists(RELEASE_DIR):
         os.makedirs(RELEASE_DIR)
         print(f"  Created directory: {RELEASE_DIR}")
-        
-    # 2. Copy Custom Apps Script Code
-    code_src = "google_sheets_assets/Code.js"
-    code_dest = os.path.join(RELEASE_DIR, "Code.js")
-    if os.path.exists(code_src):
-        shutil.copy2(code_src, code_dest)
-        print(f"  Copied App Script: {code_dest}")
-    else:
-        print(f"  Error: {code_src} not found!")
-
-    # 3. Copy DB_Standards (IFRA limits)
-    std_src = "google_sheets_assets/DB_Standards.csv"
-    std_dest = os.path.join(RELEASE_DIR, "DB_Standards.csv")
-    if os.path.exists(std_src):
-        shutil.copy2(std_src, std_dest)
-        print(f"  Copied DB_Standards: {std_dest}")
-        
-    # 4. Copy DB_Naturals (Essential oil constituents)
-    nat_src = "google_sheets_assets/DB_Naturals.csv"
-    nat_dest = os.path.join(RELEASE_DIR, "DB_Naturals.csv")
-    if os.path.exists(nat_src):
-        shutil.copy2(nat_src, nat_dest)
-        print(f"  Copied DB_Naturals: {nat_dest}")
-
-    # 5. Copy DB_Inventory (Stock alias map)
-    inv_src = "v0.5.0_Legacy/DB_Inventory.csv"
-    inv_dest = os.path.join(RELEASE_DIR, "DB_Inventory.csv")
-    if os.path.exists(inv_src):
-        shutil.copy2(inv_src, inv_dest)
-        print(f"  Copied DB_Inventory: {inv_dest}")
-
-    # 6. Copy DB_User_Materials (Bases & Dilutions)
-    user_src = "DB_User_Materials.csv"
-    user_dest = os.path.join(RELEASE_DIR, "DB_User_Materials.csv")
-    if os.path.exists(user_src):
-        shutil.copy2(user_src, user_dest)
-        print(f"  Copied DB_User_Materials: {user_dest}")
-
-    # 7. Copy DB_EU_Allergens (EU reference INCI list)
-    aller_src = "google_sheets_data/DB_EU_Allergens.csv"
-    aller_dest = os.path.join(RELEASE_DIR, "DB_EU_Allergens.csv")
-    if os.path.exists(aller_src):
-        shutil.copy2(aller_src, aller_dest)
-        print(f"  Copied DB_EU_Allergens: {aller_dest}")
-
-    # 8. Create README_SHEETS.md
+
+    manifest = load_manifest()
+    previous_assets = dict(manifest["assets"])
+    changed = []
+
+    # 2. Sync assets from their sources (content-addressed)
+    for src, filename, tab_name in RELEASE_ASSETS:
+        with span(f"asset:{filename}") as stage:
+            _sync_asset(manifest, changed, src, filename, tab_name, force)
+            entry = manifest["assets"].get(filename, {})
+            stage.set(bytes=entry.get("size", 0), changed=filename in changed)
+            if "rows" in entry:
+                stage.set(rows=entry["rows"])
+
+    # 3. Workbook: only the tabs whose CSV changed, all of it when the DB_Lookup layout switches
+    changed_tabs = [(filename, tab) for _, filename, tab in RELEASE_ASSETS if tab and filename in changed]
+    relayout = False
+    if rebuild_workbook and lookup is not None:
+        from build_sheet import output_paths, workbook_has_lookup
+        relayout = workbook_has_lookup(output_paths()[0]) != lookup
+    if changed_tabs or relayout:
+        rebuilt = False
+        if rebuild_workbook:
+            from build_sheet import rebuild_tabs
+            rebuilt = rebuild_tabs([tab for _, tab in changed_tabs], lookup=lookup)
+        if not rebuilt and changed_tabs:
+            # The workbook still holds the old rows: keep the old entries so these count as changed next time
+            for filename, _ in changed_tabs:
+                if filename in previous_assets:
+                    manifest["assets"][filename] = previous_assets[filename]
+                else:
+                    manifest["assets"].pop(filename, None)
+            print(f"  Workbook tabs not rebuilt, still pending: {', '.join(tab for _, tab in changed_tabs)}")
+
+    # 4. README_SHEETS.md (names the published workbook's layout), rewritten only when its content changes
     readme_path = os.path.join(RELEASE_DIR, "README_SHEETS.md")
-    write_readme(readme_path)
-    print(f"  Created Setup Guide: {readme_path}")
-    
-    print("\n✅ Google Sheets Release Package is Ready!")
-
-def write_readme(path):
-    user_rows = 5049
-    user_csv = os.path.join(RELEASE_DIR, "DB_User_Materials.csv")
-    if os.path.exists(user_csv):
-        try:
-            import pandas as pd
-            df = pd.read_csv(user_csv)
-            user_rows = len(df)
-        except Exception:
-            pass
+    user_rows = manifest["assets"].get("DB_User_Materials.csv", {}).get("rows")
+    with span("readme"):
+        if write_readme(readme_path, user_rows, force=force):
+            print(f"  Created Setup Guide: {readme_path}")
+
+    save_manifest(manifest)
+
+    if changed:
+        print(f"\n✅ Google Sheets Release Package is Ready! Changed: {', '.join(changed)}")
+    else:
+        print("\n✅ Google Sheets Release Package is up to date (nothing changed).")
+    return changed
+
+
+def _sync_asset(manifest, changed, src, filename, tab_name, force=False):
+    # Copies one asset when its source changed and refreshes its manifest entry
+    dest = os.path.join(RELEASE_DIR, filename)
+    previous = manifest["assets"].get(filename)
+
+    if os.path.exists(src):
+        src_fp = fingerprint(src, manifest["sources"].get(src))
+        manifest["sources"][src] = src_fp
+        if force or not os.path.exists(dest) or not previous or previous["sha256"] != src_fp["sha256"] \
+                or fingerprint(dest, previous)["sha256"] != src_fp["sha256"]:
+            shutil.copy2(src, dest)
+            print(f"  Copied {filename}: {dest}")
+    elif filename == "Code.js" and not os.path.exists(dest):
+        print(f"  Error: {src} not found!")
+
+    if not os.path.exists(dest):
+        manifest["assets"].pop(filename, None)
+        return
+
+    entry = fingerprint(dest, previous)
+    if force or not previous or previous["sha256"] != entry["sha256"]:
+        changed.append(filename)
+        if filename.endswith(".csv"):
+            entry["rows"] = count_csv_rows(dest)
+    elif "rows" in previous:
+        entry["rows"] = previous["rows"]
+    if tab_name:
+        entry["tab"] = tab_name
+    manifest["assets"][filename] = entry
+
+
+class _QuietWindow:
+    # Collects changed paths and releases them as one batch once no event arrived for `quiet` seconds
+    def __init__(self, quiet=QUIET_SECONDS, clock=time.monotonic):
+        self.quiet = quiet
+        self.clock = clock
+        self._paths = set()
+        self._last = None
+        self._lock = threading.Lock()
+
+    def add(self, path):
+        with self._lock:
+            self._paths.add(path)
+            self._last = self.clock()
+
+    def take(self):
+        # The batch if the window has closed, else an empty set
+        with self._lock:
+            if not self._paths or self.clock() - self._last < self.quiet:
+                return set()
+            paths, self._paths = self._paths, set()
+            return paths
+
+
+def nearest_existing_dir(directory):
+    # `directory` itself, or its closest ancestor that exists
+    directory = os.path.abspath(directory)
+    while not os.path.isdir(directory) and os.path.dirname(directory) != directory:
+        directory = os.path.dirname(directory)
+    return directory
+
+
+def watch_release(interval=0.1, quiet=QUIET_SECONDS, lookup=None):
+    # Long-running: repackage (and rebuild affected workbook tabs) when a source changes.
+    # Only the sources are watched: the release copies this script writes never retrigger it
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+
+    watched = {os.path.abspath(src) for src, _, _ in RELEASE_ASSETS}
+    window = _QuietWindow(quiet)
+    observer = Observer()
+    scheduled = set()
+    # Source directories that do not exist yet: their nearest existing parent is watched instead
+    pending = set()
+
+    def watch(directory):
+        target = nearest_existing_dir(directory)
+        if target not in scheduled:
+            observer.schedule(handler, target, recursive=False)
+            scheduled.add(target)
+        return target == directory
+
+    def watch_pending():
+        # A missing source directory (or one of its parents) appeared: move the watch down
+        for directory in sorted(pending):
+            if watch(directory):
+                pending.discard(directory)
+                print(f"👀 {directory} now exists, watching it.")
+                for p in watched:
+                    if os.path.dirname(p) == directory and os.path.exists(p):
+                        window.add(p)
+
+    class _Handler(FileSystemEventHandler):
+        def on_any_event(self, event):
+            # Reading a source (hashing it, copying it) reports opened / closed_no_write events
+            if event.event_type in ("opened", "closed_no_write"):
+                return
+            if event.is_directory:
+                if pending:
+                    watch_pending()
+                return
+            for p in (event.src_path, getattr(event, "dest_path", None)):
+                if p and os.path.abspath(p) in watched:
+                    window.add(os.path.abspath(p))
+
+    handler = _Handler()
+    for directory in sorted({os.path.dirname(p) for p in watched}):
+        if not watch(directory):
+            pending.add(directory)
+            print(f"⚠️ Source directory {directory} does not exist: watching {nearest_existing_dir(directory)} "
+                  f"until it is created.")
+
+    build_release(lookup=lookup)
+    observer.start()
+    print(f"👀 Watching {len(watched)} source files for changes (Ctrl+C to stop)...")
+    try:
+        while True:
+            time.sleep(interval)
+            changed = window.take()
+            if changed:
+                # One incremental pass per burst of saves
+                print(f"👀 {len(changed)} source file(s) changed.")
+                build_release(lookup=lookup)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        observer.stop()
+        observer.join()
+
+
+def write_readme(path, user_rows=None, force=False):
+    # Returns True when README_SHEETS.md was (re)written
+    from build_sheet import workbook_filename, workbook_has_lookup
+
+    if user_rows is None:
+        user_rows = 5049
+        user_csv = os.path.join(RELEASE_DIR, "DB_User_Materials.csv")
+        if os.path.exists(user_csv):
+            user_rows = count_csv_rows(user_csv)
+
+    # Which layout the published workbook (next to this README) was built with
+    workbook = workbook_filename()
+    if workbook_has_lookup(os.path.join(os.path.dirname(path), workbook)):
+        workbook_layout = (
+            f"The published workbook `{workbook}` in this folder is built with `--lookup`: it carries the "
+            f"`DB_Lookup` tab, and its `IFRA_Compliance` / `EU_Allergen_Labeling` tabs use the lookup functions. "
+            f"`python release_sheets_package.py --no-lookup` rebuilds it with the `*_V5` functions only.")
+        workbook_layout_th = (
+            f"ไฟล์ `{workbook}` ในโฟลเดอร์นี้สร้างด้วย `--lookup` จึงมีแท็บ `DB_Lookup` และแท็บ "
+            f"`IFRA_Compliance` / `EU_Allergen_Labeling` ใช้สูตร Lookup "
+            f"หากต้องการกลับไปใช้สูตร `*_V5` อย่างเดียว ให้รัน `python release_sheets_package.py --no-lookup`")
+    else:
+        workbook_layout = (
+            f"The published workbook `{workbook}` in this folder is built without `--lookup`, so it has no "
+            f"`DB_Lookup` tab. `python release_sheets_package.py --lookup` rebuilds it (and its copy in the "
+            f"repository root) with one.")
+        workbook_layout_th = (
+            f"ไฟล์ `{workbook}` ในโฟลเดอร์นี้สร้างโดยไม่ใช้ `--lookup` จึงไม่มีแท็บ `DB_Lookup` "
+            f"หากต้องการเพิ่ม ให้รัน `python release_sheets_package.py --lookup` (สร้างไฟล์นี้และสำเนาในโฟลเดอร์หลักใหม่)")
 
     content = f"""# miniPinscher: Google Sheets Fragrance Compliance Suite (v0.6.1) 🐕‍🦺
 
@@ -81,8 +296,8 @@ This directory contains the custom Apps Script code and reference database files
 
 ## 📂 Package Directory Structure
 
-1.  `Code.js`: The custom Google Apps Script containing the logic for `=IFRA_COMPLIANCE_V5` and `=EU_LABELING_V5`.
-2.  `DB_Standards.csv`: Master list of official IFRA restricted materials, CAS numbers, and Category 4 limits.
+1.  `Code.js`: The custom Google Apps Script containing the logic for `=IFRA_COMPLIANCE_V5` and `=EU_LABELING_V5` (plus the opt-in `=IFRA_COMPLIANCE_LOOKUP` / `=EU_LABELING_LOOKUP`).
+2.  `DB_Standards.csv`: Master list of official IFRA restricted materials, CAS numbers, and limits for every product category (Category 4 in column C).
 3.  `DB_Naturals.csv`: Annex I compositions (essential oil constituents) to calculate indirect exposures automatically.
 4.  `DB_Inventory.csv`: Stock name alias mapping (Stock Name -> Official IFRA Name) to handle trade names.
 5.  `DB_User_Materials.csv`: Your personal bases and dilutions database ({user_rows:,} rows of constituents).
@@ -123,6 +338,16 @@ To automatically calculate which allergens must be listed on the product label:
 ```
 *Tip: Change `"Leave-on"` to `"Rinse-off"` for rinse-off product regulations.*
 
+#### (C) Optional: Faster Recalculation with a Precomputed Lookup
+The generated `.xlsx` workbook calculates with the `*_V5` functions above, so edits to the `DB_*` tabs take effect immediately. A workbook built with `--lookup` (`python release_sheets_package.py --lookup` or `python build_sheet.py --lookup`) also has a `DB_Lookup` tab: every material already resolved (stock aliases, bases, naturals) and grouped by IFRA standard, with the database hash in `H2`. The lookup functions read it once per database version and keep it in the script cache, instead of re-parsing every database tab on each recalculation:
+```excel
+=IFRA_COMPLIANCE_LOOKUP(A2:B, DB_Lookup!H2, E1)
+=EU_LABELING_LOOKUP(A2:B, DB_EU_Allergens!A2:B, DB_Lookup!H2, "Leave-on", E1)
+```
+*Note: `DB_Lookup` is a build-time copy. Edits to `DB_Standards`, `DB_Naturals`, `DB_Inventory` or `DB_User_Materials` made in Sheets are not seen by the lookup functions until the workbook is rebuilt.*
+
+{workbook_layout}
+
 ---
 
 ## 🛠️ คู่มือการติดตั้งภาษาไทย (Thai Guide)
@@ -157,9 +382,38 @@ To automatically calculate which allergens must be listed on the product label:
 =EU_LABELING_V5(A2:B, DB_EU_Allergens!A2:B, DB_Naturals!A2:D, DB_Inventory!A2:B, DB_User_Materials!A2:E, "Leave-on")
 ```
 *(เปลี่ยนคำว่า `"Leave-on"` เป็น `"Rinse-off"` หากเป็นผลิตภัณฑ์กลุ่มสบู่/ล้างออก)*
+
+#### (ค) (ทางเลือก) คำนวณเร็วขึ้นด้วยตาราง Lookup ที่คำนวณไว้ล่วงหน้า:
+ไฟล์ `.xlsx` ที่สร้างให้คำนวณด้วยสูตร `*_V5` ด้านบน การแก้ไขแท็บ `DB_*` จึงมีผลทันที หากสร้างด้วย `--lookup` (`python release_sheets_package.py --lookup` หรือ `python build_sheet.py --lookup`) จะมีแท็บ `DB_Lookup` เพิ่มเข้ามา ซึ่งแปลงชื่อวัตถุดิบ (ชื่อสต็อก เบส น้ำมันหอมระเหย) และจัดกลุ่มตามมาตรฐาน IFRA ไว้ล่วงหน้าแล้ว สูตรด้านล่างจึงไม่ต้องอ่านฐานข้อมูลทุกแท็บใหม่ทุกครั้งที่คำนวณ:
+```excel
+=IFRA_COMPLIANCE_LOOKUP(A2:B, DB_Lookup!H2, E1)
+=EU_LABELING_LOOKUP(A2:B, DB_EU_Allergens!A2:B, DB_Lookup!H2, "Leave-on", E1)
+```
+*(หมายเหตุ: `DB_Lookup` เป็นสำเนาที่สร้างตอน build การแก้ไขแท็บ `DB_Standards`, `DB_Naturals`, `DB_Inventory` หรือ `DB_User_Materials` ใน Sheets จะยังไม่มีผลกับสูตร Lookup จนกว่าจะสร้างไฟล์ใหม่)*
+
+{workbook_layout_th}
 """
+    if not force and os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            if f.read() == content:
+                return False
     with open(path, 'w', encoding='utf-8') as f:
         f.write(content)
+    return True
 
 if __name__ == "__main__":
-    build_release()
+    parser = argparse.ArgumentParser(description="Package the Google Sheets release folder.")
+    parser.add_argument("--watch", action="store_true", help="Keep running and repackage on source changes")
+    parser.add_argument("--force", action="store_true", help="Copy and rebuild everything")
+    parser.add_argument("--no-workbook", action="store_true",
+                        help="Only sync the release files; changed DB tabs stay pending until a run rebuilds them")
+    parser.add_argument("--lookup", action=argparse.BooleanOptionalAction, default=None,
+                        help="Rebuild the workbook with (--lookup) or without (--no-lookup) the precomputed "
+                             "DB_Lookup tab; by default it keeps its current layout")
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+    with profiled(args):
+        if args.watch:
+            watch_release(lookup=args.lookup)
+        else:
+            build_release(force=args.force, rebuild_workbook=not args.no_workbook, lookup=args.lookup)
@@ -0,0 +1,226 @@
+"""Persistent, multi-process result cache for compliance reports.
+
+Reports are stored in a SQLite file (WAL mode, so any number of CLI runs and
+pool workers can read and write it at once) under a SHA-256 key of:
+  - the formula lines with the same skip rules and Number() coercion as the
+    engine (so "10" and 10.0 are the same amount), and each ingredient name
+    normalized like resolve_name() does before the alias lookup (trimmed,
+    lower-cased),
+  - the finished dosage after parse_dosage(),
+  - the report kind and its options (product category, product type ...),
+  - the content hash of the five DB_* tables and the engine code fingerprint.
+Reports echo the line names in their source labels, so each entry also
+records the exact spelling it was computed for; a lookup with another
+spelling of the same formula is a miss and replaces it. Entries of another
+DB hash or engine version simply stop hitting: they stay until the LRU
+eviction (the file is bounded in bytes) or clear() removes them. Hit / miss
+counters are kept in the file itself, so they add up across processes.
+"""
+import argparse
+import hashlib
+import json
+import sqlite3
+import time
+import zlib
+
+from compliance_engine import RELEASE_DIR, iter_formula_lines, normalize, parse_dosage
+from db_snapshot import code_fingerprint
+
+CACHE_PATH = "result_cache.db"
+# Bump when a cached report changes shape or meaning
+CACHE_VERSION = 2
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+# Evict down to this share of max_bytes, so eviction does not run on every put
+EVICT_TO = 0.9
+# Hit / miss counters and LRU touches are written in one transaction per this many lookups
+FLUSH_EVERY = 256
+
+_SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, db_hash TEXT NOT NULL, value BLOB NOT NULL, "
+    "size INTEGER NOT NULL, last_used REAL NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)",
+    "CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)",
+    "INSERT OR IGNORE INTO meta VALUES ('bytes', 0), ('hits', 0), ('misses', 0), ('evictions', 0)"
+]
+
+
+def reference_db_hash(db=None, release_dir=RELEASE_DIR):
+    # Content hash of the DB_* tables a ReferenceDB was loaded from (snapshots carry it already)
+    if getattr(db, "content_hash", None):
+        return db.content_hash
+    from db_snapshot import db_content_hash
+    return db_content_hash(release_dir)
+
+
+def formula_key(formula, finished_dosage=None, kind="ifra", db_hash="", **options):
+    lines = [[normalize(name), amount] for name, amount in iter_formula_lines(formula)]
+    payload = [CACHE_VERSION, code_fingerprint(), kind, db_hash, parse_dosage(finished_dosage),
+               sorted(options.items()), lines]
+    return _sha256(payload)
+
+
+def formula_spelling(formula):
+    # The line names exactly as written (they appear in the report's source labels)
+    return _sha256([name for name, _ in iter_formula_lines(formula)])
+
+
+def _sha256(payload):
+    return hashlib.sha256(json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    def __init__(self, path=CACHE_PATH, db_hash="", max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.db_hash = db_hash
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        # Pending counter deltas and last_used touches, see flush()
+        self._pending = {"hits": 0, "misses": 0}
+        self._touched = {}
+        # isolation_level=None: transactions are opened explicitly with BEGIN IMMEDIATE
+        self.conn = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        with self._write():
+            for statement in _SCHEMA:
+                self.conn.execute(statement)
+
+    def _write(self):
+        return _Transaction(self.conn)
+
+    def key(self, formula, finished_dosage=None, kind="ifra", **options):
+        return formula_key(formula, finished_dosage, kind, self.db_hash, **options)
+
+    def get(self, key, spelling=""):
+        # A hit is a single read; its bookkeeping waits for the next flush()
+        row = self.conn.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+        if row is not None:
+            stored_spelling, value = json.loads(zlib.decompress(row[0]))
+            if stored_spelling != spelling:
+                row = None
+        if row is None:
+            self.misses += 1
+            self._pending["misses"] += 1
+        else:
+            self.hits += 1
+            self._pending["hits"] += 1
+            self._touched[key] = time.time()
+        if self._pending["hits"] + self._pending["misses"] >= FLUSH_EVERY:
+            self.flush()
+        return None if row is None else value
+
+    def flush(self):
+        # Write buffered counters and LRU touches; safe to call at any time
+        if not (self._pending["hits"] or self._pending["misses"] or self._touched):
+            return
+        with self._write():
+            self._write_pending()
+
+    def _write_pending(self):
+        for name, delta in self._pending.items():
+            if delta:
+                self.conn.execute("UPDATE meta SET value = value + ? WHERE name = ?", (delta, name))
+        self.conn.executemany("UPDATE results SET last_used = ? WHERE key = ?",
+                              [(used, key) for key, used in self._touched.items()])
+        self._pending = {"hits": 0, "misses": 0}
+        self._touched = {}
+
+    def put(self, key, value, spelling=""):
+        blob = zlib.compress(json.dumps([spelling, value], ensure_ascii=False).encode("utf-8"), 1)
+        self._touched.pop(key, None)
+        with self._write():
+            old = self.conn.execute("SELECT size FROM results WHERE key = ?", (key,)).fetchone()
+            self.conn.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)",
+                              (key, self.db_hash, blob, len(blob), time.time()))
+            self.conn.execute("UPDATE meta SET value = value + ? WHERE name = 'bytes'",
+                              (len(blob) - (old[0] if old else 0),))
+            total = self.conn.execute("SELECT value FROM meta WHERE name = 'bytes'").fetchone()[0]
+            if total > self.max_bytes:
+                # Recent hits must count before picking the least recently used
+                self._write_pending()
+                self._evict(total, int(self.max_bytes * EVICT_TO))
+
+    def _evict(self, total, target):
+        # Least recently used first, inside the caller's write transaction
+        evicted = 0
+        while total > target:
+            rows = self.conn.execute("SELECT key, size FROM results ORDER BY last_used LIMIT 256").fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                self.conn.execute("DELETE FROM results WHERE key = ?", (key,))
+                total -= size
+                evicted += 1
+                if total <= target:
+                    break
+        self.conn.execute("UPDATE meta SET value = ? WHERE name = 'bytes'", (max(total, 0),))
+        self.conn.execute("UPDATE meta SET value = value + ? WHERE name = 'evictions'", (evicted,))
+
+    def cached(self, compute, formula, finished_dosage=None, kind="ifra", **options):
+        # compute() on a miss; the result must be JSON-serializable
+        key = self.key(formula, finished_dosage, kind, **options)
+        spelling = formula_spelling(formula)
+        value = self.get(key, spelling)
+        if value is None:
+            value = compute()
+            self.put(key, value, spelling)
+        return value
+
+    def stats(self):
+        # Totals over every process that used this file (hits / misses of this handle separately)
+        self.flush()
+        meta = dict(self.conn.execute("SELECT name, value FROM meta").fetchall())
+        entries = self.conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        lookups = meta["hits"] + meta["misses"]
+        return {
+            "entries": entries,
+            "bytes": meta["bytes"],
+            "max_bytes": self.max_bytes,
+            "hits": meta["hits"],
+            "misses": meta["misses"],
+            "evictions": meta["evictions"],
+            "hit_rate": meta["hits"] / lookups if lookups else 0.0
+        }
+
+    def clear(self):
+        with self._write():
+            self.conn.execute("DELETE FROM results")
+            self.conn.execute("UPDATE meta SET value = 0")
+        self.hits = self.misses = 0
+        self._pending = {"hits": 0, "misses": 0}
+        self._touched = {}
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+
+class _Transaction:
+    # BEGIN IMMEDIATE takes the write lock up front, so concurrent writers queue instead of deadlocking
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or clear the compliance result cache.")
+    parser.add_argument("--cache", default=CACHE_PATH, help="Cache file")
+    parser.add_argument("--clear", action="store_true", help="Drop every cached report and reset the counters")
+    args = parser.parse_args()
+
+    cache = ResultCache(args.cache, db_hash=reference_db_hash())
+    if args.clear:
+        cache.clear()
+        print(f"✅ Cleared {args.cache}")
+    stats = cache.stats()
+    print(f"💾 {args.cache}: {stats['entries']} reports, {stats['bytes']:,} bytes, "
+          f"{stats['hits']} hits / {stats['misses']} misses ({stats['hit_rate']:.1%}), {stats['evictions']} evicted")
+    cache.close()
@@ -0,0 +1,307 @@
+"""Named timing spans for the build, package and verify stages.
+
+    with span("tab:DB_Naturals") as s:
+        ...
+        s.set(rows=count)
+
+Spans are recorded only while a Tracer is active (the --profile flag of the
+build / package / verify scripts); otherwise span() hands back a no-op and
+the instrumented code runs as before. Every span keeps its wall time, parent,
+the process peak RSS at its end and whatever the stage sets on it (rows,
+bytes, read_seconds ...). A trace is saved as JSON, or in Chrome trace format
+(chrome://tracing, Perfetto) with --chrome. Stages matching --cprofile also
+run under cProfile and dump a .prof file next to the trace. Work done in a
+process pool is traced by submitting it through submit() / result().
+"""
+import contextlib
+import cProfile
+import fnmatch
+import functools
+import json
+import os
+import platform
+import sys
+import time
+from datetime import datetime, timezone
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Active tracer of this process (None: spans are no-ops)
+_current = None
+
+
+def peak_rss():
+    # Peak resident set size of this process in bytes (None where getrusage is unavailable)
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class Span:
+    __slots__ = ("name", "parent", "depth", "pid", "start", "seconds", "peak_rss", "fields")
+
+    def __init__(self, name, parent, depth, fields):
+        self.name = name
+        self.parent = parent
+        self.depth = depth
+        self.pid = os.getpid()
+        self.start = time.time()
+        self.seconds = None
+        self.peak_rss = None
+        self.fields = fields
+
+    def set(self, **fields):
+        self.fields.update(fields)
+        return self
+
+    def add(self, field, amount):
+        self.fields[field] = self.fields.get(field, 0) + amount
+        return self
+
+    def to_dict(self):
+        return {"name": self.name, "parent": self.parent, "depth": self.depth, "pid": self.pid,
+                "start": self.start, "seconds": self.seconds, "peak_rss": self.peak_rss, **self.fields}
+
+
+class _NullSpan:
+    def set(self, **fields):
+        return self
+
+    def add(self, field, amount):
+        return self
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Tracer:
+    def __init__(self, cprofile=(), prof_prefix="profile"):
+        self.spans = []
+        self.cprofile = list(cprofile)
+        self.prof_prefix = prof_prefix
+        self.started = time.time()
+        self._stack = []
+        self._profiling = False
+
+    def open(self, name, fields):
+        parent = self._stack[-1] if self._stack else None
+        item = Span(name, parent, len(self._stack), fields)
+        self._stack.append(len(self.spans))
+        self.spans.append(item)
+        return item
+
+    def close(self, item, seconds):
+        item.seconds = seconds
+        item.peak_rss = peak_rss()
+        self._stack.pop()
+
+    def wants_profile(self, name):
+        # One cProfile at a time: a matching stage nested in a profiled one is covered by the outer .prof
+        return not self._profiling and any(fnmatch.fnmatchcase(name, pattern) for pattern in self.cprofile)
+
+    def prof_path(self, name):
+        safe = "".join(c if c.isalnum() or c in "-_." else "_" for c in name)
+        return f"{self.prof_prefix}.{safe}.prof"
+
+    def find(self, name):
+        # Latest span called `name`
+        for item in reversed(self.spans):
+            if item.name == name:
+                return item
+        return None
+
+    def merge(self, spans):
+        # Spans recorded in another process, re-parented under the currently open span
+        base = len(self.spans)
+        parent = self._stack[-1] if self._stack else None
+        depth = len(self._stack)
+        for data in spans:
+            data = dict(data)
+            data["parent"] = parent if data["parent"] is None else data["parent"] + base
+            data["depth"] += depth
+            item = Span.__new__(Span)
+            for slot in ("name", "parent", "depth", "pid", "start", "seconds", "peak_rss"):
+                setattr(item, slot, data.pop(slot))
+            item.fields = data
+            self.spans.append(item)
+
+    def to_json(self):
+        return {
+            "started": datetime.fromtimestamp(self.started, timezone.utc).isoformat(timespec="seconds"),
+            "argv": sys.argv,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "spans": [dict(item.to_dict(), start=round(item.start - self.started, 6)) for item in self.spans]
+        }
+
+    def to_chrome(self):
+        # Complete ("X") events in microseconds; one row (tid) per process
+        events = []
+        for item in self.spans:
+            args = dict(item.fields)
+            if item.peak_rss is not None:
+                args["peak_rss"] = item.peak_rss
+            events.append({"name": item.name, "ph": "X", "pid": item.pid, "tid": item.pid,
+                           "ts": round((item.start - self.started) * 1e6), "dur": round((item.seconds or 0) * 1e6),
+                           "args": args})
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def save(self, path, chrome=False):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_chrome() if chrome else self.to_json(), f, indent=None if chrome else 2)
+
+    def summary(self):
+        # One line per span, indented by depth
+        lines = []
+        for item in self.spans:
+            extra = [f"{item.fields['rows']:,} rows"] if "rows" in item.fields else []
+            if "bytes" in item.fields:
+                extra.append(f"{item.fields['bytes']:,} bytes")
+            if item.peak_rss is not None:
+                extra.append(f"peak RSS {item.peak_rss / 1e6:.0f} MB")
+            lines.append(f"{'  ' * (item.depth + 1)}{item.name}: {item.seconds or 0:.3f} s"
+                         + (f" ({', '.join(extra)})" if extra else ""))
+        return lines
+
+
+def current():
+    return _current
+
+
+def start(cprofile=(), prof_prefix="profile"):
+    global _current
+    _current = Tracer(cprofile, prof_prefix)
+    return _current
+
+
+def stop():
+    global _current
+    tracer, _current = _current, None
+    return tracer
+
+
+@contextlib.contextmanager
+def span(name, **fields):
+    tracer = _current
+    if tracer is None:
+        yield NULL_SPAN
+        return
+    item = tracer.open(name, fields)
+    profiler = None
+    if tracer.wants_profile(name):
+        profiler = cProfile.Profile()
+        tracer._profiling = True
+        profiler.enable()
+    started = time.perf_counter()
+    try:
+        yield item
+    finally:
+        seconds = time.perf_counter() - started
+        if profiler is not None:
+            profiler.disable()
+            tracer._profiling = False
+            path = tracer.prof_path(name)
+            profiler.dump_stats(path)
+            item.set(cprofile=path)
+        tracer.close(item, seconds)
+
+
+def traced(name):
+    # Decorator form of span() for whole stage functions
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def annotate(name, **fields):
+    # Adds fields to the latest span called `name` once they are known (e.g. bytes after a save)
+    if _current is not None:
+        item = _current.find(name)
+        if item is not None:
+            item.set(**fields)
+
+
+def timed_iter(iterable, item, field="read_seconds"):
+    # Yields from iterable, adding the time spent producing rows to item.fields[field]
+    if item is NULL_SPAN:
+        yield from iterable
+        return
+    iterator = iter(iterable)
+    clock = time.perf_counter
+    spent = 0.0
+    try:
+        while True:
+            started = clock()
+            try:
+                value = next(iterator)
+            except StopIteration:
+                return
+            spent += clock() - started
+            yield value
+    finally:
+        item.add(field, round(spent, 6))
+
+
+# --- Process pools ---
+
+def run_traced(fn, args, cprofile=(), prof_prefix="profile"):
+    # Pool-side wrapper: runs fn under a fresh tracer and ships its spans back with the result
+    tracer = start(cprofile, prof_prefix)
+    try:
+        value = fn(*args)
+    finally:
+        stop()
+    return value, [item.to_dict() for item in tracer.spans]
+
+
+def submit(pool, fn, *args):
+    # pool.submit(fn, *args), traced in the worker while a trace is active here
+    if _current is None:
+        return pool.submit(fn, *args)
+    return pool.submit(run_traced, fn, args, _current.cprofile, _current.prof_prefix)
+
+
+def result(future):
+    # future.result() of a submit() future; merges the worker spans into the active trace
+    value = future.result()
+    if _current is None:
+        return value
+    value, spans = value
+    _current.merge(spans)
+    return value
+
+
+# --- Command-line scripts ---
+
+def add_profile_arguments(parser):
+    parser.add_argument("--profile", metavar="TRACE_JSON", default=None,
+                        help="Record named stage spans and write the trace to this JSON file")
+    parser.add_argument("--chrome", action="store_true",
+                        help="Write the --profile trace in Chrome trace format (chrome://tracing, Perfetto)")
+    parser.add_argument("--cprofile", metavar="STAGE", action="append", default=[],
+                        help="Also run stages matching this name or glob (e.g. 'save', 'tab:*') under cProfile")
+
+
+@contextlib.contextmanager
+def profiled(args):
+    # Traces the body when --profile was given, then saves and summarizes the trace
+    if not getattr(args, "profile", None):
+        yield None
+        return
+    tracer = start(args.cprofile, os.path.splitext(args.profile)[0])
+    try:
+        yield tracer
+    finally:
+        stop()
+        tracer.save(args.profile, chrome=args.chrome)
+        print(f"⏱️ Stage trace ({len(tracer.spans)} spans) written to {args.profile}:")
+        for line in tracer.summary():
+            print(line)
@@ -0,0 +1,36 @@
+import csv
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from compliance_engine import DB_FILES, RELEASE_DIR, ReferenceDB  # noqa: E402
+
+REAL_RELEASE_DIR = os.path.join(ROOT, RELEASE_DIR)
+
+HEADERS = {
+    "DB_Standards": ["Ingredient_Name", "CAS_Numbers", "Limit_Cat4"],
+    "DB_Naturals": ["Natural_Name", "Constituent_Name", "Constituent_CAS", "Percentage"],
+    "DB_Inventory": ["Stock Name", "Linked Material Name (Dropdown)", "Note"],
+    "DB_User_Materials": ["SKU", "Material Name", "Constituent", "CAS", "Percentage"],
+    "DB_EU_Allergens": ["Name", "CAS"]
+}
+
+
+def write_release(directory, tables):
+    # Writes the five DB_*.csv files into `directory`; tabs missing from `tables` get only a header
+    os.makedirs(directory, exist_ok=True)
+    for tab_name, csv_file in DB_FILES.items():
+        with open(os.path.join(directory, csv_file), "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(HEADERS[tab_name])
+            writer.writerows(tables.get(tab_name, []))
+    return str(directory)
+
+
+@pytest.fixture(scope="session")
+def real_db():
+    return ReferenceDB.from_csv_dir(REAL_RELEASE_DIR)
@@ -0,0 +1,24 @@
+from benchmark import _timed, compare_results
+
+
+def _results(**seconds):
+    return {"runs": [{"scale": 1, "stages": {name: {"seconds": s} for name, s in seconds.items()}}]}
+
+
+def test_timed_keeps_the_fastest_of_the_repeats():
+    calls = []
+    stages = {}
+    result = _timed(stages, "stage", lambda: len(calls), count=10, repeats=4, setup=lambda: calls.append(1))
+    assert result == 4 and len(calls) == 4
+    stage = stages["stage"]
+    assert stage["repeats"] == 4
+    assert stage["seconds"] <= stage["median_seconds"]
+    assert stage["items"] == 10
+
+
+def test_compare_results_needs_a_relative_and_an_absolute_slowdown():
+    baseline = _results(csv_load=1.0, alias_resolution=0.003, limit_check=0.07)
+    current = _results(csv_load=1.3, alias_resolution=0.006, limit_check=0.08, new_stage=5.0)
+    assert compare_results(current, baseline) == [(1, "csv_load", 1.0, 1.3)]
+    assert compare_results(current, baseline, min_delta=0.0) == [
+        (1, "csv_load", 1.0, 1.3), (1, "alias_resolution", 0.003, 0.006)]
@@ -0,0 +1,73 @@
+import openpyxl
+import pytest
+
+from build_sheet import (
+    EU_FORMULA, IFRA_FORMULA, build_sheet, calculation_formulas, rebuild_tabs, sheet_order,
+    workbook_has_lookup
+)
+from conftest import write_release
+from lookup_tab import LOOKUP_TAB
+from verify_sheet import verify_sheet
+
+TABLES = {
+    "DB_Standards": [["Citral", "5392-40-5", "0.6"], ["Linalool", "78-70-6", "5"]],
+    "DB_Naturals": [["Lemon oil", "Citral", "5392-40-5", "3"]],
+    "DB_Inventory": [["Lemon", "Lemon oil", ""]],
+    "DB_User_Materials": [["A1", "Citrus Base", "Lemon oil", "", "50"]],
+    "DB_EU_Allergens": [["Citral", "5392-40-5"]]
+}
+
+
+def _build(tmp_path, lookup):
+    release_dir = write_release(tmp_path / "release", TABLES)
+    xlsx_file = str(tmp_path / "workbook.xlsx")
+    assert build_sheet("0.0.0", [xlsx_file], release_dir, lookup=lookup)
+    return release_dir, xlsx_file
+
+
+def _layout(xlsx_file):
+    wb = openpyxl.load_workbook(xlsx_file, read_only=True)
+    try:
+        return wb.sheetnames, wb["IFRA_Compliance"]["A1"].value, wb["EU_Allergen_Labeling"]["A1"].value
+    finally:
+        wb.close()
+
+
+def test_default_build_calculates_from_the_live_db_tabs(tmp_path):
+    release_dir, xlsx_file = _build(tmp_path, lookup=False)
+    assert _layout(xlsx_file) == (sheet_order(), IFRA_FORMULA, EU_FORMULA)
+    assert LOOKUP_TAB not in sheet_order()
+    assert "DB_Standards!A2:C" in IFRA_FORMULA and "DB_User_Materials!A2:E" in EU_FORMULA
+    assert verify_sheet(xlsx_file, release_dir, workers=1)
+
+
+def test_lookup_build_is_opt_in(tmp_path):
+    release_dir, xlsx_file = _build(tmp_path, lookup=True)
+    assert _layout(xlsx_file) == (sheet_order(True), *calculation_formulas(True))
+    assert sheet_order(True)[-1] == LOOKUP_TAB
+    assert verify_sheet(xlsx_file, release_dir, workers=1)
+
+
+@pytest.mark.parametrize("lookup", [False, True])
+def test_rebuild_tabs_keeps_the_layout(tmp_path, lookup, capsys):
+    release_dir, xlsx_file = _build(tmp_path, lookup)
+    edited = {**TABLES, "DB_Standards": [*TABLES["DB_Standards"], ["Geraniol", "106-24-1", "4.7"]]}
+    write_release(release_dir, edited)
+    capsys.readouterr()
+    assert rebuild_tabs(["DB_Standards"], "0.0.0", [xlsx_file], release_dir)
+    rebuilt = capsys.readouterr().out
+    assert ("Rebuilt tab 'DB_Lookup'" in rebuilt) == lookup
+    assert _layout(xlsx_file) == (sheet_order(lookup), *calculation_formulas(lookup))
+    assert verify_sheet(xlsx_file, release_dir, workers=1)
+
+
+@pytest.mark.parametrize("lookup", [False, True])
+def test_rebuild_tabs_switches_the_layout(tmp_path, lookup):
+    release_dir, xlsx_file = _build(tmp_path, lookup)
+    assert workbook_has_lookup(xlsx_file) is lookup
+    assert workbook_has_lookup(str(tmp_path / "missing.xlsx")) is None
+    # Asking for the other layout builds the workbook fresh, even with no changed tab
+    assert rebuild_tabs([], "0.0.0", [xlsx_file], release_dir, lookup=not lookup)
+    assert workbook_has_lookup(xlsx_file) is (not lookup)
+    assert _layout(xlsx_file) == (sheet_order(not lookup), *calculation_formulas(not lookup))
+    assert verify_sheet(xlsx_file, release_dir, workers=1)
@@ -0,0 +1,145 @@
+import random
+
+import pytest
+
+from compliance_engine import (
+    DB_FILES, NO_ID, SOURCE_BASE, SOURCE_DIRECT, SOURCE_NATURAL, CompositionTable, Interner, ReferenceDB,
+    compute_exposure, evaluate_formula, group_by_standard, ifra_details, iter_formula_lines, parse_naturals,
+    parse_user_materials
+)
+from conftest import REAL_RELEASE_DIR
+from db_snapshot import read_csv_table
+
+SEED = 15
+
+
+# --- Dict reference engine (the string-keyed engine the CSR tables replaced) ---
+
+class DictEngine:
+    def __init__(self, db, tables):
+        self.db = db
+        self.naturals = parse_naturals(tables["DB_Naturals"])
+        self.user_materials = parse_user_materials(tables["DB_User_Materials"])
+
+    def material_contributions(self, resolved_norm):
+        if resolved_norm in self.user_materials:
+            parts, source_type = self.user_materials[resolved_norm], SOURCE_BASE
+        elif resolved_norm in self.naturals:
+            parts, source_type = self.naturals[resolved_norm], SOURCE_NATURAL
+        else:
+            std = self.db.std_by_name.get(resolved_norm)
+            parts = [{"cas": std.cas[0], "percentage": 100.0}] if std and std.cas else []
+            source_type = SOURCE_DIRECT
+        return tuple((str(c["cas"]).strip(), c["percentage"] / 100.0)
+                     for c in parts if c["cas"] and str(c["cas"]).strip()), source_type
+
+    def compute_exposure(self, formula):
+        exposure = {}
+        total_amount = 0.0
+        for name, amount in iter_formula_lines(formula):
+            total_amount += amount
+            contributions, source_type = self.material_contributions(self.db.resolve_name(name))
+            for cas, fraction in contributions:
+                c_amount = amount * fraction
+                entry = exposure.setdefault(cas, {"total": 0.0, "sources": {}})
+                entry["total"] += c_amount
+                entry["sources"][(name, source_type)] = entry["sources"].get((name, source_type), 0.0) + c_amount
+        return exposure, total_amount
+
+    def group_by_standard(self, exposure, category=None):
+        grouped = {}
+        for cas, entry in exposure.items():
+            std = self.db.std_by_cas.get(cas)
+            if entry["total"] <= 0 or std is None:
+                continue
+            group = grouped.setdefault(std.name, {"limit": std.category_limit(category), "total": 0.0,
+                                                  "sources": [], "casList": [], "normName": std.norm_name})
+            group["total"] += entry["total"]
+            group["casList"].append(cas)
+            group["sources"].extend(entry["sources"].items())
+        return grouped
+
+
+@pytest.fixture(scope="module")
+def tables():
+    return {tab_name: read_csv_table(f"{REAL_RELEASE_DIR}/{csv_file}")[1] for tab_name, csv_file in DB_FILES.items()}
+
+
+@pytest.fixture(scope="module")
+def dict_engine(real_db, tables):
+    return DictEngine(real_db, tables)
+
+
+def _names(db):
+    return [*db.inventory, *db.user_materials, *db.naturals, *db.std_by_name, "not a material", ""]
+
+
+def test_contributions_match_dict_engine_for_every_name(real_db, dict_engine):
+    for name in _names(real_db):
+        resolved = real_db.resolve_name(name)
+        assert real_db.material_contributions(resolved) == dict_engine.material_contributions(resolved)
+
+
+@pytest.mark.parametrize("category", [None, "4", "5A"])
+def test_exposure_and_groups_match_dict_engine(real_db, dict_engine, category):
+    rng = random.Random(f"{SEED}-{category}")
+    names = _names(real_db)
+    for _ in range(150):
+        formula = [[rng.choice(names), rng.choice([round(rng.uniform(0.001, 30.0), 4), 0, "", "2.5"])]
+                   for _ in range(rng.randint(1, 40))]
+        exposure, total_amount = compute_exposure(formula, real_db)
+        expected, expected_total = dict_engine.compute_exposure(formula)
+        assert total_amount == expected_total
+        # Same CAS order, totals and per-source sums, bit for bit
+        assert [(real_db.cas[cas_id], total, {real_db.sources[s]: a for s, a in sources.items()})
+                for cas_id, (total, sources) in exposure.items()] == \
+            [(cas, e["total"], e["sources"]) for cas, e in expected.items()]
+        assert group_by_standard(exposure, real_db, category) == dict_engine.group_by_standard(expected, category)
+
+
+def test_composition_table_round_trips_parsed_dicts(real_db, tables):
+    for table, parse, tab_name in ((real_db.naturals, parse_naturals, "DB_Naturals"),
+                                   (real_db.user_materials, parse_user_materials, "DB_User_Materials")):
+        parsed = parse(tables[tab_name])
+        assert list(table) == list(parsed)
+        assert table == parsed
+        assert len(table) == len(parsed)
+        assert table.nbytes < 200_000
+
+
+def test_replaced_and_deleted_rows():
+    names, cas, constituents = Interner(), Interner(), Interner()
+    table = CompositionTable(names, cas, constituents).load([
+        ("lemon oil", "Citral", "5392-40-5", 3.0), ("base", "Lemon oil", "", 50.0),
+        ("lemon oil", "Limonene", " 5989-27-5 ", 65.0)
+    ])
+    assert list(table) == ["lemon oil", "base"]
+    assert table["lemon oil"] == [{"chemical": "Citral", "cas": "5392-40-5", "percentage": 3.0},
+                                  {"chemical": "Limonene", "cas": "5989-27-5", "percentage": 65.0}]
+    assert list(table.row_parts(table.row("base"))) == [(NO_ID, 50.0)]
+
+    copy = table.copy()
+    table["lemon oil"] = [{"chemical": "Citral", "cas": "5392-40-5", "percentage": 4.0}]
+    del table["base"]
+    assert list(table) == ["lemon oil"] and len(table) == 1 and "base" not in table
+    assert table["lemon oil"][0]["percentage"] == 4.0
+    with pytest.raises(KeyError):
+        table["base"]
+    # The copy shares the interned ids but not the rows
+    assert list(copy) == ["lemon oil", "base"] and copy["lemon oil"][0]["percentage"] == 3.0
+    assert copy.cas is table.cas
+
+    db = ReferenceDB([], copy, {}, {}, interners=(names, cas, constituents))
+    assert db.naturals is copy
+    assert db.material_contributions("lemon oil") == ((("5392-40-5", 0.03), ("5989-27-5", 0.65)), SOURCE_NATURAL)
+
+
+def test_reports_match_dict_engine(real_db, dict_engine):
+    # End to end: the same report rows whether groups come from ids or strings
+    rng = random.Random(SEED)
+    names = _names(real_db)
+    formula = [[rng.choice(names), round(rng.uniform(0.1, 20.0), 3)] for _ in range(60)]
+    exposure, total_amount = dict_engine.compute_exposure(formula)
+    details = ifra_details(dict_engine.group_by_standard(exposure), total_amount, 20.0)
+    assert details
+    assert evaluate_formula(formula, real_db, "20")["details"] == details
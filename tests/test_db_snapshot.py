@@ -0,0 +1,98 @@
+import os
+
+import db_snapshot
+from compliance_engine import ReferenceDB
+from conftest import REAL_RELEASE_DIR, write_release
+from db_snapshot import compile_snapshot, open_snapshot
+
+TABLES = {
+    "DB_Standards": [["Hedione", "24851-98-7", "NA"], ["Citral", "5392-40-5", "0.6"]],
+    "DB_Naturals": [["Lemon oil", "Citral", "5392-40-5", "3"], ["Lemon oil", "None", "null", "2"]],
+    "DB_Inventory": [["Lemon", "Lemon oil", ""], ["NA", "Lemon oil", ""]],
+    "DB_User_Materials": [["A1", "Citrus Base", "Lemon oil", "", "50"], ["A2", "Citrus Base", "Citral", "5392-40-5", "10"]],
+    "DB_EU_Allergens": [["Citral", "5392-40-5"]]
+}
+
+
+def _compile(tmp_path, release_dir):
+    path = str(tmp_path / "db.snapshot")
+    compile_snapshot(release_dir, path)
+    return path
+
+
+def _same_db(a, b, names):
+    assert a.standards == b.standards
+    assert a.naturals == b.naturals
+    assert a.inventory == b.inventory
+    assert a.user_materials == b.user_materials
+    assert a.allergens == b.allergens
+    assert a.std_by_cas == b.std_by_cas
+    for name in names:
+        assert a.line_contributions(name) == b.line_contributions(name)
+
+
+def test_snapshot_matches_csv_including_na_cells(tmp_path):
+    release_dir = write_release(tmp_path / "release", TABLES)
+    snapshot = open_snapshot(_compile(tmp_path, release_dir), release_dir)
+    db = snapshot.reference_db()
+    csv_db = ReferenceDB.from_csv_dir(release_dir)
+    # Same interned ids and CSR arrays, copied rather than re-parsed
+    assert db.names.values == csv_db.names.values and db.naturals.comp_cas == csv_db.naturals.comp_cas
+    _same_db(db, csv_db, ["Lemon", "Citrus Base", "Hedione", "Citral", "NA", "unknown"])
+    # "NA" / "None" / "null" cells are empty on both paths
+    assert "na" not in csv_db.inventory
+    assert csv_db.naturals["lemon oil"][1]["cas"] == ""
+    snapshot.close()
+
+
+def test_snapshot_matches_real_release(tmp_path, real_db):
+    snapshot = open_snapshot(_compile(tmp_path, REAL_RELEASE_DIR), REAL_RELEASE_DIR)
+    names = [*real_db.inventory, *list(real_db.user_materials)[:500], *real_db.naturals, "not a material"]
+    _same_db(snapshot.reference_db(), real_db, names)
+    snapshot.close()
+
+
+def test_snapshot_db_outlives_snapshot(tmp_path):
+    release_dir = write_release(tmp_path / "release", TABLES)
+    snapshot = open_snapshot(_compile(tmp_path, release_dir), release_dir)
+    db = snapshot.reference_db()
+    snapshot.close()
+    assert db.user_materials["citrus base"][1]["cas"] == "5392-40-5"
+    assert db.line_contributions("Citrus Base")[1] == "Indirect (Base)"
+
+
+def test_stale_on_csv_or_code_change(tmp_path, monkeypatch):
+    release_dir = write_release(tmp_path / "release", TABLES)
+    path = _compile(tmp_path, release_dir)
+    assert open_snapshot(path, release_dir) is not None
+
+    monkeypatch.setattr(db_snapshot, "_code_fingerprint", "other parsing code")
+    assert open_snapshot(path, release_dir) is None
+    monkeypatch.undo()
+
+    with open(os.path.join(release_dir, "DB_Naturals.csv"), "a", encoding="utf-8") as f:
+        f.write("Lime oil,Citral,5392-40-5,4\n")
+    assert open_snapshot(path, release_dir) is None
+
+
+def test_other_snapshot_version_is_ignored(tmp_path, monkeypatch):
+    release_dir = write_release(tmp_path / "release", TABLES)
+    path = _compile(tmp_path, release_dir)
+    monkeypatch.setattr(db_snapshot, "SNAPSHOT_VERSION", db_snapshot.SNAPSHOT_VERSION + 1)
+    assert open_snapshot(path, release_dir) is None
+
+
+def test_snapshot_is_plain_arrays_in_the_release_dir(tmp_path, monkeypatch):
+    release_dir = write_release(tmp_path / "release", TABLES)
+    compile_snapshot(release_dir)
+    path = os.path.join(release_dir, "reference_db.snapshot")
+    snapshot = open_snapshot(release_dir=release_dir)
+    assert snapshot.path == path
+    assert not any(name.startswith("pickle.") for name in snapshot.header["arrays"])
+    assert snapshot.header["arrays"]["standards.limits"]["dtype"] == "<f8"
+    snapshot.close()
+
+    # A snapshot file in the working directory is never picked up
+    monkeypatch.chdir(tmp_path)
+    os.replace(path, tmp_path / "reference_db.snapshot")
+    assert open_snapshot(release_dir=release_dir) is None
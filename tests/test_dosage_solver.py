@@ -0,0 +1,84 @@
+import math
+import subprocess
+import sys
+
+import pytest
+
+from compliance_engine import PHOTOTOXICITY_ROW_NAME, ifra_details
+from conftest import ROOT
+from dosage_solver import MAX_DOSAGE, _engine_ceiling, dosage_constraints, solve_grouped
+
+
+def _group(total, limit, norm_name="x"):
+    return {"limit": limit, "total": total, "sources": [], "casList": ["1-1-1"], "normName": norm_name}
+
+
+def _passes(grouped, total_amount, dosage):
+    return all(d["status"] == "PASS" for d in ifra_details(grouped, total_amount, dosage))
+
+
+# limit / rate for these lands one ulp (or two) above what ifra_details still passes
+@pytest.mark.parametrize("total, total_amount, limit", [
+    (4.601, 296.9, 0.117),
+    (3.939, 494.8, 0.158),
+    (6.707, 100.8, 0.584)
+])
+def test_engine_ceiling_steps_down_to_the_last_passing_float(total, total_amount, limit):
+    grouped = {"X": _group(total, limit)}
+    analytic = dosage_constraints(grouped, total_amount)[0]["max_dosage"]
+    assert not _passes(grouped, total_amount, analytic)
+
+    max_dosage = solve_grouped(grouped, total_amount)["max_dosage"]
+    assert max_dosage < analytic
+    assert _passes(grouped, total_amount, max_dosage)
+    assert not _passes(grouped, total_amount, math.nextafter(max_dosage, math.inf))
+
+
+def test_engine_ceiling_keeps_a_passing_dosage():
+    grouped = {"X": _group(1.0, 0.5)}
+    assert _engine_ceiling(grouped, 100.0, 50.0) == 50.0
+    assert _engine_ceiling(grouped, 100.0, 0.0) == 0.0
+
+
+def test_headroom_against_the_finished_dosage():
+    # 2% of the concentrate, limit 0.5% -> 25% finished dosage at most
+    result = solve_grouped({"X": _group(2.0, 0.5)}, 100.0, "20%")
+    assert result["max_dosage"] == 25.0
+    assert result["binding"]["ingredient"] == "X"
+    assert result["dosage"] == 20.0
+    assert result["headroom"] == 5.0
+    assert result["headroom_factor"] == 1.25
+
+    over = solve_grouped({"X": _group(2.0, 0.5)}, 100.0, 50)
+    assert over["headroom"] == -25.0
+    assert over["headroom_factor"] == 0.5
+
+
+def test_no_binding_limit_caps_at_max_dosage():
+    result = solve_grouped({"X": _group(0.1, 5.0)}, 100.0)
+    assert result["binding"] is None
+    assert result["max_dosage"] == MAX_DOSAGE
+    assert result["dosage"] == 100.0
+    assert result["headroom"] == 0.0
+    assert result["headroom_factor"] == 1.0
+
+
+def test_phototoxic_sum_of_ratios_binds():
+    # Each oil alone allows 50% / 40%; together the ratios sum to 1 at 1 / (1/50 + 1/40) %
+    grouped = {
+        "Bergamot oil expressed": _group(1.0, 0.5, "bergamot oil expressed"),
+        "Lime oil expressed": _group(1.0, 0.4, "lime oil expressed")
+    }
+    result = solve_grouped(grouped, 100.0, 10)
+    assert result["binding"]["ingredient"] == PHOTOTOXICITY_ROW_NAME
+    assert result["max_dosage"] == pytest.approx(1.0 / (1.0 / 50.0 + 1.0 / 40.0))
+    assert _passes(grouped, 100.0, result["max_dosage"])
+
+
+def test_cli_rejects_an_unknown_category(tmp_path):
+    formula = tmp_path / "formula.csv"
+    formula.write_text("Ingredient,Amount\nLinalool,10\n", encoding="utf-8")
+    proc = subprocess.run([sys.executable, "dosage_solver.py", str(formula), "--category", "99"],
+                          cwd=ROOT, capture_output=True, text=True)
+    assert proc.returncode == 2
+    assert "--category" in proc.stderr and "Traceback" not in proc.stderr
@@ -0,0 +1,173 @@
+import csv
+
+import pytest
+
+from compliance_engine import SOURCE_BASE, SOURCE_DIRECT, SOURCE_NATURAL, ReferenceDB, compute_exposure
+from conftest import write_release
+from eu_labeling import (
+    EU_HEADERS, LEAVE_ON, RINSE_OFF, AllergenIndex, allergen_details, eu_labeling, evaluate_labeling, label_skus,
+    labeling_table, write_sku_labels
+)
+
+TABLES = {
+    "DB_Standards": [["Citral", "5392-40-5", "0.6"]],
+    "DB_Naturals": [["Lemon oil", "Citral", "5392-40-5", "3"], ["Lemon oil", "Limonene", "5989-27-5", "65"],
+                    ["Rose oil", "Citronellol", "106-22-9", "30"], ["Rose oil", "l-Citronellol", "7540-51-4", "10"],
+                    ["Rose oil", "Geraniol", "106-24-1", "15"]],
+    "DB_Inventory": [["Lemon", "Lemon oil", ""]],
+    "DB_User_Materials": [["A1", "Citrus Base", "Citral", "5392-40-5", "2"],
+                          ["A1", "Citrus Base", "Linalool", "78-70-6", "10"],
+                          ["B2", "Rose Base", "Citronellol", "106-22-9", "0.5"],
+                          ["B2", "Rose Base", "Geraniol", "106-24-1", "0.2"],
+                          ["C3", "Plain Base", "Ethanol", "64-17-5", "100"]],
+    "DB_EU_Allergens": [["Citral", "5392-40-5"], ["Limonene", "5989-27-5"], ["Linalool", "78-70-6"],
+                        ["Citronellol", "106-22-9|7540-51-4"], ["Geraniol", "106-24-1"], ["Farnesol", ""]]
+}
+
+MIXED = [["Lemon", 10], ["Citrus Base", 5], ["Rose oil", 2], ["Linalool", 1], ["5989-27-5", 0.5], ["DPG", 81.5]]
+
+
+def _table(threshold, rows, footer):
+    # rows: (name, CAS references, concentration, required, sources) as EU_LABELING_V5 prints them
+    return [EU_HEADERS, *([name, cas, conc, threshold, "REQUIRED" if required else "NO", sources]
+                          for name, cas, conc, required, sources in rows), [footer, "", "", "", "", ""]]
+
+
+# EU_LABELING_V5 outputs (Code.js under node) for the tables above: (formula, dosage, leave-on, rinse-off)
+V5_CASES = [
+    (MIXED, "20",
+     _table(0.1, [("Limonene", "5989-27-5", 1.4, True, "Lemon (1.3000%), Direct (0.1000%)"),
+                  ("Linalool", "78-70-6", 0.3, True, "Direct (0.2000%), Citrus Base (0.1000%)"),
+                  ("Citronellol", "106-22-9, 7540-51-4", 0.16, True, "Rose oil (0.1600%)"),
+                  ("Citral", "5392-40-5", 0.08, False, "Lemon (0.0600%), Citrus Base (0.0200%)"),
+                  ("Geraniol", "106-24-1", 0.06, False, "Rose oil (0.0600%)")],
+            "Required Labels: Limonene, Linalool, Citronellol (Dosage: 20%)"),
+     _table(1, [("Limonene", "5989-27-5", 1.4, True, "Lemon (1.3000%), Direct (0.1000%)"),
+                ("Linalool", "78-70-6", 0.3, False, "Direct (0.2000%), Citrus Base (0.1000%)"),
+                ("Citronellol", "106-22-9, 7540-51-4", 0.16, False, "Rose oil (0.1600%)"),
+                ("Citral", "5392-40-5", 0.08, False, "Lemon (0.0600%), Citrus Base (0.0200%)"),
+                ("Geraniol", "106-24-1", 0.06, False, "Rose oil (0.0600%)")],
+            "Required Labels: Limonene (Dosage: 20%)")),
+    # Exactly at the leave-on threshold: not required
+    ([["Linalool", 1], ["DPG", 99]], "10",
+     _table(0.1, [("Linalool", "78-70-6", 0.1, False, "Direct (0.1000%)")],
+            "No allergens exceed threshold (Dosage: 10%)"),
+     _table(1, [("Linalool", "78-70-6", 0.1, False, "Direct (0.1000%)")],
+            "No allergens exceed threshold (Dosage: 10%)")),
+    # Just above it: required, though the rounded concentration still reads 0.1
+    ([["Linalool", 1.000001], ["DPG", 98.999999]], "10%",
+     _table(0.1, [("Linalool", "78-70-6", 0.1, True, "Direct (0.1000%)")],
+            "Required Labels: Linalool (Dosage: 10%)"),
+     _table(1, [("Linalool", "78-70-6", 0.1, False, "Direct (0.1000%)")],
+            "No allergens exceed threshold (Dosage: 10%)")),
+    # Exactly at the rinse-off threshold, then just above it
+    ([["Linalool", 1], ["DPG", 99]], None,
+     _table(0.1, [("Linalool", "78-70-6", 1, True, "Direct (1.0000%)")],
+            "Required Labels: Linalool (Dosage: 100%)"),
+     _table(1, [("Linalool", "78-70-6", 1, False, "Direct (1.0000%)")],
+            "No allergens exceed threshold (Dosage: 100%)")),
+    ([["Linalool", 1.0001], ["DPG", 98.9999]], None,
+     _table(0.1, [("Linalool", "78-70-6", 1.0001, True, "Direct (1.0001%)")],
+            "Required Labels: Linalool (Dosage: 100%)"),
+     _table(1, [("Linalool", "78-70-6", 1.0001, True, "Direct (1.0001%)")],
+            "Required Labels: Linalool (Dosage: 100%)")),
+    ([["DPG", 100]], None,
+     _table(0.1, [], "No allergens exceed threshold (Dosage: 100%)"),
+     _table(1, [], "No allergens exceed threshold (Dosage: 100%)")),
+]
+
+
+@pytest.fixture(scope="module")
+def release_dir(tmp_path_factory):
+    return write_release(tmp_path_factory.mktemp("release"), TABLES)
+
+
+@pytest.fixture(scope="module")
+def db(release_dir):
+    return ReferenceDB.from_csv_dir(release_dir)
+
+
+@pytest.fixture(scope="module")
+def index(db):
+    return AllergenIndex(db)
+
+
+def test_allergen_index(db, index):
+    assert [a["name"] for a in index.allergens] == ["Citral", "Limonene", "Linalool", "Citronellol", "Geraniol",
+                                                    "Farnesol"]
+    # Both Citronellol isomers point at the one allergen; Farnesol has no CAS to index
+    assert {db.cas[cas_id]: positions for cas_id, positions in index.by_cas.items()} == {
+        "5392-40-5": [0], "5989-27-5": [1], "78-70-6": [2], "106-22-9": [3], "7540-51-4": [3], "106-24-1": [4]}
+    assert [[db.cas[cas_id] for cas_id in ids] for ids in index.cas_ids] == [
+        ["5392-40-5"], ["5989-27-5"], ["78-70-6"], ["106-22-9", "7540-51-4"], ["106-24-1"], []]
+    assert index.by_name["farnesol"] == 5
+
+
+@pytest.mark.parametrize("name, expected", [
+    ("Citrus Base", (((("5392-40-5", 0.02), ("78-70-6", 0.1)), SOURCE_BASE))),
+    ("Lemon", ((("5392-40-5", 0.03), ("5989-27-5", 0.65)), SOURCE_NATURAL)),
+    (" Citronellol ", ((("106-22-9", 1.0),), SOURCE_DIRECT)),
+    ("5989-27-5", ((("5989-27-5", 1.0),), SOURCE_DIRECT)),
+    ("Farnesol", ((), SOURCE_DIRECT)),
+    ("DPG", ((), SOURCE_DIRECT)),
+])
+def test_line_contributions(index, name, expected):
+    assert index.line_contributions(name) == expected
+    contributions, source_id = index.line_ids(name)
+    assert [(index.db.cas[cas_id], fraction) for cas_id, fraction in contributions] == list(expected[0])
+    assert index.db.sources[source_id] == (name, expected[1])
+
+
+def test_allergen_details_thresholds(db, index):
+    # Leave-on (0.001) and rinse-off (0.01) are compared as concentrations in %, both from one pass
+    exposure, total_amount = compute_exposure([["Linalool", 1], ["DPG", 99]], db, index.line_ids)
+    at_leave_on, = allergen_details(exposure, total_amount, 10.0, index)
+    at_rinse_off, = allergen_details(exposure, total_amount, 100.0, index)
+    assert (at_leave_on["conc"], at_leave_on["required"]) == (0.1, {LEAVE_ON: False, RINSE_OFF: False})
+    assert (at_rinse_off["conc"], at_rinse_off["required"]) == (1.0, {LEAVE_ON: True, RINSE_OFF: False})
+
+    exposure, total_amount = compute_exposure(MIXED, db, index.line_ids)
+    details = allergen_details(exposure, total_amount, 20.0, index)
+    # Table order of DB_EU_Allergens, the isomers summed into one row
+    assert [(d["name"], d["cas"]) for d in details] == [
+        ("Citral", "5392-40-5"), ("Limonene", "5989-27-5"), ("Linalool", "78-70-6"),
+        ("Citronellol", "106-22-9, 7540-51-4"), ("Geraniol", "106-24-1")]
+    assert details[3]["sources"] == "Rose oil (0.1600%)"
+    assert allergen_details({}, 0.0, 100.0, index) == []
+
+
+@pytest.mark.parametrize("formula, dosage, leave_on, rinse_off", V5_CASES)
+def test_labeling_table_matches_eu_labeling_v5(db, index, formula, dosage, leave_on, rinse_off):
+    report = evaluate_labeling(formula, db, dosage, index)
+    assert labeling_table(report, "Leave-on") == leave_on
+    assert labeling_table(report, " RINSE-OFF ") == rinse_off
+    # Anything but rinse-off is leave-on, and the one-call wrapper builds the same table
+    assert labeling_table(report, "Spray") == leave_on
+    assert eu_labeling(formula, db, "Rinse-off", dosage) == rinse_off
+
+
+EXPECTED_LABELS = [
+    {"sku": "A1", "material": "Citrus Base", LEAVE_ON: ["Linalool", "Citral"], RINSE_OFF: ["Linalool", "Citral"]},
+    {"sku": "B2", "material": "Rose Base", LEAVE_ON: ["Citronellol", "Geraniol"], RINSE_OFF: []},
+    {"sku": "C3", "material": "Plain Base", LEAVE_ON: [], RINSE_OFF: []},
+]
+
+
+def test_label_skus(db, release_dir):
+    # One row per SKU (first row wins), allergens by concentration as EU_LABELING_V5 lists the REQUIRED rows
+    assert list(label_skus(db, release_dir=release_dir)) == EXPECTED_LABELS
+    rose_base = next(label for label in label_skus(db, "60", release_dir) if label["sku"] == "B2")
+    assert rose_base[LEAVE_ON] == ["Citronellol", "Geraniol"]
+    assert next(label for label in label_skus(db, "30", release_dir) if label["sku"] == "B2")[LEAVE_ON] == \
+        ["Citronellol"]
+
+
+def test_write_sku_labels(db, release_dir, tmp_path):
+    path = str(tmp_path / "labels.csv")
+    assert write_sku_labels(path, db, release_dir=release_dir) == 3
+    with open(path, newline="", encoding="utf-8") as f:
+        assert list(csv.reader(f)) == [
+            ["SKU", "Material Name", "Leave-on Allergens", "Rinse-off Allergens"],
+            ["A1", "Citrus Base", "Linalool, Citral", "Linalool, Citral"],
+            ["B2", "Rose Base", "Citronellol, Geraniol", ""],
+            ["C3", "Plain Base", "", ""]]
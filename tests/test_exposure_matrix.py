@@ -0,0 +1,100 @@
+import random
+
+import numpy as np
+import pytest
+
+from compliance_engine import PHOTOTOXICITY_ROW_NAME, ReferenceDB, evaluate_formula
+from conftest import write_release
+from exposure_matrix import ExposureMatrix
+
+TABLES = {
+    "DB_Standards": [["Citral", "5392-40-5", "0.6"], ["Iso", "1-1-1|2-2-2", "1"],
+                     ["Bergamot oil expressed", "8007-75-8", "0.4"], ["Lime oil expressed", "8008-26-2", "0.7"]],
+    # A negative percentage leaves 2-2-2 with a negative formula total, which the engine skips
+    "DB_Naturals": [["Lemon oil", "Citral", "5392-40-5", "3"], ["Weird oil", "Iso a", "1-1-1", "10"],
+                    ["Weird oil", "Iso b", "2-2-2", "-5"]],
+    "DB_User_Materials": [["A1", "Citrus Base", "Citral", "5392-40-5", "2"],
+                          ["A1", "Citrus Base", "Bergamot", "8007-75-8", "5"]]
+}
+DOSAGES = [100, 50, 20, "15", 10, 5, 1]
+
+
+@pytest.fixture(scope="module")
+def db(tmp_path_factory):
+    return ReferenceDB.from_csv_dir(write_release(tmp_path_factory.mktemp("release"), TABLES))
+
+
+def _at_limit_formulas():
+    # Diluted so that one standard lands on (or a rounding step away from) its limit
+    rng = random.Random(2)
+    cases = []
+    for _ in range(400):
+        name, limit = rng.choice([("Citral", 0.6), ("Bergamot oil expressed", 0.4), ("Lime oil expressed", 0.7)])
+        amount = round(rng.uniform(0.1, 5.0), rng.choice([1, 2, 3]))
+        dosage = rng.choice(DOSAGES)
+        dpg = round(amount * float(dosage) / limit - amount, 6)
+        cases.append(([[name, amount], ["Lemon oil", round(rng.uniform(0, 0.01), 4)], ["DPG", dpg]], dosage))
+    return cases
+
+
+def _assert_matches_engine(matrix, db, cases):
+    scores = matrix.score([f for f, _ in cases], [d for _, d in cases])
+    conc = scores["concentrations"].toarray()
+    index = {name: i for i, name in enumerate(scores["standard_names"])}
+    for i, (formula, dosage) in enumerate(cases):
+        report = evaluate_formula(formula, db, dosage)
+        assert (scores["fail_count"][i], scores["passed"][i]) == (report["fail_count"], report["passed"]), formula
+        expected = np.zeros(len(index))
+        for d in report["details"]:
+            if d["ingredient"] != PHOTOTOXICITY_ROW_NAME:
+                expected[index[d["ingredient"]]] = d["conc"]
+        np.testing.assert_allclose(conc[i], expected, rtol=1e-12, atol=0)
+    return scores
+
+
+def test_at_limit_formulas_match_the_engine(db):
+    cases = _at_limit_formulas()
+    reports = [evaluate_formula(f, db, d) for f, d in cases]
+    # The batch really sits on the limits: some exactly at it (PASS), some one rounding step over (FAIL)
+    at_limit = [d for r in reports for d in r["details"] if d["conc"] == d["limit"]]
+    just_over = [d for r in reports for d in r["details"]
+                 if d["status"] == "FAIL" and d["conc"] == pytest.approx(d["limit"], rel=1e-12)]
+    assert at_limit and just_over
+    scores = _assert_matches_engine(ExposureMatrix(db), db, cases)
+    # Formulas with a boundary concentration carry the engine's exact values
+    conc = scores["concentrations"].toarray()
+    index = {name: i for i, name in enumerate(scores["standard_names"])}
+    for i, report in enumerate(reports):
+        for d in report["details"]:
+            if d["ingredient"] in index and d["conc"] == pytest.approx(d["limit"], rel=1e-12):
+                assert conc[i, index[d["ingredient"]]] == d["conc"]
+
+
+def test_phototoxic_sum_at_the_limit(db):
+    # Bergamot 0.2% (half its limit) plus Lime 0.35% (half its limit): a sum of ratios of 1, PASS
+    formula = [["Bergamot oil expressed", 0.2], ["Lime oil expressed", 0.35], ["DPG", 99.45]]
+    matrix = ExposureMatrix(db)
+    scores = matrix.score([formula, formula + [["Lime oil expressed", 0.0001]]])
+    assert list(scores["fail_count"]) == [evaluate_formula(f, db)["fail_count"] for f in
+                                          (formula, formula + [["Lime oil expressed", 0.0001]])]
+    _, _, photo_ratio = matrix.engine_row(formula, 100.0)
+    assert scores["phototoxic_ratio"][0] == photo_ratio
+
+
+def test_non_positive_cas_totals_are_skipped(db):
+    # 1-1-1 contributes, 2-2-2 is negative: Iso is 1.2%, over its 1% limit
+    cases = [([["Weird oil", 12], ["DPG", 88]], None), ([["Weird oil", 10], ["DPG", 90]], None)]
+    scores = _assert_matches_engine(ExposureMatrix(db), db, cases)
+    assert list(scores["passed"]) == [False, True]
+
+
+def test_score_categories_matches_the_engine(real_db):
+    rng = random.Random(3)
+    names = sorted(real_db.std_by_name) + sorted(real_db.naturals)
+    formulas = [[[rng.choice(names), round(rng.uniform(0.001, 10.0), 3)] for _ in range(rng.randint(1, 30))]
+                for _ in range(40)]
+    matrix = ExposureMatrix(real_db)
+    scores = matrix.score_categories(formulas, 20)
+    for c, category in enumerate(matrix.categories):
+        assert list(scores["fail_count"][:, c]) == [evaluate_formula(f, real_db, 20, category)["fail_count"]
+                                                    for f in formulas]
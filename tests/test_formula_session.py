@@ -0,0 +1,143 @@
+import random
+
+import numpy as np
+import pytest
+
+from compliance_engine import compute_exposure, evaluate_formula, group_by_standard
+from eu_labeling import AllergenIndex, evaluate_labeling
+from exposure_matrix import ExposureMatrix
+from formula_session import FormulaSession
+
+SEED = 14
+DOSAGES = [None, "20", 3.5, "0.8%"]
+
+
+def _names(db, rng, n=400):
+    # Aliases, bases, naturals, direct standards and a few unknown names
+    pools = [sorted(db.inventory), sorted(db.user_materials), sorted(db.naturals), sorted(db.std_by_name)]
+    names = [rng.choice(rng.choice(pools)) for _ in range(n)]
+    return names + ["not a material", "DPG", "Ethanol"]
+
+
+def _amount(rng):
+    # Mostly valid amounts, plus every kind of line the engine skips
+    return rng.choice([round(rng.uniform(0.001, 30.0), 4), rng.uniform(0.0, 1.0), 1e-9, 12, "7.25",
+                       0, -3, "", None, "abc"])
+
+
+def _formula(rng, names, lines=None):
+    return [[rng.choice(names), _amount(rng)] for _ in range(lines or rng.randint(1, 40))]
+
+
+@pytest.fixture(scope="module")
+def names(real_db):
+    return _names(real_db, random.Random(SEED))
+
+
+@pytest.fixture(scope="module")
+def allergen_index(real_db):
+    return AllergenIndex(real_db)
+
+
+def _assert_matches_full_recalc(session, db, allergen_index):
+    formula = session.formula
+    exposure, total_amount = compute_exposure(formula, db)
+    assert session.total_amount == total_amount
+    assert session.grouped() == group_by_standard(exposure, db, session.category)
+    assert session.report() == evaluate_formula(formula, db, session.dosage, session.category)
+    assert session.labeling() == evaluate_labeling(formula, db, session.dosage, allergen_index)
+
+
+@pytest.mark.parametrize("run", range(8))
+def test_session_is_bit_identical_after_random_edits(run, real_db, names, allergen_index):
+    rng = random.Random(SEED * 100 + run)
+    category = rng.choice([None, "4", "5A", "11B"])
+    session = FormulaSession(real_db, _formula(rng, names), rng.choice(DOSAGES), category, labeling=True)
+    ids = list(session._lines)
+    for step in range(60):
+        op = rng.random()
+        if op < 0.3 or not ids:
+            ids.append(session.add_line(rng.choice(names), _amount(rng)))
+        elif op < 0.55:
+            session.set_amount(rng.choice(ids), _amount(rng))
+        elif op < 0.75:
+            # Rename (and usually re-amount) in place
+            line_id = rng.choice(ids)
+            session.set_line(line_id, rng.choice(names), _amount(rng) if rng.random() < 0.7 else 5)
+        elif op < 0.95:
+            line_id = ids.pop(rng.randrange(len(ids)))
+            session.remove_line(line_id)
+        else:
+            session.set_dosage(rng.choice(DOSAGES))
+        # Several edits are sometimes applied before the next read, like a pasted grid
+        if rng.random() < 0.7:
+            _assert_matches_full_recalc(session, real_db, allergen_index)
+    _assert_matches_full_recalc(session, real_db, allergen_index)
+
+
+def test_appends_continue_the_sum_bit_identically(real_db, allergen_index):
+    # Appended lines extend each CAS sum in place; re-enabled, renamed or re-added lines re-sum it.
+    # Amounts like 0.1 / 0.2 / 0.3 are not associative, so any other order shows in the last bits
+    session = FormulaSession(real_db, labeling=True)
+    ids = [session.add_line(name, amount) for name, amount in
+           [("Linalool", 0.1), ("Linalool", 0.2), ("Linalool", 0.3), ("Bergamot oil expressed", "")]]
+    _assert_matches_full_recalc(session, real_db, allergen_index)
+    session.remove_line(ids.pop())
+    ids.append(session.add_line("Linalool", 1e-17))
+    session.set_amount(ids[0], "")
+    _assert_matches_full_recalc(session, real_db, allergen_index)
+    session.set_amount(ids[0], 0.7)
+    session.set_line(ids[1], "Bergamot oil expressed", 0.2)
+    ids.append(session.add_line("Linalool", 0.3))
+    _assert_matches_full_recalc(session, real_db, allergen_index)
+
+
+def test_emptied_session_matches_an_empty_formula(real_db, allergen_index):
+    session = FormulaSession(real_db, [["Linalool", 10], ["Bergamot oil expressed", 5]], labeling=True)
+    for line_id in list(session._lines):
+        session.remove_line(line_id)
+    assert session.total_amount == 0.0
+    _assert_matches_full_recalc(session, real_db, allergen_index)
+
+
+def test_sweep_matches_full_evaluations(real_db, names):
+    rng = random.Random(SEED)
+    formula = [row for row in _formula(rng, names, 25)]
+    session = FormulaSession(real_db, formula, "20")
+    line_id = next(i for i in session._lines if session._amounts.get(i))
+    amounts = [0.0, 0.5, 2.0, 10.0, 50.0]
+    swept = session.sweep(line_id, amounts)
+    for k, amount in enumerate(amounts):
+        edited = [list(row) for row in formula]
+        edited[line_id][1] = amount
+        report = evaluate_formula(edited, real_db, "20")
+        assert swept["fail_count"][k] == report["fail_count"]
+
+
+# --- Engine vs session vs exposure matrix ---
+
+@pytest.fixture(scope="module")
+def matrix(real_db):
+    return ExposureMatrix(real_db)
+
+
+def test_engines_agree(real_db, names, matrix):
+    rng = random.Random(SEED + 1)
+    formulas = [_formula(rng, names) for _ in range(150)]
+    dosages = [rng.choice(DOSAGES) for _ in formulas]
+    reports = [evaluate_formula(f, real_db, d) for f, d in zip(formulas, dosages)]
+
+    for formula, dosage, report in zip(formulas, dosages, reports):
+        assert FormulaSession(real_db, formula, dosage).report() == report
+
+    scores = matrix.score(formulas, dosages)
+    conc = scores["concentrations"].toarray()
+    index = {name: i for i, name in enumerate(scores["standard_names"])}
+    for i, report in enumerate(reports):
+        assert scores["total_amount"][i] == pytest.approx(report["total_amount"], rel=1e-12)
+        expected = np.zeros(len(index))
+        for d in report["details"]:
+            if d["ingredient"] in index:
+                expected[index[d["ingredient"]]] = d["conc"]
+        np.testing.assert_allclose(conc[i], expected, rtol=1e-9, atol=1e-15)
+        assert scores["fail_count"][i] == report["fail_count"]
@@ -0,0 +1,73 @@
+import pytest
+
+from ingest_ifra_standards import (
+    LIMIT_CATEGORIES, PROHIBITED_LIMIT, UNRESTRICTED_LIMIT, diff_standards, parse_limit, read_standards_csv,
+    write_standards_csv
+)
+
+
+@pytest.mark.parametrize("value, standard_type, expected", [
+    (0.4, "RESTRICTION", 0.4),
+    (2, "RESTRICTION", 2.0),
+    ("0,40", "RESTRICTION", 0.4),
+    ("0.0015 (5-MOP)", "RESTRICTION", 0.0015),
+    (" 12 % ", "RESTRICTION", 12.0),
+    ("No Restriction", "RESTRICTION", UNRESTRICTED_LIMIT),
+    ("See Notebox", "SPECIFICATION", UNRESTRICTED_LIMIT),
+    ("No Restriction", "PROHIBITION", UNRESTRICTED_LIMIT),
+    # Empty cells: 0% for a prohibition, no cap otherwise
+    (None, "PROHIBITION", PROHIBITED_LIMIT),
+    ("", "PROHIBITION", PROHIBITED_LIMIT),
+    ("  ", "PROHIBITION", PROHIBITED_LIMIT),
+    (None, "RESTRICTION", UNRESTRICTED_LIMIT),
+    (None, "", UNRESTRICTED_LIMIT),
+    (True, "PROHIBITION", PROHIBITED_LIMIT),
+    (0, "PROHIBITION", 0.0),
+])
+def test_parse_limit(value, standard_type, expected):
+    assert parse_limit(value, standard_type) == expected
+
+
+def _std(name, cas, **limits):
+    return {"name": name, "cas": cas, "limits": {c.replace("cat", ""): v for c, v in limits.items()}}
+
+
+def test_diff_standards():
+    previous = [
+        _std("Citral", ["5392-40-5"], cat4=0.6, cat5A=0.4),
+        _std("Linalool", ["78-70-6"], cat4=5.0),
+        _std("Old Name", ["111-11-1", "222-22-2"], cat4=1.0),
+        _std("Dropped", ["333-33-3"], cat4=2.0),
+        _std("Isomers", ["444-44-4"], cat4=3.0),
+    ]
+    current = [
+        _std("CITRAL", ["5392-40-5"], cat4=0.5, cat5A=0.8),
+        _std("Linalool", ["78-70-6"], cat4=5.0, cat5A=1.0),
+        _std("New Name", ["222-22-2", "111-11-1"], cat4=1.0),
+        _std("Isomers", ["444-44-4", "555-55-5"], cat4=3.0),
+        _std("Brand New", ["666-66-6"], cat4=0.0),
+    ]
+    assert diff_standards(previous, current) == {
+        "added": [{"name": "Brand New", "cas": ["666-66-6"], "limits": {"4": 0.0}}],
+        "removed": [{"name": "Dropped", "cas": ["333-33-3"]}],
+        # Matched through a shared CAS; only reordering the CAS list is not a CAS change
+        "renamed": [{"from": "Old Name", "to": "New Name"}],
+        "cas_changed": [{"name": "Isomers", "added": ["555-55-5"], "removed": []}],
+        # Names match case-insensitively; a category only one side has is not a change
+        "tightened": [{"name": "CITRAL", "category": "4", "from": 0.6, "to": 0.5}],
+        "relaxed": [{"name": "CITRAL", "category": "5A", "from": 0.4, "to": 0.8}]
+    }
+
+
+def test_diff_of_identical_standards_is_empty():
+    standards = [_std("Citral", ["5392-40-5"], cat4=0.6)]
+    assert not any(diff_standards(standards, standards).values())
+
+
+def test_csv_round_trip(tmp_path):
+    path = str(tmp_path / "DB_Standards.csv")
+    standards = [{"name": "Citral", "cas": ["5392-40-5"], "limits": {c: 0.6 for c in LIMIT_CATEGORIES}},
+                 {"name": "Multi", "cas": ["111-11-1", "222-22-2"],
+                  "limits": {c: float(i) for i, c in enumerate(LIMIT_CATEGORIES)}}]
+    assert write_standards_csv(standards, path) == 2
+    assert read_standards_csv(path) == standards
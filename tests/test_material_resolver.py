@@ -0,0 +1,104 @@
+import pytest
+
+from material_resolver import MaterialCycleError, NestedReferenceDB
+
+TABLES = {
+    "DB_Standards": [
+        ["Bergamot oil expressed", "8007-75-8", "0.4"],
+        ["Bergapten", "484-20-8", "0.0015"],
+        ["Citral", "5392-40-5", "0.6"]
+    ],
+    "DB_Naturals": [
+        ["Bergamot oil expressed", "Bergapten", "484-20-8", "0.3"],
+        ["Bergamot oil expressed", "Citral", "5392-40-5", "2"]
+    ],
+    "DB_Inventory": [
+        ["Bergamot", "Bergamot oil expressed", ""],
+        ["Berg Stock", "Bergamot", ""],
+        ["Loop A", "Loop B", ""],
+        ["Loop B", "Loop A", ""]
+    ],
+    "DB_User_Materials": [
+        # The nested natural's own CAS is regulated too: it must still only be expanded
+        ["A1", "Bergamot Accord", "Bergamot oil expressed", "8007-75-8", "50"],
+        ["A2", "Bergamot Accord", "Citral", "5392-40-5", "10"],
+        ["A3", "Bergamot 10%", "Berg Stock", "", "10"],
+        ["B1", "Base X", "Base Y", "", "50"],
+        ["B2", "Base Y", "Base X", "", "50"]
+    ]
+}
+
+
+def _db(tables=TABLES):
+    return NestedReferenceDB.from_tables(tables)
+
+
+def _rounded(contributions):
+    return sorted((cas, round(fraction, 12)) for cas, fraction in contributions)
+
+
+def test_nested_natural_is_expanded_like_a_formula_line():
+    db = _db()
+    line, source = db.line_contributions("Bergamot oil expressed")
+    assert source == "Indirect (Natural)"
+    assert "8007-75-8" not in dict(line)
+
+    nested, source = db.line_contributions("Bergamot Accord")
+    assert source == "Indirect (Base)"
+    assert _rounded(nested) == _rounded([("484-20-8", 0.5 * 0.003), ("5392-40-5", 0.5 * 0.02), ("5392-40-5", 0.1)])
+
+
+def test_alias_chain_is_followed_at_every_level():
+    db = _db()
+    assert db.resolve_name("Berg Stock") == "bergamot oil expressed"
+    assert db.line_contributions("Berg Stock") == db.line_contributions("Bergamot oil expressed")
+    diluted, _ = db.line_contributions("Bergamot 10%")
+    assert _rounded(diluted) == _rounded([("484-20-8", 0.1 * 0.003), ("5392-40-5", 0.1 * 0.02)])
+
+
+def test_cycles_raise_and_are_reported():
+    db = _db()
+    with pytest.raises(MaterialCycleError) as error:
+        db.line_contributions("Base X")
+    assert error.value.path == ["base x", "base y", "base x"]
+    with pytest.raises(MaterialCycleError) as error:
+        db.resolve_name("Loop A")
+    assert error.value.kind == "alias"
+    assert set(db.flatten_all()) == {"base x", "base y"}
+
+
+def _edited(tab_name, old_row, new_row):
+    tables = {tab: list(rows) for tab, rows in TABLES.items()}
+    rows = tables[tab_name]
+    if old_row is not None:
+        rows.remove(old_row)
+    if new_row is not None:
+        rows.append(new_row)
+    return tables
+
+
+@pytest.mark.parametrize("tab_name, old_row, new_row", [
+    ("DB_Naturals", ["Bergamot oil expressed", "Bergapten", "484-20-8", "0.3"],
+     ["Bergamot oil expressed", "Bergapten", "484-20-8", "0.5"]),
+    ("DB_User_Materials", None, ["A4", "Bergamot Accord", "Bergapten", "484-20-8", "1"]),
+    ("DB_User_Materials", ["A3", "Bergamot 10%", "Berg Stock", "", "10"], None),
+    ("DB_Inventory", ["Berg Stock", "Bergamot", ""], ["Berg Stock", "Citral", ""]),
+    ("DB_Standards", None, ["Musk X", "81-15-2", "1"]),
+])
+def test_apply_row_change_matches_a_fresh_db(tab_name, old_row, new_row):
+    names = ["Bergamot oil expressed", "Bergamot", "Berg Stock", "Bergamot Accord", "Bergamot 10%", "Citral", "Musk X"]
+    db = _db()
+    before = {name: db.line_contributions(name) for name in names}
+    touched = db.apply_row_change(tab_name, old_row, new_row)
+    assert touched
+    fresh = _db(_edited(tab_name, old_row, new_row))
+    after = {name: db.line_contributions(name) for name in names}
+    assert after == {name: fresh.line_contributions(name) for name in names}
+    assert after != before
+
+
+def test_standard_change_keeps_unrelated_memo_entries():
+    db = _db()
+    db.line_contributions("Bergamot Accord")
+    db.apply_row_change("DB_Standards", None, ["Vanillin", "121-33-5", "1"])
+    assert "bergamot accord" in db._material_cache
@@ -0,0 +1,76 @@
+from compliance_engine import ReferenceDB, load_reference_db
+from conftest import write_release
+from db_snapshot import combine_hashes, db_content_hash
+from materials_store import MaterialsStore, StoreReferenceDB, store_reference_db
+
+TABLES = {
+    "DB_Standards": [["Citral", "5392-40-5", "0.6"], ["Broken", "1-1-1", "tbd"], ["Hedione", "24851-98-7", ""]],
+    "DB_Naturals": [["Lemon oil", "Citral", "5392-40-5", "3"], ["Lemon oil", "Limonene", "5989-27-5", "abc"]],
+    "DB_Inventory": [["Lemon", "Lemon oil", ""], ["Blank alias", "   ", ""], ["Lemon oil", "", ""]],
+    "DB_User_Materials": [
+        ["A1", "Citrus Base", "Lemon oil", "", "50"],
+        ["A2", "Citrus Base", "Citral", "5392-40-5", "10"],
+        # 4-column layout: Material Name, Constituent, CAS, Percentage
+        ["Floral Base", "Citral", "5392-40-5", "20", "see note"],
+        ["A3", "Citrus Base", "Limonene", "5989-27-5", "lots"]
+    ],
+    "DB_EU_Allergens": [["Citral", "5392-40-5"]]
+}
+
+NAMES = ["Lemon", "Lemon oil", "Citrus Base", "Floral Base", "Blank alias", "Citral", "Hedione", "unknown"]
+
+
+def _store(tmp_path):
+    release_dir = write_release(tmp_path / "release", TABLES)
+    store = MaterialsStore(str(tmp_path / "materials.db"))
+    store.import_csv_dir(release_dir, log=lambda message: None)
+    return store, release_dir
+
+
+def test_store_skips_rows_code_js_skips(tmp_path):
+    store, release_dir = _store(tmp_path)
+    csv_db = ReferenceDB.from_csv_dir(release_dir)
+    store_db = store.reference_db()
+    assert [s.name for s in store_db.standards] == ["Citral", "Hedione"]
+    assert store_db.standards == csv_db.standards
+    assert store_db.naturals == csv_db.naturals
+    assert store_db.user_materials == csv_db.user_materials
+
+
+def test_user_materials_share_the_layout_detection(tmp_path):
+    store, _ = _store(tmp_path)
+    assert [r["material"] for r in store.materials_containing_cas("5392-40-5")] == \
+        ["Citrus Base", "Floral Base", "Lemon oil"]
+    # The 4-column row round-trips as written
+    assert ["Floral Base", "Citral", "5392-40-5", "20", "see note"] in store.table("DB_User_Materials")[1]
+
+
+def test_store_reference_db_matches_csv(tmp_path):
+    store, release_dir = _store(tmp_path)
+    csv_db = ReferenceDB.from_csv_dir(release_dir)
+    db = StoreReferenceDB(store)
+    for name in NAMES:
+        assert db.line_contributions(name) == csv_db.line_contributions(name), name
+    # A whitespace-only Linked Name is no alias
+    assert db.resolve_name("Blank alias") == csv_db.resolve_name("Blank alias") == "blank alias"
+    db.close()
+
+
+def test_load_reference_db_from_store(tmp_path):
+    release_dir = write_release(tmp_path / "release", TABLES)
+    path = str(tmp_path / "materials.db")
+    db = load_reference_db(release_dir, store_path=path)
+    assert isinstance(db, StoreReferenceDB)
+    assert db.line_contributions("Floral Base") == ((("5392-40-5", 0.2),), "Indirect (Base)")
+    db.close()
+    # Reopening only re-checks the CSV hashes
+    assert store_reference_db(path, release_dir).store.import_csv_dir(release_dir, log=lambda message: None) == []
+
+
+def test_store_content_hash_matches_the_csvs(tmp_path):
+    store, release_dir = _store(tmp_path)
+    assert store.content_hash() == db_content_hash(release_dir)
+    # refresh=False opens the store as it is, without reading the CSVs
+    empty = store_reference_db(str(tmp_path / "empty.db"), release_dir, refresh=False)
+    assert empty.standards == [] and empty.content_hash == combine_hashes({})
+    empty.close()
@@ -0,0 +1,191 @@
+import csv
+import json
+import random
+from concurrent.futures import Future
+
+import openpyxl
+import pytest
+from typer.testing import CliRunner
+
+import materials_store
+import minipinscher
+from compliance_engine import ReferenceDB, evaluate_formulas
+from conftest import write_release
+from eu_labeling import AllergenIndex, evaluate_labeling, inci_allergens
+from minipinscher import BATCH_SIZE, app, iter_formula_paths
+
+TABLES = {
+    "DB_Standards": [["Citral", "5392-40-5", "0.6"], ["Linalool", "78-70-6", "5"]],
+    "DB_Naturals": [["Lemon oil", "Citral", "5392-40-5", "3"], ["Lemon oil", "Limonene", "5989-27-5", "65"]],
+    "DB_Inventory": [["Lemon", "Lemon oil", ""]],
+    "DB_User_Materials": [["A1", "Citrus Base", "Citral", "5392-40-5", "2"],
+                          ["A1", "Citrus Base", "Linalool", "78-70-6", "10"]],
+    "DB_EU_Allergens": [["Citral", "5392-40-5"], ["Limonene", "5989-27-5"], ["Linalool", "78-70-6"]]
+}
+NAMES = ["Lemon", "Lemon oil", "Citrus Base", "Citral", "Linalool", "citral ", "DPG", "Unknown"]
+FORMULAS = 2 * BATCH_SIZE + 5
+XLSX_DOSAGE = 5
+
+
+@pytest.fixture(scope="module")
+def library(tmp_path_factory):
+    # A release and a folder of formulas: CSVs (some over the Citral limit), one XLSX, one unreadable file
+    root = tmp_path_factory.mktemp("library")
+    release_dir = write_release(root / "release", TABLES)
+    folder = root / "formulas"
+    folder.mkdir()
+    rng = random.Random(17)
+    for i in range(FORMULAS):
+        with open(folder / f"f{i:03d}.csv", "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["Ingredient", "Amount"])
+            writer.writerows([rng.choice(NAMES), round(rng.uniform(0.01, 5.0), 3)] for _ in range(rng.randint(1, 8)))
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = "Formula"
+    ws.append(["Ingredient", "Amount", None, "Finished Dosage (%)", XLSX_DOSAGE])
+    ws.append(["Citrus Base", 10])
+    ws.append(["DPG", 90])
+    wb.save(folder / "g.xlsx")
+    (folder / "h.xlsx").write_bytes(b"not a workbook")
+    return release_dir, str(folder)
+
+
+def _expected(release_dir, folder):
+    # evaluate_formulas() and evaluate_labeling() on each file, as the records carry them
+    db = ReferenceDB.from_csv_dir(release_dir)
+    index = AllergenIndex(db)
+    records = []
+    for path in iter_formula_paths([folder]):
+        if path.endswith("h.xlsx"):
+            continue
+        rows, dosage = minipinscher.read_formula_file(path)
+        report, = evaluate_formulas([rows], db, dosage)
+        labeling = evaluate_labeling(rows, db, dosage, index)
+        records.append(json.loads(json.dumps({
+            "formula": path, "dosage": report["dosage"], "total_amount": report["total_amount"],
+            "passed": report["passed"], "fail_count": report["fail_count"], "ifra": report["details"],
+            "required": inci_allergens(labeling)
+        })))
+    return records
+
+
+def _check(args, out):
+    result = CliRunner().invoke(app, ["check", *args, "--out", out])
+    with open(out, encoding="utf-8") as f:
+        return result, [json.loads(line) for line in f]
+
+
+def _summary(record):
+    return {k: record[k] for k in ("formula", "dosage", "total_amount", "passed", "fail_count", "ifra")} | \
+        {"required": record["labeling"]["required"]}
+
+
+def test_pooled_check_matches_evaluate_formulas(library, tmp_path):
+    release_dir, folder = library
+    result, records = _check([folder, "--workers", "2", "--release-dir", release_dir, "--no-cache"],
+                             str(tmp_path / "pooled.jsonl"))
+    assert result.exit_code == 1
+    paths = list(iter_formula_paths([folder]))
+    # Input order, whichever worker finishes first
+    assert [r["formula"] for r in records] == paths
+    assert records[-1] == {"formula": paths[-1], "error": records[-1]["error"]}
+    assert [_summary(r) for r in records[:-1]] == _expected(release_dir, folder)
+    assert records[-2]["dosage"] == XLSX_DOSAGE
+    assert any(r["passed"] for r in records[:-1]) and not all(r["passed"] for r in records[:-1])
+
+    # The same records in the same order on every run, and in a single process
+    _, again = _check([folder, "--workers", "3", "--release-dir", release_dir, "--no-cache"],
+                      str(tmp_path / "again.jsonl"))
+    _, single = _check([folder, "--workers", "1", "--release-dir", release_dir, "--no-cache"],
+                       str(tmp_path / "single.jsonl"))
+    assert again == records and single == records
+
+
+class InlinePool:
+    # ProcessPoolExecutor stand-in: runs each batch in this process when its result is asked for
+    def __init__(self, max_workers, initializer, initargs):
+        initializer(*initargs)
+        self.batches = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def submit(self, fn, paths, *args):
+        self.batches.append(paths)
+        future = Future()
+        future.result = lambda timeout=None: fn(paths, *args)
+        return future
+
+
+def test_batches_are_streamed_in_order(library, tmp_path, monkeypatch):
+    release_dir, folder = library
+    out = str(tmp_path / "stream.jsonl")
+    pools, written = [], []
+    evaluate_batch = minipinscher.evaluate_batch
+
+    def pool(*args, **kwargs):
+        pools.append(InlinePool(*args, **kwargs))
+        return pools[-1]
+
+    def batch(paths, *args):
+        # Every record of the earlier batches is already on disk when a batch starts
+        with open(out, encoding="utf-8") as f:
+            written.append(len(f.read().splitlines()))
+        return evaluate_batch(paths, *args)
+
+    monkeypatch.setattr(minipinscher, "ProcessPoolExecutor", pool)
+    monkeypatch.setattr(minipinscher, "evaluate_batch", batch)
+    _, records = _check([folder, "--workers", "4", "--release-dir", release_dir, "--no-cache"], out)
+    paths = list(iter_formula_paths([folder]))
+    assert pools[0].batches == [paths[i:i + BATCH_SIZE] for i in range(0, len(paths), BATCH_SIZE)]
+    assert written == list(range(0, len(paths), BATCH_SIZE))
+    assert [r["formula"] for r in records] == paths
+
+
+def test_result_cache_and_cache_command(library, tmp_path):
+    release_dir, folder = library
+    cache = str(tmp_path / "cache.db")
+    args = [folder, "--workers", "2", "--release-dir", release_dir, "--cache", cache]
+    first, records = _check(args, str(tmp_path / "first.jsonl"))
+    second, cached = _check(args, str(tmp_path / "second.jsonl"))
+    assert cached == records
+    reports = FORMULAS + 1
+    assert f"💾 Cache: 0 hits, {reports} misses" in first.stderr
+    assert f"💾 Cache: {reports} hits, 0 misses" in second.stderr
+
+    runner = CliRunner()
+    stats = runner.invoke(app, ["cache", "--cache", cache, "--release-dir", release_dir])
+    assert stats.exit_code == 0
+    stats = json.loads(stats.stdout)
+    assert {k: stats[k] for k in ("entries", "hits", "misses", "hit_rate")} == \
+        {"entries": reports, "hits": reports, "misses": reports, "hit_rate": 0.5}
+    cleared = runner.invoke(app, ["cache", "--cache", cache, "--clear", "--release-dir", release_dir])
+    assert json.loads(cleared.stdout.split("\n", 1)[1])["entries"] == 0
+
+
+def test_store_is_imported_once(library, tmp_path, monkeypatch):
+    release_dir, folder = library
+    store = str(tmp_path / "materials.db")
+    hashed = []
+    file_sha256 = materials_store.file_sha256
+    monkeypatch.setattr(materials_store, "file_sha256", lambda path: hashed.append(path) or file_sha256(path))
+    result, records = _check([folder, "--workers", "1", "--release-dir", release_dir, "--no-cache", "--store", store],
+                             str(tmp_path / "store.jsonl"))
+    # The CSVs are hashed by the import in check only, not again when the worker opens the store
+    assert result.stderr.count("Importing reference tables") == 1
+    assert len(hashed) == len(TABLES)
+    assert [_summary(r) for r in records[:-1]] == _expected(release_dir, folder)
+
+    _, pooled = _check([folder, "--workers", "2", "--release-dir", release_dir, "--no-cache", "--store", store],
+                       str(tmp_path / "pooled.jsonl"))
+    assert pooled == records
+
+
+def test_no_formulas_found(tmp_path):
+    result = CliRunner().invoke(app, ["check", str(tmp_path / "*.csv")])
+    assert result.exit_code == 2
+    assert "No formula CSV / XLSX files found" in result.stderr
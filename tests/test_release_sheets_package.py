@@ -0,0 +1,123 @@
+import json
+import os
+
+import build_sheet
+import release_sheets_package
+from release_sheets_package import _QuietWindow, build_release, load_manifest, nearest_existing_dir
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_load_manifest_without_sources_is_empty(tmp_path):
+    path = tmp_path / "manifest.json"
+    for content in ({"assets": {}}, {"sources": {}}, {"sources": [], "assets": {}}, [1, 2], "text"):
+        path.write_text(json.dumps(content), encoding="utf-8")
+        assert load_manifest(str(path)) == {"sources": {}, "assets": {}}
+    path.write_text("{not json", encoding="utf-8")
+    assert load_manifest(str(path)) == {"sources": {}, "assets": {}}
+    assert load_manifest(str(tmp_path / "missing.json")) == {"sources": {}, "assets": {}}
+
+
+def test_load_manifest_keeps_valid_manifest(tmp_path):
+    path = tmp_path / "manifest.json"
+    manifest = {"sources": {"a.csv": {"sha256": "x"}}, "assets": {}}
+    path.write_text(json.dumps(manifest), encoding="utf-8")
+    assert load_manifest(str(path)) == manifest
+
+
+def test_quiet_window_coalesces_a_burst():
+    clock = _Clock()
+    window = _QuietWindow(quiet=0.5, clock=clock)
+    assert window.take() == set()
+    window.add("a.csv")
+    clock.now = 0.3
+    window.add("b.csv")
+    window.add("a.csv")
+    clock.now = 0.7
+    # 0.4 s since the last event: still inside the window
+    assert window.take() == set()
+    clock.now = 0.8
+    assert window.take() == {"a.csv", "b.csv"}
+    assert window.take() == set()
+
+
+def _release_sources(tmp_path, monkeypatch, rebuilt, layout=None):
+    # A two-asset release (Code.js + DB_Standards.csv) packaged inside tmp_path
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("src")
+    monkeypatch.setattr(release_sheets_package, "RELEASE_ASSETS", [
+        ("src/Code.js", "Code.js", None),
+        ("src/DB_Standards.csv", "DB_Standards.csv", "DB_Standards")
+    ])
+    # `layout` stands in for the workbook on disk: whether it has DB_Lookup (None: not built yet)
+    layout = layout if layout is not None else {}
+
+    def rebuild_tabs(tabs, lookup=None):
+        rebuilt.append(tabs if lookup is None else (tabs, lookup))
+        layout["lookup"] = bool(layout.get("lookup")) if lookup is None else lookup
+        return True
+
+    monkeypatch.setattr(build_sheet, "rebuild_tabs", rebuild_tabs)
+    monkeypatch.setattr(build_sheet, "workbook_has_lookup", lambda path: layout.get("lookup"))
+    (tmp_path / "src" / "Code.js").write_text("// v1\n", encoding="utf-8")
+    (tmp_path / "src" / "DB_Standards.csv").write_text("Name,CAS,Limit\nCitral,5392-40-5,0.6\n", encoding="utf-8")
+
+
+def test_build_release_rebuilds_the_changed_tabs(tmp_path, monkeypatch):
+    rebuilt = []
+    _release_sources(tmp_path, monkeypatch, rebuilt)
+    assert build_release() == ["Code.js", "DB_Standards.csv"]
+    assert rebuilt == [["DB_Standards"]]
+    assert build_release() == []
+    assert rebuilt == [["DB_Standards"]]
+    assert load_manifest()["assets"]["DB_Standards.csv"]["rows"] == 1
+
+
+def test_skipped_rebuild_keeps_the_tabs_pending(tmp_path, monkeypatch):
+    rebuilt = []
+    _release_sources(tmp_path, monkeypatch, rebuilt)
+    assert build_release(rebuild_workbook=False) == ["Code.js", "DB_Standards.csv"]
+    assert rebuilt == []
+    # Only the asset without a workbook tab is recorded as released
+    assert set(load_manifest()["assets"]) == {"Code.js"}
+    assert build_release() == ["DB_Standards.csv"]
+    assert rebuilt == [["DB_Standards"]]
+
+    (tmp_path / "src" / "DB_Standards.csv").write_text("Name,CAS,Limit\nCitral,5392-40-5,0.5\n", encoding="utf-8")
+    previous = load_manifest()["assets"]["DB_Standards.csv"]
+    assert build_release(rebuild_workbook=False) == ["DB_Standards.csv"]
+    assert load_manifest()["assets"]["DB_Standards.csv"] == previous
+    assert build_release() == ["DB_Standards.csv"]
+    assert rebuilt == [["DB_Standards"], ["DB_Standards"]]
+
+
+def test_lookup_switch_rebuilds_the_workbook(tmp_path, monkeypatch):
+    rebuilt, layout = [], {}
+    _release_sources(tmp_path, monkeypatch, rebuilt, layout)
+    assert build_release() == ["Code.js", "DB_Standards.csv"]
+    assert rebuilt == [["DB_Standards"]] and layout == {"lookup": False}
+    readme = (tmp_path / "google_sheets_release" / "README_SHEETS.md").read_text(encoding="utf-8")
+    assert "built without `--lookup`, so it has no `DB_Lookup` tab" in readme
+
+    # Nothing changed, but the requested layout differs: the whole workbook is rebuilt once
+    assert build_release(lookup=True) == []
+    assert rebuilt[1:] == [([], True)]
+    readme = (tmp_path / "google_sheets_release" / "README_SHEETS.md").read_text(encoding="utf-8")
+    assert "built with `--lookup`: it carries the `DB_Lookup` tab" in readme
+    assert build_release(lookup=True) == [] and build_release() == []
+    assert len(rebuilt) == 2
+
+    (tmp_path / "src" / "DB_Standards.csv").write_text("Name,CAS,Limit\nCitral,5392-40-5,0.5\n", encoding="utf-8")
+    assert build_release(lookup=False) == ["DB_Standards.csv"]
+    assert rebuilt[2:] == [(["DB_Standards"], False)] and layout == {"lookup": False}
+
+
+def test_nearest_existing_dir(tmp_path):
+    assert nearest_existing_dir(str(tmp_path)) == str(tmp_path)
+    assert nearest_existing_dir(str(tmp_path / "missing" / "deeper")) == str(tmp_path)
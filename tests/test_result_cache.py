@@ -0,0 +1,146 @@
+import multiprocessing
+import sqlite3
+
+import pytest
+
+import db_snapshot
+import result_cache
+from result_cache import EVICT_TO, ResultCache, formula_key, formula_spelling
+
+FORMULA = [["Ingredient", "Amount"], ["Citral", "10"], ["Linalool", 2.5], ["", 3], ["DPG", 0]]
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return str(tmp_path / "cache.db")
+
+
+def test_key_canonicalization(monkeypatch):
+    key = formula_key(FORMULA, "20", "check", "db1", category="4")
+    # Same amounts after Number(), same names after resolve_name()'s normalization, skipped lines ignored
+    assert formula_key([[" CITRAL ", 10.0], ["linalool", "2.5"]], 20, "check", "db1", category="4") == key
+    assert formula_key([["Citral", 10], ["Linalool", 2.5], ["Water", ""]], "20%", "check", "db1", category="4") == key
+    for other in (formula_key(FORMULA, "20", "check", "db2", category="4"),
+                  formula_key(FORMULA, "15", "check", "db1", category="4"),
+                  formula_key(FORMULA, "20", "check", "db1", category="5A"),
+                  formula_key(FORMULA, "20", "ifra", "db1", category="4"),
+                  formula_key([["Linalool", 2.5], ["Citral", 10]], "20", "check", "db1", category="4")):
+        assert other != key
+    # Line order stays in the key (it orders the report); the raw spelling is checked separately
+    assert formula_spelling([["citral", 10], ["Linalool", 2.5]]) != formula_spelling(FORMULA)
+    monkeypatch.setattr(db_snapshot, "_code_fingerprint", "other engine code")
+    assert formula_key(FORMULA, "20", "check", "db1", category="4") != key
+
+
+def test_other_spelling_is_a_miss_and_replaces_the_entry(cache_path):
+    cache = ResultCache(cache_path, "db1")
+    assert cache.cached(lambda: "Citral", [["Citral", 1]]) == "Citral"
+    assert cache.cached(lambda: "not computed", [["Citral", 1]]) == "Citral"
+    assert cache.cached(lambda: "citral", [["citral", 1]]) == "citral"
+    assert cache.stats()["entries"] == 1
+    assert (cache.hits, cache.misses) == (1, 2)
+    cache.close()
+
+
+def _entry_sizes(path):
+    conn = sqlite3.connect(path)
+    try:
+        return dict(conn.execute("SELECT key, size FROM results").fetchall())
+    finally:
+        conn.close()
+
+
+def test_lru_eviction_down_to_evict_to(cache_path, monkeypatch):
+    clock = iter(range(1, 1000))
+    monkeypatch.setattr(result_cache.time, "time", lambda: float(next(clock)))
+    value = "x" * 50
+    cache = ResultCache(cache_path, "db1", max_bytes=10 ** 9)
+    for i in range(10):
+        cache.put(f"k{i}", f"{value}{i}")
+    size = max(_entry_sizes(cache_path).values())
+    cache.close()
+
+    cache = ResultCache(cache_path, "db1", max_bytes=10 * size)
+    # k0 was written first but used last: it must survive the eviction
+    assert cache.get("k0") == f"{value}0"
+    cache.put("k10", f"{value}10")
+    stats = cache.stats()
+    assert stats["bytes"] <= int(cache.max_bytes * EVICT_TO)
+    assert stats["bytes"] == sum(_entry_sizes(cache_path).values())
+    kept = set(_entry_sizes(cache_path))
+    assert {"k0", "k10"} <= kept
+    assert "k1" not in kept
+    # Least recently used go first: the survivors are k0 plus a suffix of k1..k10
+    survivors = sorted(int(k[1:]) for k in kept - {"k0"})
+    assert survivors == list(range(survivors[0], 11))
+    assert stats["evictions"] == 11 - len(kept)
+    cache.close()
+
+
+def test_counters_add_up_across_handles(cache_path):
+    first = ResultCache(cache_path, "db1")
+    second = ResultCache(cache_path, "db1")
+    first.put("a", 1)
+    assert first.get("a") == 1 and first.get("b") is None
+    assert second.get("a") == 1 and second.get("a") == 1 and second.get("c") is None
+    assert (first.hits, first.misses, second.hits, second.misses) == (1, 1, 2, 1)
+    first.flush()
+    stats = second.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (3, 2, 1)
+    assert stats["hit_rate"] == pytest.approx(0.6)
+    first.close()
+    second.close()
+
+
+def test_db_hash_change_invalidates_without_purging(cache_path):
+    old = ResultCache(cache_path, "db1")
+    assert old.cached(lambda: "old report", FORMULA) == "old report"
+    old.close()
+
+    new = ResultCache(cache_path, "db2")
+    assert new.cached(lambda: "new report", FORMULA) == "new report"
+    assert new.stats()["entries"] == 2
+    new.close()
+
+    # The old entries still serve a handle on the old tables, until clear()
+    old = ResultCache(cache_path, "db1")
+    assert old.cached(lambda: "recomputed", FORMULA) == "old report"
+    old.clear()
+    assert old.stats() == {**old.stats(), "entries": 0, "bytes": 0, "hits": 0, "misses": 0}
+    old.close()
+
+
+def _writer(path, worker, n, barrier):
+    cache = ResultCache(path, "db1")
+    barrier.wait()
+    for i in range(n):
+        # Shared keys are written by both processes, own keys by one
+        cache.cached(lambda: {"by": worker, "i": i}, [[f"shared {i}", 1]])
+        cache.put(f"{worker}-{i}", {"by": worker, "i": i})
+    cache.close()
+
+
+def test_two_processes_write_concurrently(cache_path):
+    ctx = multiprocessing.get_context("fork")
+    n = 60
+    barrier = ctx.Barrier(2)
+    processes = [ctx.Process(target=_writer, args=(cache_path, worker, n, barrier)) for worker in ("a", "b")]
+    for p in processes:
+        p.start()
+    for p in processes:
+        p.join(60)
+        assert p.exitcode == 0
+
+    cache = ResultCache(cache_path, "db1")
+    stats = cache.stats()
+    assert stats["entries"] == 3 * n
+    assert stats["bytes"] == sum(_entry_sizes(cache_path).values())
+    # Every shared formula was looked up once per process: one miss each, plus a hit when the other
+    # process had already stored it
+    assert stats["hits"] + stats["misses"] == 2 * n
+    assert stats["misses"] >= n
+    for i in range(n):
+        assert cache.get(f"a-{i}") == {"by": "a", "i": i}
+        assert cache.get(f"b-{i}") == {"by": "b", "i": i}
+        assert cache.cached(lambda: None, [[f"shared {i}", 1]])["i"] == i
+    cache.close()
@@ -0,0 +1,157 @@
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, zip_longest
+
+import openpyxl
+from openpyxl.utils import get_column_letter
+
+from build_sheet import DEFAULT_VERSION, calculation_formulas, sheet_order, tab_table, workbook_filename
+from compliance_engine import DB_FILES, RELEASE_DIR
+from db_snapshot import open_snapshot
+from lookup_tab import LOOKUP_TAB
+from stage_trace import add_profile_arguments, profiled, result, span, submit, timed_iter, traced
+
+# Content-checked tabs and what they are rebuilt from
+CHECKED_TABS = {**DB_FILES, LOOKUP_TAB: "the DB_* tables"}
+
+
+def _same_cell(expected, found):
+    # Empty cells read back as None; integral floats read back as int
+    if expected in ("", None):
+        return found in ("", None)
+    if isinstance(expected, (int, float)) and isinstance(found, (int, float)):
+        return float(expected) == float(found)
+    return expected == found
+
+
+def check_tab(wb, tab_name, release_dir=RELEASE_DIR, snapshot=None):
+    # Streams one tab of a read-only workbook against its source rows.
+    # Returns (tab_name, rows_checked, error message or None)
+    with span(f"check:{tab_name}") as stage:
+        checked = _check_rows(wb, tab_name, release_dir, snapshot, stage)
+        stage.set(rows=checked[1])
+    return checked
+
+
+def _check_rows(wb, tab_name, release_dir, snapshot, stage):
+    header, rows = tab_table(tab_name, release_dir, snapshot)
+    # parse_seconds: time spent reading the worksheet XML; the rest is the source rows and the comparison
+    found_rows = timed_iter(wb[tab_name].iter_rows(values_only=True), stage, "parse_seconds")
+
+    row_num = 0
+    for row_num, (expected, found) in enumerate(zip_longest(chain([header], rows), found_rows), start=1):
+        if expected is None:
+            if any(v not in ("", None) for v in found):
+                return tab_name, row_num - 1, f"unexpected extra row {row_num}: {list(found)}"
+            continue
+        if found is None:
+            return tab_name, row_num - 1, f"row {row_num} is missing (expected {expected})"
+        for c in range(max(len(expected), len(found))):
+            exp_v = expected[c] if c < len(expected) else ""
+            found_v = found[c] if c < len(found) else None
+            if not _same_cell(exp_v, found_v):
+                return tab_name, row_num - 1, (
+                    f"first mismatch at row {row_num}, column {get_column_letter(c + 1)} "
+                    f"({header[c] if c < len(header) else '?'}): expected {exp_v!r}, found {found_v!r}"
+                )
+    return tab_name, max(row_num - 1, 0), None
+
+
+def verify_tab(xlsx_file, tab_name, release_dir=RELEASE_DIR):
+    # Process-pool worker: opens its own read-only handle and checks one tab
+    snapshot = open_snapshot(release_dir=release_dir)
+    with span("load_workbook"):
+        wb = openpyxl.load_workbook(xlsx_file, read_only=True)
+    try:
+        return check_tab(wb, tab_name, release_dir, snapshot)
+    finally:
+        wb.close()
+        if snapshot is not None:
+            snapshot.close()
+
+
+@traced("verify_sheet")
+def verify_sheet(xlsx_file, release_dir=RELEASE_DIR, workers=None):
+    print(f"🧪 Verifying generated Spreadsheet: {xlsx_file}...")
+
+    if not os.path.exists(xlsx_file):
+        print(f"❌ Error: File {xlsx_file} not found!")
+        return False
+
+    for tab_name, csv_file in DB_FILES.items():
+        csv_path = os.path.join(release_dir, csv_file)
+        if not os.path.exists(csv_path):
+            print(f"❌ Error: Source CSV {csv_path} not found for tab '{tab_name}'!")
+            return False
+
+    workers = workers or min(len(CHECKED_TABS), os.cpu_count() or 1)
+
+    # 1. Verify sheet names and formulas in cell A1 (single read-only open)
+    with span("load_workbook", bytes=os.path.getsize(xlsx_file)):
+        wb = openpyxl.load_workbook(xlsx_file, read_only=True)
+    try:
+        sheetnames = wb.sheetnames
+        print(f"  Loaded workbook sheet names: {sheetnames}")
+        # A --lookup build carries DB_Lookup and calculates from it
+        lookup = LOOKUP_TAB in sheetnames
+        order = sheet_order(lookup)
+        for s in order:
+            if s not in sheetnames:
+                print(f"❌ Error: Missing sheet '{s}'!")
+                return False
+        print(f"  All {len(order)} expected tabs are present.")
+
+        checked_tabs = CHECKED_TABS if lookup else DB_FILES
+        workers = min(workers, len(checked_tabs))
+        ifra_formula, eu_formula = calculation_formulas(lookup)
+        for tab_name, expected in (("IFRA_Compliance", ifra_formula), ("EU_Allergen_Labeling", eu_formula)):
+            formula = wb[tab_name]["A1"].value
+            if formula != expected:
+                print(f"❌ Error: Incorrect {tab_name} formula: {formula}")
+                return False
+            print(f"  Verified {tab_name} cell A1 formula: {formula}")
+
+        # 2. Cell-by-cell content check of every DB tab and the derived lookup tab, if any
+        if workers > 1:
+            # One process per tab, largest first so it does not finish last (the lookup reads every CSV)
+            by_size = sorted(DB_FILES, key=lambda t: -os.path.getsize(os.path.join(release_dir, DB_FILES[t])))
+            if lookup:
+                by_size.insert(0, LOOKUP_TAB)
+            with span("check_tabs", workers=workers), ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = {tab_name: submit(pool, verify_tab, xlsx_file, tab_name, release_dir) for tab_name in by_size}
+                results = [result(futures[tab_name]) for tab_name in checked_tabs]
+        else:
+            # Single worker: reuse this handle, so the workbook is streamed once
+            snapshot = open_snapshot(release_dir=release_dir)
+            try:
+                with span("check_tabs", workers=1):
+                    results = [check_tab(wb, tab_name, release_dir, snapshot) for tab_name in checked_tabs]
+            finally:
+                if snapshot is not None:
+                    snapshot.close()
+    finally:
+        wb.close()
+
+    ok = True
+    for tab_name, rows_checked, error in results:
+        if error:
+            print(f"❌ Error: Tab '{tab_name}' does not match {CHECKED_TABS[tab_name]}: {error}")
+            ok = False
+        else:
+            print(f"  Verified tab '{tab_name}' content matches {CHECKED_TABS[tab_name]} exactly: "
+                  f"{rows_checked} data rows.")
+
+    if ok:
+        print(f"\n✅ Verification Successful: {xlsx_file} is 100% complete, fully validated, and structurally healthy!")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Verify a built miniPinscher workbook against the DB CSVs.")
+    parser.add_argument("version", nargs="?", default=DEFAULT_VERSION, help="Release version, e.g. 0.6.1")
+    parser.add_argument("--workers", type=int, default=None, help="Process pool size (default: one per tab)")
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+    with profiled(args):
+        verify_sheet(workbook_filename(args.version), workers=args.workers)
@@ -0,0 +1,251 @@
+"""miniPinscher formula workbench: a local Streamlit app on the Python engine.
+
+    streamlit run workbench.py
+
+The reference DB is loaded once per server (st.cache_resource, reloaded only
+when a DB_*.csv changes) and shared by every browser session. Each session
+keeps its own FormulaSession. An edit to the formula grid is diffed against
+the previous grid and applied as line edits, so only the CAS entries and
+regulated groups / allergens fed by the edited lines are re-summed; the IFRA
+and EU tables are then rendered from those running totals. Alongside: the
+maximum compliant dosage and its headroom (dosage_solver) and the full
+source breakdown of any regulated group.
+"""
+import difflib
+import os
+import tempfile
+import time
+
+import pandas as pd
+import streamlit as st
+
+from build_sheet import DEFAULT_DOSAGE, TEST_FORMULA
+from compliance_engine import DB_FILES, RELEASE_DIR, ifra_table, load_reference_db, to_number
+from dosage_solver import MAX_DOSAGE, solve_grouped
+from eu_labeling import labeling_table
+from formula_session import FormulaSession
+
+PRODUCT_TYPES = ["Leave-on", "Rinse-off"]
+GRID_COLUMNS = ["Ingredient", "Amount"]
+
+
+# --- Shared reference DB ---
+
+def db_stamp(release_dir=RELEASE_DIR):
+    # Size + mtime of every DB_*.csv: a new stamp means the shared DB must be reloaded
+    stamp = []
+    for csv_file in DB_FILES.values():
+        path = os.path.join(release_dir, csv_file)
+        if os.path.exists(path):
+            info = os.stat(path)
+            stamp.append((csv_file, info.st_size, info.st_mtime_ns))
+        else:
+            stamp.append((csv_file, None, None))
+    return tuple(stamp)
+
+
+@st.cache_resource(max_entries=1, show_spinner="Loading reference DB...")
+def shared_reference_db(release_dir, stamp):
+    # One ReferenceDB for all sessions; its memo dicts only ever gain identical entries, so threads can share it
+    return load_reference_db(release_dir)
+
+
+# --- Per-session engine ---
+
+def grid_rows(frame):
+    # (name, amount) tuples from the grid; empty cells become None so rows compare equal
+    rows = []
+    for name, amount in frame[GRID_COLUMNS].itertuples(index=False):
+        name = None if name is None or (isinstance(name, float) and name != name) else str(name)
+        amount = None if amount is None or (isinstance(amount, float) and amount != amount) else amount
+        rows.append((name, amount))
+    return rows
+
+
+def new_engine(db, rows, dosage, category, stamp):
+    session = FormulaSession(db, finished_dosage=dosage, category=category, labeling=True)
+    return {
+        "session": session,
+        "ids": [session.add_line(name, amount) for name, amount in rows],
+        "rows": list(rows),
+        "category": category,
+        "stamp": stamp
+    }
+
+
+def sync_lines(engine, rows):
+    # Applies the grid as line edits (minimal diff); returns the number of lines touched
+    old, ids, session = engine["rows"], engine["ids"], engine["session"]
+    if rows == old:
+        return 0
+    opcodes = difflib.SequenceMatcher(None, old, rows, autojunk=False).get_opcodes()
+    # Line ids are the formula order: rows can only be added after the last existing line
+    if any(j2 - j1 > i2 - i1 and i2 < len(old) for tag, i1, i2, j1, j2 in opcodes if tag != "equal"):
+        engine.update(new_engine(session.db, rows, session.dosage, engine["category"], engine["stamp"]))
+        return len(rows)
+
+    new_ids = []
+    touched = 0
+    for tag, i1, i2, j1, j2 in opcodes:
+        if tag == "equal":
+            new_ids.extend(ids[i1:i2])
+            continue
+        for k in range(max(i2 - i1, j2 - j1)):
+            if k < i2 - i1 and k < j2 - j1:
+                session.set_line(ids[i1 + k], *rows[j1 + k])
+                new_ids.append(ids[i1 + k])
+            elif k < i2 - i1:
+                session.remove_line(ids[i1 + k])
+            else:
+                new_ids.append(session.add_line(*rows[j1 + k]))
+            touched += 1
+    engine["ids"] = new_ids
+    engine["rows"] = list(rows)
+    return touched
+
+
+def source_breakdown(group, total_amount, dosage_val):
+    # Every source of one regulated group (format_sources keeps only the top 5) as table rows
+    merged = {}
+    for key, amount in group["sources"]:
+        merged[key] = merged.get(key, 0.0) + amount
+    rows = []
+    for (name, source_type), amount in sorted(merged.items(), key=lambda kv: -kv[1]):
+        if amount <= 0:
+            continue
+        rows.append({
+            "Source": name,
+            "Type": source_type,
+            "Your Level (%)": (amount / total_amount) * 100.0 * (dosage_val / 100.0),
+            "Share of Group (%)": amount / group["total"] * 100.0 if group["total"] else 0.0
+        })
+    return rows
+
+
+def recalculate(engine, product_type):
+    # Everything the page shows, rendered from the session's running totals
+    session = engine["session"]
+    report = session.report()
+    grouped = session.grouped()
+    return {
+        "report": report,
+        "ifra": ifra_table(report["details"], report["dosage"]),
+        "eu": labeling_table(session.labeling(), product_type),
+        "dosage": solve_grouped(grouped, session.total_amount, session.dosage),
+        "grouped": grouped
+    }
+
+
+def read_upload(upload):
+    # (rows, finished dosage or None) from an uploaded formula CSV / XLSX
+    from minipinscher import read_formula_file
+
+    suffix = os.path.splitext(upload.name)[1].lower()
+    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as f:
+        f.write(upload.getvalue())
+    try:
+        rows, dosage = read_formula_file(f.name)
+    finally:
+        os.remove(f.name)
+    return [(row[0] if row else None, row[1] if len(row) > 1 else None) for row in rows], dosage
+
+
+def _table(rows):
+    # Engine tables are [header, *rows]; the final-result row keeps its text in the first column
+    return pd.DataFrame(rows[1:], columns=rows[0]).astype(str)
+
+
+# --- Page ---
+
+def load_formula(rows, dosage=None):
+    # New grid contents: a fresh editor key, so the widget drops the previous edits
+    state = st.session_state
+    state["grid_base"] = pd.DataFrame([list(row) for row in rows], columns=GRID_COLUMNS)
+    state["grid_version"] = state.get("grid_version", 0) + 1
+    if dosage is not None and to_number(dosage) is not None and to_number(dosage) > 0:
+        # Applied before the dosage widget is created on the next run
+        state["next_dosage"] = float(to_number(dosage))
+    state.pop("engine", None)
+
+
+def main():
+    st.set_page_config(page_title="miniPinscher Workbench", layout="wide")
+    state = st.session_state
+    if "grid_base" not in state:
+        load_formula(TEST_FORMULA, DEFAULT_DOSAGE)
+    if "next_dosage" in state:
+        state["dosage"] = min(state.pop("next_dosage"), MAX_DOSAGE)
+
+    stamp = db_stamp()
+    db = shared_reference_db(RELEASE_DIR, stamp)
+
+    with st.sidebar:
+        st.header("miniPinscher")
+        dosage = st.number_input("Finished Dosage (%)", min_value=0.01, max_value=MAX_DOSAGE, step=0.5,
+                                 key="dosage")
+        categories = db.limit_categories()
+        category = st.selectbox("IFRA Category", categories, index=categories.index("4") if "4" in categories else 0)
+        product_type = st.radio("EU Product Type", PRODUCT_TYPES, horizontal=True)
+        upload = st.file_uploader("Open formula (CSV / XLSX)", type=["csv", "xlsx"])
+        if upload is not None and state.get("upload_id") != upload.file_id:
+            state["upload_id"] = upload.file_id
+            load_formula(*read_upload(upload))
+            st.rerun()
+        if st.button("Reset to test formula"):
+            load_formula(TEST_FORMULA, DEFAULT_DOSAGE)
+            st.rerun()
+
+    st.subheader("Formula")
+    frame = st.data_editor(
+        state["grid_base"], key=f"grid_{state['grid_version']}", num_rows="dynamic", use_container_width=True,
+        column_config={"Amount": st.column_config.NumberColumn("Amount", min_value=0.0, format="%.4f")}
+    )
+
+    started = time.perf_counter()
+    rows = grid_rows(frame)
+    engine = state.get("engine")
+    if engine is None or engine["stamp"] != stamp or engine["category"] != category:
+        # First render, a reloaded DB or another category (limits are fixed per session): build once
+        engine = state["engine"] = new_engine(db, rows, dosage, category, stamp)
+        touched = len(rows)
+    else:
+        touched = sync_lines(engine, rows)
+        engine["session"].set_dosage(dosage)
+    view = recalculate(engine, product_type)
+    elapsed = (time.perf_counter() - started) * 1000.0
+
+    report = view["report"]
+    solved = view["dosage"]
+    binding = solved["binding"]
+    cols = st.columns(4)
+    cols[0].metric("IFRA", "ALL PASS" if report["passed"] else f"{report['fail_count']} FAILS")
+    cols[1].metric("Max Dosage (%)", f"{solved['max_dosage']:.4f}")
+    cols[2].metric("Headroom (%)", f"{solved['headroom']:+.4f}", f"x{solved['headroom_factor']:.2f} current dosage")
+    cols[3].metric("Binding Limit", binding["ingredient"] if binding else "None")
+    st.caption(f"⏱️ {touched} line(s) updated, {len(rows)} lines recalculated in {elapsed:.1f} ms")
+
+    ifra_tab, eu_tab, dosage_tab, sources_tab = st.tabs(
+        ["IFRA Compliance", "EU Allergen Labeling", "Max Dosage", "Source Breakdown"])
+    with ifra_tab:
+        st.dataframe(_table(view["ifra"]), hide_index=True, use_container_width=True)
+    with eu_tab:
+        st.dataframe(_table(view["eu"]), hide_index=True, use_container_width=True)
+    with dosage_tab:
+        constraints = pd.DataFrame(solved["constraints"], columns=["ingredient", "cas", "limit", "conc_per_dosage",
+                                                                   "max_dosage"])
+        constraints.columns = ["Constraint", "CAS", "IFRA Limit (%)", "Level per 1% Dosage (%)", "Max Dosage (%)"]
+        st.dataframe(constraints, hide_index=True, use_container_width=True)
+    with sources_tab:
+        grouped = view["grouped"]
+        if not grouped:
+            st.info("No regulated ingredients in this formula.")
+        else:
+            group_name = st.selectbox("Regulated Ingredient", list(grouped))
+            breakdown = source_breakdown(grouped[group_name], report["total_amount"], report["dosage"])
+            st.dataframe(pd.DataFrame(breakdown), hide_index=True, use_container_width=True)
+            if breakdown:
+                st.bar_chart(pd.DataFrame(breakdown).set_index("Source")["Your Level (%)"])
+
+
+if __name__ == "__main__":
+    main()